@@ -0,0 +1,57 @@
+"""
+Compare the csv based depth file parser with the vectorised NumPy parser on a
+synthetic 'samtools depth -a' file.
+
+Usage:
+    python benchmarks/bench_depth_parser.py [--lines 100000000] [--keep]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+# The benchmarks measure the package in this repository, even if another
+# version is installed
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generators import write_depth_file
+from submg.modules import coverageEngine
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lines", type=int, default=100_000_000,
+                        help="Number of lines in the synthetic depth file. "
+                        "[default 100000000]")
+    parser.add_argument("--keep", action="store_true",
+                        help="Do not delete the synthetic depth file.")
+    args = parser.parse_args()
+
+    depth_path = os.path.join(tempfile.mkdtemp(), "synthetic.depth")
+    print(f">Writing {args.lines} lines to {depth_path}")
+    write_depth_file(depth_path, args.lines)
+    size_mb = os.path.getsize(depth_path) / 1024 / 1024
+
+    start = time.perf_counter()
+    with open(depth_path, 'r') as f:
+        reference = coverageEngine.contigs_coverage(f)
+    csv_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = coverageEngine.contigs_coverage_chunked(depth_path)
+    numpy_seconds = time.perf_counter() - start
+
+    if result != reference:
+        print("ERROR: The parsers returned different results.")
+    print(f"{'parser':<10}{'seconds':>12}{'MB/s':>12}")
+    print(f"{'csv':<10}{csv_seconds:>12.2f}{size_mb / csv_seconds:>12.1f}")
+    print(f"{'numpy':<10}{numpy_seconds:>12.2f}{size_mb / numpy_seconds:>12.1f}")
+    print(f"Speedup: {csv_seconds / numpy_seconds:.1f}x")
+
+    if not args.keep:
+        os.remove(depth_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Check that the command-line interface starts quickly. Runs
+'python -X importtime' on the module behind 'submg-cli --help' several times
+and compares the median cumulative import time with a budget. Heavy
+libraries must not be imported on this path at all. Exits with status 1 if
+the budget is exceeded or a heavy library is imported, so it can be used as
+a regression check.
+
+Usage:
+    python benchmarks/bench_import_time.py [--runs 10] [--budget-ms 150]
+"""
+import os
+import argparse
+import statistics
+import subprocess
+import sys
+
+
+# The package in this repository is measured, even if another version is
+# installed
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Libraries that only the commands that need them may import
+HEAVY_MODULES = ['pysam', 'numpy', 'requests', 'urllib3', 'yaspin', 'tqdm',
+                 'customtkinter', 'xml.etree.ElementTree']
+
+
+def import_times(command: list) -> dict:
+    """
+    Run a command with 'python -X importtime' and parse its report.
+
+    Args:
+        command (list): The arguments after 'python -X importtime'.
+
+    Returns:
+        dict: Name of each imported module as key, its cumulative import
+            time in microseconds as value.
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime'] + command,
+                            cwd=REPOSITORY,
+                            stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE,
+                            text=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=10,
+                        help="Number of interpreter starts. [default 10]")
+    parser.add_argument("--budget-ms", type=float, default=150,
+                        help="Allowed median import time of the CLI in "
+                        "milliseconds. [default 150]")
+    args = parser.parse_args()
+
+    command = ['-m', 'submg.cli_main', '--help']
+    totals = []
+    heavy = set()
+    for _ in range(args.runs):
+        times = import_times(command)
+        # The package is imported before cli_main runs as __main__
+        totals.append(times.get('submg', 0) / 1000)
+        heavy.update(module for module in HEAVY_MODULES if module in times)
+
+    median = statistics.median(totals)
+    print(f">Import time of 'submg-cli --help' over {args.runs} runs:")
+    print(f"{'median ms':>12}{'min ms':>12}{'max ms':>12}{'budget ms':>12}")
+    print(f"{median:>12.1f}{min(totals):>12.1f}{max(totals):>12.1f}{args.budget_ms:>12.1f}")
+
+    failed = False
+    if heavy:
+        print(f"ERROR: These libraries are imported on the --help path: {', '.join(sorted(heavy))}")
+        failed = True
+    if median > args.budget_ms:
+        print(f"ERROR: The median import time exceeds the budget of {args.budget_ms:.0f} ms.")
+        failed = True
+    if failed:
+        sys.exit(1)
+    print(">Within budget.")
+
+
+if __name__ == "__main__":
+    main()
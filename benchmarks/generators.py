@@ -0,0 +1,257 @@
+"""
+Deterministic generators of synthetic input data for the benchmarks. The
+same arguments and seed always produce the same files. Contigs are named
+k141_<number> everywhere, so depth files, contig tables and bin FASTA files
+generated with the same numbers fit together.
+"""
+import os
+import random
+
+import yaml
+
+from submg.modules.statConf import staticConfig
+
+
+BASES = 'ACGT'
+
+
+def contig_name(i: int) -> str:
+    return f"k141_{i}"
+
+
+def write_depth_file(path: str,
+                     n_lines: int,
+                     mean_contig_length: int = 20000,
+                     seed: int = 42) -> int:
+    """
+    Write a synthetic 'samtools depth -a' file with n_lines lines.
+
+    Args:
+        path (str): Where to write the file.
+        n_lines (int): Total number of lines.
+        mean_contig_length (int): Mean number of positions per contig.
+        seed (int): Seed for the random number generator.
+
+    Returns:
+        int: The number of contigs in the file.
+    """
+    rng = random.Random(seed)
+    written = 0
+    contig = 0
+    with open(path, 'w') as f:
+        while written < n_lines:
+            length = min(n_lines - written,
+                         rng.randint(mean_contig_length // 2, mean_contig_length * 3 // 2))
+            depth = rng.randint(0, 200)
+            name = contig_name(contig)
+            lines = []
+            for position in range(1, length + 1):
+                lines.append(f"{name}\t{position}\t{depth + (position % 7)}\n")
+            f.writelines(lines)
+            written += length
+            contig += 1
+    return contig
+
+
+def contig_table(n_contigs: int,
+                 seed: int = 42) -> dict:
+    """
+    Build a contig coverage table as returned by coverageEngine.
+
+    Args:
+        n_contigs (int): Number of contigs.
+        seed (int): Seed for the random number generator.
+
+    Returns:
+        dict: Contig name as key, [summed depth, length] as value.
+    """
+    rng = random.Random(seed)
+    table = {}
+    for i in range(n_contigs):
+        length = rng.randint(1000, 50000)
+        table[contig_name(i)] = [length * rng.randint(1, 200), length]
+    return table
+
+
+def __sequence(rng: random.Random,
+               length: int) -> str:
+    return ''.join(rng.choices(BASES, k=length))
+
+
+def write_fasta(path: str,
+                contigs: list,
+                contig_length: int = 5000,
+                seed: int = 42):
+    """
+    Write a FASTA file with random sequences, 80 bases per line.
+
+    Args:
+        path (str): Where to write the file.
+        contigs (list): The names of the contigs.
+        contig_length (int): Number of bases per contig.
+        seed (int): Seed for the random number generator.
+    """
+    rng = random.Random(seed)
+    with open(path, 'w') as f:
+        for name in contigs:
+            sequence = __sequence(rng, contig_length)
+            f.write(f">{name}\n")
+            for start in range(0, len(sequence), 80):
+                f.write(sequence[start:start + 80] + "\n")
+
+
+def write_fastq(path: str,
+                n_reads: int,
+                read_length: int = 150,
+                seed: int = 42):
+    """
+    Write a FASTQ file with random reads.
+
+    Args:
+        path (str): Where to write the file.
+        n_reads (int): Number of reads.
+        read_length (int): Number of bases per read.
+        seed (int): Seed for the random number generator.
+    """
+    rng = random.Random(seed)
+    # A pool of sequences keeps generating large files fast, the
+    # compression ratio still resembles that of real reads
+    pool = [__sequence(rng, read_length) for _ in range(1024)]
+    qualities = [''.join(rng.choices('FFFF:,', k=read_length)) for _ in range(64)]
+    with open(path, 'w') as f:
+        for i in range(n_reads):
+            f.write(f"@read_{i}/1\n{pool[rng.randrange(1024)]}\n+\n{qualities[rng.randrange(64)]}\n")
+
+
+def write_bins_directory(directory: str,
+                         n_bins: int,
+                         contigs_per_bin: int = 50,
+                         contig_length: int = 2000,
+                         seed: int = 42) -> dict:
+    """
+    Write a FASTA file per bin. Bin i holds the contigs
+    i * contigs_per_bin ... (i + 1) * contigs_per_bin - 1.
+
+    Args:
+        directory (str): The bins directory, created if needed.
+        n_bins (int): Number of bins.
+        contigs_per_bin (int): Number of contigs in each bin.
+        contig_length (int): Number of bases per contig.
+        seed (int): Seed for the random number generator.
+
+    Returns:
+        dict: Name of each bin as key, path of its FASTA file as value.
+    """
+    os.makedirs(directory, exist_ok=True)
+    bins = {}
+    for i in range(n_bins):
+        name = f"bin_{i}"
+        path = os.path.join(directory, f"{name}.fa")
+        contigs = [contig_name(i * contigs_per_bin + j) for j in range(contigs_per_bin)]
+        write_fasta(path, contigs, contig_length, seed=seed + i)
+        bins[name] = path
+    return bins
+
+
+def write_checkm_table(path: str,
+                       bins: list,
+                       seed: int = 42):
+    """
+    Write a quality table in the format of CheckM.
+
+    Args:
+        path (str): Where to write the table.
+        bins (list): The names of the bins.
+        seed (int): Seed for the random number generator.
+    """
+    rng = random.Random(seed)
+    with open(path, 'w') as f:
+        f.write("Bin Id\tMarker lineage\t# genomes\tCompleteness\tContamination\tStrain heterogeneity\n")
+        for name in bins:
+            f.write(f"{name}\tk__Bacteria (UID203)\t5449\t{rng.uniform(50, 100):.2f}\t"
+                    f"{rng.uniform(0, 10):.2f}\t{rng.uniform(0, 50):.2f}\n")
+
+
+def write_gtdb_table(path: str,
+                     bins: list,
+                     seed: int = 42):
+    """
+    Write the output of GTDB-Tk's 'gtdb_to_ncbi_majority_vote.py' with
+    classifications at varying depth.
+
+    Args:
+        path (str): Where to write the table.
+        bins (list): The names of the bins.
+        seed (int): Seed for the random number generator.
+    """
+    rng = random.Random(seed)
+    prefixes = ['d__', 'p__', 'c__', 'o__', 'f__', 'g__', 's__']
+    with open(path, 'w') as f:
+        f.write('\t'.join(staticConfig.gtdb_majority_vote_columns.split(';')) + "\n")
+        for name in bins:
+            depth = rng.randint(1, len(prefixes))
+            ranks = []
+            for level, prefix in enumerate(prefixes):
+                if level == 0:
+                    ranks.append(f"{prefix}Bacteria")
+                elif level < depth:
+                    ranks.append(f"{prefix}Taxon{level}x{rng.randint(0, 20)}")
+                else:
+                    ranks.append(prefix)
+            classification = ';'.join(ranks)
+            f.write(f"{name}\t{classification}\t{classification}\n")
+
+
+def write_config(path: str,
+                 n_samples: int,
+                 n_read_sets: int,
+                 fastq_file: str) -> dict:
+    """
+    Write a submission config with many samples and paired-end read sets.
+
+    Args:
+        path (str): Where to write the config.
+        n_samples (int): Number of NEW_SAMPLES.
+        n_read_sets (int): Number of PAIRED_END_READS.
+        fastq_file (str): The FASTQ file used by every read set.
+
+    Returns:
+        dict: The config.
+    """
+    samples = []
+    for i in range(n_samples):
+        samples.append({
+            'TITLE': f"sample_{i}",
+            'collection date': '2024-01-01',
+            'geographic location (country and/or sea)': 'Germany',
+            'ADDITIONAL_SAMPLESHEET_FIELDS': {
+                'broad-scale environmental context': 'ENVO:01000252',
+                'local environmental context': 'ENVO:01000252',
+                'environmental medium': 'ENVO:00002007',
+            },
+        })
+    reads = []
+    for i in range(n_read_sets):
+        reads.append({
+            'NAME': f"reads_{i}",
+            'SEQUENCING_INSTRUMENT': 'Illumina NovaSeq 6000',
+            'LIBRARY_SOURCE': 'METAGENOMIC',
+            'LIBRARY_SELECTION': 'RANDOM',
+            'LIBRARY_STRATEGY': 'WGS',
+            'INSERT_SIZE': '300',
+            'FASTQ1_FILE': fastq_file,
+            'FASTQ2_FILE': fastq_file,
+            'RELATED_SAMPLE_TITLE': f"sample_{i % max(1, n_samples)}",
+        })
+    config = {
+        'STUDY': 'PRJEB00000',
+        'PROJECT_NAME': 'benchmark',
+        'METAGENOME_SCIENTIFIC_NAME': 'biogas fermenter metagenome',
+        'METAGENOME_TAXID': '718289',
+        'SEQUENCING_PLATFORMS': ['ILLUMINA'],
+        'NEW_SAMPLES': samples,
+        'PAIRED_END_READS': reads,
+    }
+    with open(path, 'w') as f:
+        yaml.safe_dump(config, f, sort_keys=False)
+    return config
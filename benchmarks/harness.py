@@ -0,0 +1,181 @@
+"""
+Timing and memory measurement for the benchmark suite, and the JSON files
+the results are stored in.
+"""
+import os
+import sys
+import json
+import time
+import platform
+import statistics
+import subprocess
+import tracemalloc
+
+from submg.modules.statConf import staticConfig
+
+
+def measure(name: str,
+            function,
+            setup=None,
+            n_bytes: int = None,
+            n_items: int = None,
+            repeat: int = 5) -> dict:
+    """
+    Time a function and measure its peak memory. The function is called
+    repeat times for timing and once more under tracemalloc, which slows it
+    down, for the memory peak. Memory allocated by worker processes is not
+    included.
+
+    Args:
+        name (str): Name of the case.
+        function: Called with the return value of setup.
+        setup (optional): Called before each call of function, outside of the
+            timed region. If None, function is called without arguments.
+        n_bytes (int, optional): Bytes processed per call, for throughput.
+        n_items (int, optional): Items (lines, contigs, bins...) processed per
+            call, for throughput.
+        repeat (int, optional): Number of timed calls. Defaults to 5.
+
+    Returns:
+        dict: The result of the case.
+    """
+    seconds = []
+    for _ in range(repeat):
+        if setup is None:
+            start = time.perf_counter()
+            function()
+        else:
+            argument = setup()
+            start = time.perf_counter()
+            function(argument)
+        seconds.append(time.perf_counter() - start)
+
+    argument = setup() if setup is not None else None
+    tracemalloc.start()
+    try:
+        if setup is None:
+            function()
+        else:
+            function(argument)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    best = min(seconds)
+    return {
+        'name': name,
+        'repeat': repeat,
+        'min_seconds': best,
+        'median_seconds': statistics.median(seconds),
+        'peak_memory_mb': peak / 1024 / 1024,
+        'bytes': n_bytes,
+        'items': n_items,
+        'mb_per_second': n_bytes / 1024 / 1024 / best if n_bytes and best > 0 else None,
+        'items_per_second': n_items / best if n_items and best > 0 else None,
+    }
+
+
+def __git_commit() -> str:
+    """
+    Returns the commit of the working tree, or None outside of a git
+    repository.
+    """
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                                cwd=os.path.dirname(os.path.abspath(__file__)),
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL,
+                                text=True)
+    except OSError:
+        return None
+    return result.stdout.strip() or None
+
+
+def environment() -> dict:
+    """
+    Returns what is needed to tell whether two runs are comparable.
+    """
+    return {
+        'submg_version': staticConfig.submg_version,
+        'git_commit': __git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'date': time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+
+def write_results(path: str,
+                  results: list,
+                  parameters: dict):
+    """
+    Write the results of a run to a JSON file.
+
+    Args:
+        path (str): The JSON file.
+        results (list): The results returned by measure.
+        parameters (dict): The parameters of the run, e.g. the scale.
+    """
+    with open(path, 'w') as f:
+        json.dump({'environment': environment(),
+                   'parameters': parameters,
+                   'results': results}, f, indent=2)
+
+
+def read_results(path: str) -> dict:
+    """
+    Read a JSON file written by write_results.
+
+    Args:
+        path (str): The JSON file.
+
+    Returns:
+        dict: The content of the file.
+    """
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"\nERROR: Could not read benchmark results from {path} ({e}).")
+        sys.exit(1)
+
+
+def results_table(results: list) -> str:
+    """
+    Returns a table with one row per case.
+    """
+    lines = [f"{'case':<32}{'min s':>10}{'median s':>10}{'MB/s':>10}{'items/s':>12}{'peak MB':>10}"]
+    for r in results:
+        mb_per_second = f"{r['mb_per_second']:.1f}" if r['mb_per_second'] else '-'
+        items_per_second = f"{r['items_per_second']:.0f}" if r['items_per_second'] else '-'
+        lines.append(f"{r['name'][:32]:<32}{r['min_seconds']:>10.3f}{r['median_seconds']:>10.3f}"
+                     f"{mb_per_second:>10}{items_per_second:>12}{r['peak_memory_mb']:>10.1f}")
+    return "\n".join(lines)
+
+
+def comparison_table(baseline: dict,
+                     results: list) -> str:
+    """
+    Compare the results of a run with those of an earlier run. A ratio below
+    1 means the case got faster or uses less memory.
+
+    Args:
+        baseline (dict): The earlier run as returned by read_results.
+        results (list): The results of this run.
+
+    Returns:
+        str: A table with one row per case that both runs have.
+    """
+    earlier = {r['name']: r for r in baseline['results']}
+    lines = [f"{'case':<32}{'baseline s':>12}{'now s':>10}{'time x':>8}{'baseline MB':>13}{'now MB':>10}{'memory x':>10}"]
+    for r in results:
+        if r['name'] not in earlier:
+            continue
+        b = earlier[r['name']]
+        time_ratio = r['min_seconds'] / b['min_seconds'] if b['min_seconds'] > 0 else float('nan')
+        memory_ratio = r['peak_memory_mb'] / b['peak_memory_mb'] if b['peak_memory_mb'] > 0 else float('nan')
+        lines.append(f"{r['name'][:32]:<32}{b['min_seconds']:>12.3f}{r['min_seconds']:>10.3f}{time_ratio:>8.2f}"
+                     f"{b['peak_memory_mb']:>13.1f}{r['peak_memory_mb']:>10.1f}{memory_ratio:>10.2f}")
+    if baseline.get('parameters') is not None:
+        lines.append(f"\nBaseline parameters: {baseline['parameters']}")
+    return "\n".join(lines)
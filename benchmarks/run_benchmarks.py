@@ -0,0 +1,249 @@
+"""
+Micro-benchmarks of the parts of a submission that scale with the input
+data: parsing depth files, calculating assembly and bin coverage, staging
+reads, reading the config and building samplesheets. The input data is
+generated deterministically, so runs with the same --scale process the same
+data. Throughput and peak memory of each case are stored in a JSON file that
+later runs can be compared with.
+
+Usage:
+    python benchmarks/run_benchmarks.py [--scale 1.0] [--only depth,staging]
+        [--repeat 5] [--threads 4] [--output results.json]
+        [--compare baseline.json] [--keep]
+"""
+import argparse
+import os
+import sys
+import gzip
+import shutil
+import tempfile
+
+# The benchmarks measure the package in this repository, even if another
+# version is installed
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import generators
+import harness
+from submg.modules import loggingC, coverageEngine, stagingEngine, utility, \
+    sampleSubmission, binSubmission, taxQuery
+
+
+# Size of the generated data at --scale 1
+DEPTH_LINES = 2_000_000
+TABLE_CONTIGS = 200_000
+BINS = 200
+CONTIGS_PER_BIN = 50
+FASTQ_READS = 200_000
+SAMPLES = 2_000
+READ_SETS = 2_000
+
+
+def __scaled(n: int,
+             scale: float) -> int:
+    return max(1, int(n * scale))
+
+
+def __fresh_directory(parent: str,
+                      name: str) -> str:
+    """
+    Returns an empty directory, removing what an earlier call left in it.
+    """
+    path = os.path.join(parent, name)
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+    return path
+
+
+def depth_cases(workdir: str,
+                scale: float,
+                threads: int) -> list:
+    depth_path = os.path.join(workdir, 'synthetic.depth')
+    n_lines = __scaled(DEPTH_LINES, scale)
+    generators.write_depth_file(depth_path, n_lines)
+    size = os.path.getsize(depth_path)
+
+    def csv_parser():
+        with open(depth_path, 'r') as f:
+            coverageEngine.contigs_coverage(f)
+
+    return [
+        ('contigs_coverage', csv_parser, None, size, n_lines),
+        ('contigs_coverage_chunked', lambda: coverageEngine.contigs_coverage_chunked(depth_path),
+         None, size, n_lines),
+        ('contig_table_from_depth_files', lambda: coverageEngine.contig_table_from_depth_files([depth_path], threads),
+         None, size, n_lines),
+    ]
+
+
+def coverage_cases(workdir: str,
+                   scale: float,
+                   threads: int) -> list:
+    n_contigs = __scaled(TABLE_CONTIGS, scale)
+    contig_table = generators.contig_table(n_contigs)
+    n_bins = __scaled(BINS, scale)
+    bins = generators.write_bins_directory(os.path.join(workdir, 'coverage_bins'),
+                                           n_bins,
+                                           CONTIGS_PER_BIN)
+    return [
+        ('coverage_from_table', lambda: coverageEngine.coverage_from_table(contig_table, silent=True),
+         None, None, n_contigs),
+        ('bin_coverage_from_table', lambda: binSubmission.bin_coverage_from_table(contig_table, bins),
+         None, sum(os.path.getsize(path) for path in bins.values()), n_bins),
+    ]
+
+
+def staging_cases(workdir: str,
+                  scale: float,
+                  threads: int) -> list:
+    fastq = os.path.join(workdir, 'reads.fastq')
+    n_reads = __scaled(FASTQ_READS, scale)
+    generators.write_fastq(fastq, n_reads)
+    fastq_gz = f"{fastq}.gz"
+    with open(fastq, 'rb') as source, gzip.open(fastq_gz, 'wb', compresslevel=1) as target:
+        shutil.copyfileobj(source, target)
+    stagingEngine.set_threads(threads)
+
+    def jobs(source, name):
+        return lambda: [(source, os.path.join(__fresh_directory(workdir, 'staging'), name))]
+
+    return [
+        ('stage_files (gzip)', stagingEngine.stage_files, jobs(fastq, 'reads.fastq.gz'),
+         os.path.getsize(fastq), n_reads),
+        ('stage_files (.gz verify)', stagingEngine.stage_files, jobs(fastq_gz, 'reads.fastq.gz'),
+         os.path.getsize(fastq_gz), n_reads),
+    ]
+
+
+def config_cases(workdir: str,
+                 scale: float,
+                 threads: int) -> list:
+    fastq = os.path.join(workdir, 'config_reads.fastq')
+    generators.write_fastq(fastq, 1)
+    config_path = os.path.join(workdir, 'config.yaml')
+    n_samples = __scaled(SAMPLES, scale)
+    n_read_sets = __scaled(READ_SETS, scale)
+    generators.write_config(config_path, n_samples, n_read_sets, os.path.basename(fastq))
+    return [
+        ('read_yaml', lambda: utility.read_yaml(config_path),
+         None, os.path.getsize(config_path), n_samples + n_read_sets),
+    ]
+
+
+def samplesheet_cases(workdir: str,
+                      scale: float,
+                      threads: int) -> list:
+    config_path = os.path.join(workdir, 'samples_config.yaml')
+    n_samples = __scaled(SAMPLES, scale)
+    config = generators.write_config(config_path, n_samples, 0, 'reads.fastq')
+    prep_samplesheet = getattr(sampleSubmission, '__prep_samplesheet')
+
+    n_bins = __scaled(BINS, scale)
+    bins_directory = os.path.join(workdir, 'samplesheet_bins')
+    bins = list(generators.write_bins_directory(bins_directory, n_bins, contigs_per_bin=1, contig_length=100))
+    quality_file = os.path.join(workdir, 'checkm.tsv')
+    generators.write_checkm_table(quality_file, bins)
+    gtdb_file = os.path.join(workdir, 'gtdb.tsv')
+    generators.write_gtdb_table(gtdb_file, bins)
+    bins_config = dict(config)
+    bins_config['ASSEMBLY'] = {
+        'ASSEMBLY_NAME': 'benchmark assembly',
+        'ASSEMBLY_SOFTWARE': 'MEGAHIT',
+        'collection date': '2024-01-01',
+        'geographic location (country and/or sea)': 'Germany',
+    }
+    bins_config['BINS'] = {
+        'BINS_DIRECTORY': bins_directory,
+        'QUALITY_FILE': quality_file,
+        'BINNING_SOFTWARE': 'metabat2',
+        'COMPLETENESS_SOFTWARE': 'CheckM',
+    }
+    taxonomy = {b: {'tax_id': '2', 'scientific_name': 'uncultured bacterium'} for b in bins}
+    accessions = [{'accession': 'ERS0000000'}]
+    prep_bins_samplesheet = getattr(binSubmission, '__prep_bins_samplesheet')
+    parse_classification_tsvs = getattr(taxQuery, '__parse_classification_tsvs')
+
+    def output_directory():
+        return __fresh_directory(workdir, 'samplesheet')
+
+    return [
+        ('samplesheet (samples)', lambda directory: prep_samplesheet(config, directory),
+         output_directory, None, n_samples),
+        ('samplesheet (bins)', lambda directory: prep_bins_samplesheet(bins, bins_config, accessions,
+                                                                       directory, taxonomy),
+         output_directory, None, n_bins),
+        ('get_bin_quality (CheckM)', lambda: binSubmission.get_bin_quality(bins_config, silent=True),
+         None, os.path.getsize(quality_file), n_bins),
+        ('classification tables (GTDB)', lambda: parse_classification_tsvs([gtdb_file]),
+         None, os.path.getsize(gtdb_file), n_bins),
+    ]
+
+
+# Groups of cases that can be selected with --only. Each function writes the
+# data it needs and returns tuples of (name, function, setup, bytes, items).
+GROUPS = {
+    'depth': depth_cases,
+    'coverage': coverage_cases,
+    'staging': staging_cases,
+    'config': config_cases,
+    'samplesheets': samplesheet_cases,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="Factor for the size of the generated data. [default 1.0]")
+    parser.add_argument("--only", default=None,
+                        help=f"Comma separated groups to run, out of {', '.join(GROUPS)}. "
+                        "[default all]")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="Number of timed runs of each case. [default 5]")
+    parser.add_argument("--threads", type=int, default=4,
+                        help="Threads for the cases that use them. [default 4]")
+    parser.add_argument("--output", default="benchmark_results.json",
+                        help="JSON file for the results. [default benchmark_results.json]")
+    parser.add_argument("--compare", default=None,
+                        help="JSON file of an earlier run to compare with.")
+    parser.add_argument("--keep", action="store_true",
+                        help="Do not delete the generated data.")
+    args = parser.parse_args()
+
+    groups = list(GROUPS) if args.only is None else [g.strip() for g in args.only.split(',')]
+    unknown = [g for g in groups if g not in GROUPS]
+    if unknown:
+        print(f"\nERROR: Unknown benchmark groups: {', '.join(unknown)}")
+        sys.exit(1)
+    baseline = harness.read_results(args.compare) if args.compare else None
+
+    workdir = tempfile.mkdtemp(prefix='submg_benchmarks_')
+    # Only errors of the measured functions are printed
+    loggingC.logfile_path = os.path.join(workdir, 'benchmark.log')
+    loggingC.verbosity_level = 0
+
+    results = []
+    try:
+        for group in groups:
+            print(f">Generating data for '{group}' in {workdir}")
+            for name, function, setup, n_bytes, n_items in GROUPS[group](workdir, args.scale, args.threads):
+                print(f"\t...{name}")
+                results.append(harness.measure(name, function, setup, n_bytes, n_items, args.repeat))
+    finally:
+        loggingC.shutdown()
+        if args.keep:
+            print(f">The generated data was kept in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print()
+    print(harness.results_table(results))
+    parameters = {'scale': args.scale, 'repeat': args.repeat, 'threads': args.threads, 'groups': groups}
+    harness.write_results(args.output, results, parameters)
+    print(f"\n>Results written to {args.output}")
+    if baseline is not None:
+        print()
+        print(harness.comparison_table(baseline, results))
+
+
+if __name__ == "__main__":
+    main()
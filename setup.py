@@ -32,6 +32,7 @@ setup(
     packages=find_packages(),
     install_requires=[
         'pysam>=0.19.1; sys_platform != "win32"',
+        'numpy>=1.21',
         'PyYAML>=5.4.1',
         'requests>=2.31.0',
         'tqdm>=4.64.1',
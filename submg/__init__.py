@@ -5,6 +5,8 @@ from submg.core import (
     download_webin,
     makecfg,
     submit,
+    taxonomy_cache,
+    build_taxdb,
 )
 
 # Version information
@@ -3,6 +3,8 @@ from submg.core import (
     download_webin,
     makecfg,
     submit,
+    taxonomy_cache,
+    build_taxdb,
 )
 
 def main():
@@ -14,6 +16,10 @@ def main():
         makecfg(args)
     elif args.mode == 'submit':
         submit(args)
+    elif args.mode == 'taxonomy-cache':
+        taxonomy_cache(args)
+    elif args.mode == 'build-taxdb':
+        build_taxdb(args)
     else:
         parser.print_help()
 
@@ -5,20 +5,11 @@ import traceback
 import sys
 
 from submg.modules import loggingC
-from submg.modules import preflight
-from submg.modules import utility
-from submg.modules import webinDownload
-from submg.modules import configGen 
-from submg.modules import taxQuery
-from submg.modules import enaSearching
-
 from submg.modules.statConf import staticConfig
-from submg.modules.utility import prepdir
-from submg.modules.sampleSubmission import submit_samples
-from submg.modules.readSubmission import submit_reads
-from submg.modules.assemblySubmission import submit_assembly
-from submg.modules.binSubmission import submit_bins, get_bin_quality
-from submg.modules.magSubmission import submit_mags
+
+# The other modules pull in pysam, numpy, requests and friends. Each command
+# imports the modules it needs, so --help, --version and argument errors do
+# not pay for them.
 
 
 def init_argparse():
@@ -51,19 +42,28 @@ def init_argparse():
                                           'production server')
     parser_submit.add_argument("-x",
                                "--config",
-                               required=True,
                                help="Path to the YAML file containing "
-                               "metadata and filepaths. Mandatory")
+                               "metadata and filepaths. Mandatory unless "
+                               "--resume is used.")
     parser_submit.add_argument("-g",
                                "--staging-dir",
-                               required=True,
                                help="Directory where files will be staged for "
                                "upload. Must be empty. May use up a lot of "
-                               "disk space. Mandatory.")
+                               "disk space. Mandatory unless --resume is "
+                               "used.")
     parser_submit.add_argument("-l", "--logging-dir",
-                               required=True,
                                help="Directory where log files will be "
-                               "stored. Must be empty. Mandatory.")
+                               "stored. Must be empty. Mandatory unless "
+                               "--resume is used.")
+    parser_submit.add_argument("--resume",
+                               metavar="LOGGING_SUBDIR",
+                               help="Continue a submission that was "
+                               "interrupted. Pass the timestamped "
+                               "subdirectory of the logging directory that "
+                               "the run created. Steps that were completed "
+                               "according to its journal are skipped and "
+                               "files it staged are reused. All other "
+                               "options are taken from the interrupted run.")
     parser_submit.add_argument("-y", "--verbosity",
                                type=int,
                                choices=[0, 1, 2],
@@ -88,11 +88,34 @@ def init_argparse():
                                type=int,
                                default=4,
                                help="Number of threads used to process .bam "
-                               "files. [default 4]")
+                               "files and to compress files for upload. "
+                               "[default 4]")
     parser_submit.add_argument("--keep-depth-files",
                                action="store_true",
-                               help="Do not delete depth files after running. "
-                               "[default false]")
+                               help="Write 'samtools depth' files for each "
+                               ".bam file to the staging directory and derive "
+                               "coverage from them. By default, coverage is "
+                               "calculated directly from the .bam files "
+                               "without writing depth files. [default false]")
+    parser_submit.add_argument("--webin-workers",
+                               type=int,
+                               default=1,
+                               help="Number of Webin-CLI submissions of read "
+                               "sets, bins or MAGs that run at the same time. "
+                               "Each one starts its own Java process. Read "
+                               "sets are uploaded while the next one is "
+                               "staged. [default 1]")
+    parser_submit.add_argument("--no-coverage-cache",
+                               action="store_true",
+                               help="Do not use the persistent cache of "
+                               "coverage values calculated from .bam files in "
+                               "earlier runs. [default false]")
+    parser_submit.add_argument("--offline-taxonomy",
+                               action="store_true",
+                               help="Resolve the taxonomy of bins only with "
+                               "the local taxonomy index created by "
+                               "build-taxdb and never query the ENA taxonomy "
+                               "API. [default false]")
     parser_submit.add_argument("-r",
                                "--submit-reads",
                                action="store_true",
@@ -138,6 +161,33 @@ def init_argparse():
                                "development-service, defaults to false "
                                "otherwise.")
 
+    parser_taxcache = subparsers.add_parser('taxonomy-cache',
+                                            help='Inspect, warm or clear the '
+                                            'cache of ENA taxonomy answers '
+                                            'that is kept between runs')
+    parser_taxcache.add_argument("action",
+                                 choices=['info', 'warm', 'clear'],
+                                 help="'info' shows the content of the cache, "
+                                 "'warm' fetches the ENA suggestions for all "
+                                 "classifications in the files given with "
+                                 "--tsv, 'clear' removes all entries.")
+    parser_taxcache.add_argument("--tsv",
+                                 nargs='+',
+                                 default=[],
+                                 help="NCBI taxonomy files (the format of "
+                                 "NCBI_TAXONOMY_FILES in the config) used to "
+                                 "warm the cache.")
+
+    parser_taxdb = subparsers.add_parser('build-taxdb',
+                                         help='Build a local index of the '
+                                         'NCBI taxonomy, so bin taxonomy can '
+                                         'be resolved without the ENA '
+                                         'taxonomy API')
+    parser_taxdb.add_argument("taxdump",
+                              help="The NCBI taxdump, either the directory "
+                              "with names.dmp and nodes.dmp or the "
+                              "taxdump.tar.gz archive.")
+
     parser_makecfg = subparsers.add_parser('makecfg',
                                            help='Create a .yml file '
                                            'containing the fields you need to '
@@ -215,6 +265,8 @@ def download_webin():
     """
     Download the webin-cli .jar file.
     """
+    from submg.modules import webinDownload
+
     toolVersion, webinCliVersion = webinDownload.versions()
     print(f">Versions: tool={toolVersion}, webin-cli={webinCliVersion}")
     print(">Checking Java installation...")
@@ -222,6 +274,35 @@ def download_webin():
     webinDownload.download_webin_cli(webinCliVersion)
 
 
+def taxonomy_cache(args):
+    """
+    Inspect, warm or clear the persistent cache of ENA taxonomy answers.
+
+    Args:
+        args (argparse.Namespace): The arguments object.
+    """
+    from submg.modules import taxonomyCache, taxQuery
+
+    if args.action == 'info':
+        info = taxonomyCache.info()
+        print(f">Taxonomy cache at {info['path']} ({info['size'] / 1024:.0f} KB)")
+        print(f">Entries expire after {staticConfig.taxonomy_cache_ttl_days} days.")
+        if len(info['entries']) == 0:
+            print(">The cache is empty.")
+        for kind, counts in info['entries'].items():
+            print(f"\t{kind}: {counts['valid']} valid, {counts['expired']} expired")
+    elif args.action == 'warm':
+        if len(args.tsv) == 0:
+            print("\nERROR: Please provide the files to warm the cache with --tsv.")
+            sys.exit(1)
+        print(">Fetching ENA taxonomy suggestions...")
+        n_queries = taxQuery.warm_taxonomy_cache(args.tsv)
+        print(f">The cache now holds the suggestions for {n_queries} classifications.")
+    elif args.action == 'clear':
+        removed = taxonomyCache.clear()
+        print(f">Removed {removed} entries from the taxonomy cache.")
+
+
 def makecfg_through_gui(outpath,
                         submit_samples,
                         submit_unpaired_reads,
@@ -256,6 +337,8 @@ def makecfg_through_gui(outpath,
         loggingC.message(err, threshold=-1)
         sys.exit(1)
         
+    from submg.modules import configGen
+
     configGen.make_config(outpath=outpath,
                           submit_samples=submit_samples,
                           submit_unpaired_reads=submit_unpaired_reads,
@@ -289,6 +372,8 @@ def makecfg(args):
         # Wait for 10 seconds to give the user time to read the message
         time.sleep(10)
         
+    from submg.modules import configGen
+
     configGen.make_config(outpath=args.outfile,
                           submit_samples=args.submit_samples,
                           submit_unpaired_reads=args.submit_unpaired_reads,
@@ -302,6 +387,23 @@ def makecfg(args):
                           quality_cutoffs=args.bin_quality_cutoffs)
     
 
+def build_taxdb(args):
+    """
+    Build the local taxonomy index from an NCBI taxdump.
+
+    Args:
+        args (argparse.Namespace): The arguments object.
+    """
+    from submg.modules import taxonomyIndex
+
+    if not os.path.exists(args.taxdump):
+        print(f"\nERROR: {args.taxdump} does not exist.")
+        sys.exit(1)
+    print(f">Building the taxonomy index from {args.taxdump}...")
+    n_names = taxonomyIndex.build_index(args.taxdump)
+    print(f">Wrote {n_names} scientific names to {taxonomyIndex.index_file()}")
+
+
 def submit_through_gui(config_path,
                        output_dir,
                        listener,
@@ -348,14 +450,19 @@ def submit_through_gui(config_path,
     args.timestamps = 1
     args.threads = 4
     args.keep_depth_files = False
+    args.no_coverage_cache = False
+    args.offline_taxonomy = False
+    args.webin_workers = 1
     args.submit_samples = submit_samples
     args.submit_reads = submit_reads
     args.submit_assembly = submit_assembly
     args.submit_bins = submit_bins
     args.submit_mags = submit_mags
     args.minitest = False
+    args.resume = None
 
     # Set credentials
+    from submg.modules import utility
     utility.set_gui_credentials(username, password)
 
     # Initialize submission
@@ -372,17 +479,46 @@ def submit(args, listener=None, gui=False):
         gui (bool): Whether the function was called from the GUI.
     """
 
+    from submg.modules import preflight, utility, taxQuery, enaSearching, \
+        coverageEngine, stagingEngine, taskGraph, runJournal, httpClient, \
+        taxonomyIndex, performanceReport
+    from submg.modules.utility import prepdir
+    from submg.modules.sampleSubmission import submit_samples
+    from submg.modules.readSubmission import submit_reads
+    from submg.modules.assemblySubmission import submit_assembly, stage_assembly_fasta
+    from submg.modules.binSubmission import submit_bins, get_bin_quality, stage_bin_fastas
+    from submg.modules.magSubmission import submit_mags
+
+    performanceReport.start_run()
+    resume = getattr(args, 'resume', None) is not None
+    if resume:
+        # Continue with the settings of the interrupted run
+        resume_dir = os.path.abspath(os.path.expanduser(args.resume))
+        run = runJournal.load_run(resume_dir)
+        verbosity = args.verbosity
+        for key, value in run['args'].items():
+            setattr(args, key, value)
+        args.verbosity = verbosity
+        args.logging_dir = os.path.dirname(resume_dir)
+        full_timestamp = os.path.basename(resume_dir)
+    else:
+        for option in ('config', 'staging_dir', 'logging_dir'):
+            if getattr(args, option) is None:
+                print(f"\nERROR: --{option.replace('_', '-')} is required unless --resume is used.")
+                sys.exit(1)
+        full_timestamp = utility.full_timestamp()
+
     staging_base = os.path.realpath(os.path.abspath(os.path.expanduser(args.staging_dir)))
     logging_base = os.path.realpath(os.path.abspath(os.path.expanduser(args.logging_dir)))
 
     print("my staging base:", staging_base)
     print("my logging base:", logging_base)
 
-    full_timestamp = utility.full_timestamp()
     logging_subdir = loggingC.set_up_logging(args.logging_dir,
                                              args.verbosity,
                                              full_timestamp,
-                                             listener)
+                                             listener,
+                                             resume=resume)
 
     if staging_base == logging_base:
         loggingC.message(
@@ -395,11 +531,29 @@ def submit(args, listener=None, gui=False):
         
 
     staging_subdir = utility.set_up_staging(args.staging_dir,
-                                            full_timestamp)
+                                            full_timestamp,
+                                            resume=resume)
+    stagingEngine.set_threads(args.threads)
     
     
     if args.timestamps or (args.timestamps is None and args.development_service):
-        utility.set_up_timestamps(vars(args))
+        utility.set_up_timestamps(vars(args),
+                                  stamp=run['stamp'] if resume else None)
+
+    # Record everything needed to resume this run in its journal
+    run_args = dict(vars(args))
+    run_args.pop('resume', None)
+    for option in ('config', 'staging_dir', 'logging_dir'):
+        run_args[option] = os.path.abspath(os.path.expanduser(run_args[option]))
+    runJournal.set_up(logging_subdir,
+                      {'args': run_args, 'stamp': utility.timestamp},
+                      resume=resume)
+
+    taxQuery.offline = getattr(args, 'offline_taxonomy', False)
+    if taxQuery.offline and not taxonomyIndex.available():
+        err = "\nERROR: --offline-taxonomy needs a local taxonomy index. Please create it with submg-cli build-taxdb."
+        loggingC.message(err, threshold=-1)
+        sys.exit(1)
 
     if args.minitest and not args.development_service:
         loggingC.message("ERROR: The --minitest mode cannot be used for a submission to the ENA production server.",
@@ -438,12 +592,29 @@ def submit(args, listener=None, gui=False):
                                                 args.submit_mags)
         loggingC.message(msg, threshold=0)
 
-        config = preflight.preflight_checks(vars(args))
+        with performanceReport.span('preflight'):
+            config = preflight.preflight_checks(vars(args))
+
+        # The submission is split into tasks that run as soon as the
+        # accessions they need are known. Staging files and computing
+        # coverage does not need any accessions, so it overlaps with the
+        # sample and read submissions.
+        tasks = []
+        # A failed task only stops the run once running tasks are done, so
+        # the long running tasks wait for the checks of the bins.
+        checks = []
+
+        if args.submit_bins:
+            bins_staging_dir = prepdir(staging_subdir, 'bins')
+            bins_logging_dir = prepdir(logging_subdir, 'bins')
+        if args.submit_mags:
+            mags_staging_dir = prepdir(staging_subdir, 'mags')
+            mags_logging_dir = prepdir(logging_subdir, 'mags')
 
         # If we are submitting bins, get the quality scores and the
         # taxonomic information.
         # We do this early so we notice issues before we start staging files.
-        if args.submit_bins or args.submit_mags:
+        def bin_selection(_):
             bin_quality = get_bin_quality(config, silent=True)
             # If there are quality cutoffs, make a list of bins to submit
             filtered_bins = utility.quality_filter_bins(bin_quality, config)
@@ -469,9 +640,14 @@ def submit(args, listener=None, gui=False):
                 msg = f">Minitest: Discarding every bin except {filtered_bins[0]}"
                 loggingC.message(msg, threshold=0)
                 filtered_bins = filtered_bins[0:1]
-            
+            return filtered_bins, bin_taxonomy
+
+        if args.submit_bins or args.submit_mags:
+            tasks.append(taskGraph.Task('bin quality and taxonomy', bin_selection))
+            checks.append('bin quality and taxonomy')
+
         # Construct depth files if there are .bam files in the config
-        if 'BAM_FILES' in config.keys():
+        def coverage(_):
             bam_files = utility.from_config(config, 'BAM_FILES')
 
             if not isinstance(bam_files, list):
@@ -480,23 +656,39 @@ def submit(args, listener=None, gui=False):
                 msg = f">Minitest: Ignoring bam files except for {bam_files[0]}"
                 loggingC.message(msg, threshold=0)
                 bam_files = bam_files[0:1]
-            depth_files = utility.construct_depth_files(staging_subdir,
-                                                        args.threads,
-                                                        bam_files)
-            bin_coverage_file = None
+            # Assembly, bin and MAG coverages are all derived from the
+            # resulting contig table.
+            # Sorted copies of unsorted .bam files are kept next to the
+            # staging subdirectories, so later runs can reuse them.
+            sorted_dir = os.path.join(args.staging_dir, 'sorted_bams')
+            if args.keep_depth_files:
+                depth_files = utility.construct_depth_files(staging_subdir,
+                                                            args.threads,
+                                                            bam_files,
+                                                            sorted_dir=sorted_dir)
+                return coverageEngine.contig_table_from_depth_files(depth_files,
+                                                                    threads=args.threads)
+            return coverageEngine.contig_table_from_bam_files(bam_files,
+                                                              threads=args.threads,
+                                                              use_cache=not args.no_coverage_cache,
+                                                              sorted_dir=sorted_dir)
+
+        bin_coverage_file = None
+        if 'BAM_FILES' in config.keys():
+            tasks.append(taskGraph.Task('coverage', coverage, checks))
         else:
             if args.submit_bins:
                 bin_coverage_file = utility.from_config(config,
                                                         'BINS',
                                                         'COVERAGE_FILE')
-            depth_files = None
-
-        if args.submit_samples:
-            sample_accession_data = submit_samples(config,
-                                                   staging_subdir,
-                                                   logging_subdir,
-                                                   test=args.development_service)
-        else:
+            tasks.append(taskGraph.Task('coverage', lambda _: None))
+
+        def samples(_):
+            if args.submit_samples:
+                return submit_samples(config,
+                                      staging_subdir,
+                                      logging_subdir,
+                                      test=args.development_service)
             if args.submit_assembly or args.submit_bins or args.submit_mags:
                 sample_accessions = utility.from_config(config,
                                                         'SAMPLE_ACCESSIONS')
@@ -514,37 +706,59 @@ def submit(args, listener=None, gui=False):
                     'external_accession': 'unk',
                     'alias': 'unk',
                 })
-            
-        if args.submit_reads:
-            run_accessions = submit_reads(config,
-                                          sample_accession_data,
-                                          prepdir(staging_subdir, 'reads'),
-                                          prepdir(logging_subdir, 'reads'),
-                                          test=args.development_service,
-                                          minitest=args.minitest)
+            return sample_accession_data
+
+        # Problems with the bins should stop the submission before anything
+        # is registered.
+        if args.submit_bins or args.submit_mags:
+            tasks.append(taskGraph.Task('samples', samples, ['bin quality and taxonomy']))
         else:
+            tasks.append(taskGraph.Task('samples', samples))
+
+        def reads(results):
+            if args.submit_reads:
+                return submit_reads(config,
+                                    results['samples'],
+                                    prepdir(staging_subdir, 'reads'),
+                                    prepdir(logging_subdir, 'reads'),
+                                    test=args.development_service,
+                                    minitest=args.minitest,
+                                    workers=args.webin_workers)
             if args.submit_bins or args.submit_mags or args.submit_assembly:
                 run_accessions = utility.from_config(config, 'ASSEMBLY', 'RUN_ACCESSIONS')
                 if not isinstance(run_accessions, list):
                     run_accessions = [run_accessions]
+                return run_accessions
+            return None
+
+        tasks.append(taskGraph.Task('reads', reads, ['samples']))
 
         if args.submit_assembly:
-            assembly_sample_accession, assembly_fasta_accession = submit_assembly(config,
-                                                                                  staging_subdir,
-                                                                                  logging_subdir,
-                                                                                  depth_files,
-                                                                                  sample_accession_data,
-                                                                                  run_accessions,
-                                                                                  threads=args.threads,
-                                                                                  test=args.development_service)
+            tasks.append(taskGraph.Task('stage assembly',
+                                        lambda _: stage_assembly_fasta(config, staging_subdir),
+                                        checks))
+
             # Assembly sample accession will be either the accession of the
             # co-assembly virtual sample or the accession of the single sample
             # which the assembly is based on
-        else:
-            if args.submit_bins or args.submit_mags:
-                # In this case we need the submission of the sample that the
-                # assembly is based on. We can derive it from the assembly
-                # accession by querying ENA
+            def assembly(results):
+                return submit_assembly(config,
+                                       staging_subdir,
+                                       logging_subdir,
+                                       results['coverage'],
+                                       results['samples'],
+                                       results['reads'],
+                                       test=args.development_service,
+                                       staged_fasta=results['stage assembly'])
+
+            tasks.append(taskGraph.Task('assembly',
+                                        assembly,
+                                        ['samples', 'reads', 'coverage', 'stage assembly']))
+        elif args.submit_mags:
+            # In this case we need the submission of the sample that the
+            # assembly is based on. We can derive it from the assembly
+            # accession by querying ENA
+            def assembly_sample(_):
                 assembly_dict = utility.from_config(config, 'ASSEMBLY')
                 assembly_sample_accession = None
                 if 'EXISTING_CO_ASSEMBLY_SAMPLE_ACCESSION' in assembly_dict.keys():
@@ -555,49 +769,83 @@ def submit(args, listener=None, gui=False):
                         assembly_analysis_accession = assembly_dict['EXISTING_ASSEMBLY_ANALYSIS_ACCESSION']
                         assembly_sample_accession = enaSearching.search_samples_by_assembly_analysis(assembly_analysis_accession,
                                                                                                     args.development_service)
+                return assembly_sample_accession, None
+
+            tasks.append(taskGraph.Task('assembly', assembly_sample))
 
         # Bin submision
+        # Bins do not reference the assembly, so they do not wait for it.
         if args.submit_bins:
-            submit_bins(filtered_bins,
-                        config,
-                        bin_taxonomy,
-                        sample_accession_data,
-                        run_accessions,
-                        prepdir(staging_subdir, 'bins'),
-                        prepdir(logging_subdir, 'bins'),
-                        depth_files,
-                        bin_coverage_file,
-                        threads=args.threads,
-                        test=args.development_service)
-
+            def stage_bins(results):
+                filtered_bins, _ = results['bin quality and taxonomy']
+                return stage_bin_fastas(filtered_bins,
+                                        config,
+                                        bins_staging_dir)
+
+            def bins(results):
+                filtered_bins, bin_taxonomy = results['bin quality and taxonomy']
+                return submit_bins(filtered_bins,
+                                   config,
+                                   bin_taxonomy,
+                                   results['samples'],
+                                   results['reads'],
+                                   bins_staging_dir,
+                                   bins_logging_dir,
+                                   results['coverage'],
+                                   bin_coverage_file,
+                                   test=args.development_service,
+                                   workers=args.webin_workers,
+                                   staged_fastas=results['stage bins'])
+
+            tasks.append(taskGraph.Task('stage bins',
+                                        stage_bins,
+                                        ['bin quality and taxonomy']))
+            tasks.append(taskGraph.Task('bins',
+                                        bins,
+                                        ['bin quality and taxonomy', 'coverage',
+                                         'samples', 'reads', 'stage bins']))
 
         # MAG submission
         if args.submit_mags:
-            if args.submit_assembly:
-                metagenome_scientific_name = utility.from_config(config, 'METAGENOME_SCIENTIFIC_NAME')
-            else:
-                try:
-                    metagenome_scientific_name = enaSearching.search_scientific_name_by_sample(assembly_sample_accession,
-                                                                                                args.development_service)
-                except:  
-                    # This is a workaround for times where the ENA development
-                    # API does not work. If the sample is registered on the 
-                    # production server we can still continue submitting.
-                    # Included because the situation came up multiple times
-                    # during development.
-                    metagenome_scientific_name = enaSearching.search_scientific_name_by_sample(assembly_sample_accession,
-                                                                                                False)
-            submit_mags(config,
-                        metagenome_scientific_name,
-                        sample_accession_data,
-                        run_accessions,
-                        bin_taxonomy,
-                        prepdir(staging_subdir, 'mags'),
-                        prepdir(logging_subdir, 'mags'),
-                        depth_files,
-                        bin_coverage_file,
-                        threads=args.threads,
-                        test=args.development_service)
+            def mags(results):
+                _, bin_taxonomy = results['bin quality and taxonomy']
+                assembly_sample_accession, _ = results['assembly']
+                if args.submit_assembly:
+                    metagenome_scientific_name = utility.from_config(config, 'METAGENOME_SCIENTIFIC_NAME')
+                else:
+                    try:
+                        metagenome_scientific_name = enaSearching.search_scientific_name_by_sample(assembly_sample_accession,
+                                                                                                    args.development_service)
+                    except:  
+                        # This is a workaround for times where the ENA development
+                        # API does not work. If the sample is registered on the 
+                        # production server we can still continue submitting.
+                        # Included because the situation came up multiple times
+                        # during development.
+                        metagenome_scientific_name = enaSearching.search_scientific_name_by_sample(assembly_sample_accession,
+                                                                                                    False)
+                return submit_mags(config,
+                                   metagenome_scientific_name,
+                                   results['samples'],
+                                   results['reads'],
+                                   bin_taxonomy,
+                                   mags_staging_dir,
+                                   mags_logging_dir,
+                                   results['coverage'],
+                                   bin_coverage_file,
+                                   test=args.development_service,
+                                   workers=args.webin_workers)
+
+            tasks.append(taskGraph.Task('mags',
+                                        mags,
+                                        ['bin quality and taxonomy', 'coverage',
+                                         'samples', 'reads', 'assembly']))
+
+        taskGraph.run_tasks(tasks)
+        loggingC.message(taskGraph.critical_path_message(tasks), threshold=0)
+        latency = httpClient.latency_message()
+        if latency:
+            loggingC.message(latency, threshold=1)
 
         msg = "\n>All submissions completed."
         if args.development_service:
@@ -625,14 +873,6 @@ def submit(args, listener=None, gui=False):
         )
         loggingC.message(msg, threshold=0)
 
-        # Cleanup: depth files
-        if not args.keep_depth_files and depth_files is not None:
-            loggingC.message(">Deleting depth files to free up disk space. "
-                             "To keep them in a future run use the, "
-                             "--keep-depth-files option.", threshold=0)
-            for depth_file in depth_files:
-                os.remove(depth_file)
-
         # Cleanup: warn about staging directory
         if os.path.exists(staging_subdir):
             wrn = (">Reminder: The staging directory "
@@ -647,4 +887,10 @@ def submit(args, listener=None, gui=False):
         loggingC.message(exc_info, threshold=-1)
         sys.exit(1)
 
+    finally:
+        # Also written when the run fails, to see where the time went
+        table = performanceReport.write_report(logging_subdir)
+        loggingC.message(f">Time spent in each stage:\n{table}", threshold=1)
+        loggingC.message(f">Performance report written to {os.path.join(logging_subdir, performanceReport.REPORT_JSON)}", threshold=1)
+
 
@@ -9,6 +9,18 @@ import multiprocessing
 import queue
 from submg.gui.base import BasePage
 from submg.core import submit_through_gui
+from submg.modules import loggingC
+
+# The log monitor only keeps this many recent lines, the complete log is in
+# submg.log in the logging directory
+LOG_MAX_LINES = 5000
+# At most this many messages are taken from the queue per poll, so a burst of
+# messages cannot block the Tk main loop
+MAX_MESSAGES_PER_POLL = 2000
+# The queue is polled every POLL_MIN_MS while messages arrive. The interval
+# doubles for every poll without messages, up to POLL_MAX_MS.
+POLL_MIN_MS = 100
+POLL_MAX_MS = 1000
 
 def submission_wrapper(config_path, output_dir, development_service, verbosity,
                       submit_samples, submit_reads, submit_assembly,
@@ -38,6 +50,10 @@ def submission_wrapper(config_path, output_dir, development_service, verbosity,
         log_queue.put("Error: submission crashed with an exception:")
         log_queue.put(traceback.format_exc())
         raise
+    finally:
+        # Processes started by multiprocessing skip atexit handlers, so the
+        # pending log messages are written here
+        loggingC.shutdown()
 
 
 class MonitorPage(BasePage):
@@ -212,7 +228,8 @@ class MonitorPage(BasePage):
         self.log_text.configure(state="disabled")  # Disable editing after initialization
 
         # Start polling the log queue
-        self.after(100, self.poll_log_queue)
+        self.poll_interval = POLL_MIN_MS
+        self.after(self.poll_interval, self.poll_log_queue)
 
 
     def update_summary(self, max_display_len=30):
@@ -262,6 +279,8 @@ class MonitorPage(BasePage):
 
         # Write a message
         self.log_message("\n\tSTARTING SUBMISSION THROUGH GUI...")
+        self.log_message(f"Only the last {LOG_MAX_LINES} lines are shown here. The "
+                         "complete log is written to submg.log in the submg_logging directory.")
 
         # Create a new queue for this submission
         self.log_queue = multiprocessing.Queue()
@@ -289,24 +308,35 @@ class MonitorPage(BasePage):
 
 
     def poll_log_queue(self):
-        """Poll the log queue for new messages and update the log monitor."""
+        """
+        Poll the log queue for new messages and update the log monitor. All
+        messages of a poll are inserted at once. Polling slows down while no
+        messages arrive.
+        """
+        messages = []
         try:
-            while True:
-                message = self.log_queue.get_nowait()
-                self.log_message(message)
+            while len(messages) < MAX_MESSAGES_PER_POLL:
+                messages.append(self.log_queue.get_nowait())
         except queue.Empty:
             pass
         except Exception as e:
-            self.log_message(f"Queue Error: {e}")
+            messages.append(f"Queue Error: {e}")
         finally:
-            # Check if the submission process has finished
-            if self.submission_process is not None and not self.submission_process.is_alive():
+            if messages:
+                self.log_messages(messages)
+                self.poll_interval = POLL_MIN_MS
+            else:
+                self.poll_interval = min(2 * self.poll_interval, POLL_MAX_MS)
+
+            # Check if the submission process has finished, once all of its
+            # messages are shown
+            if len(messages) < MAX_MESSAGES_PER_POLL and self.submission_process is not None \
+                    and not self.submission_process.is_alive():
                 if self.submission_running:
                     # Handle completion exactly once
                     self.handle_submission_completion()
 
-            # Continue polling after 100 ms
-            self.after(100, self.poll_log_queue)
+            self.after(self.poll_interval, self.poll_log_queue)
 
 
     def handle_submission_completion(self):
@@ -386,10 +416,25 @@ class MonitorPage(BasePage):
 
     def log_message(self, message):
         """Append a message to the log monitor."""
+        self.log_messages([message])
+
+
+    def log_messages(self, messages):
+        """
+        Append messages to the log monitor with a single insert and remove the
+        oldest lines beyond LOG_MAX_LINES. The view only follows new messages
+        if it was scrolled to the end.
+        """
+        follow = self.log_text.yview()[1] >= 0.999
+        text = "\n".join(messages[-LOG_MAX_LINES:]) + "\n"
         self.log_text.configure(state="normal")
-        self.log_text.insert("end", message + "\n")
+        self.log_text.insert("end", text)
+        n_lines = int(self.log_text.index("end-1c").split(".")[0])
+        if n_lines > LOG_MAX_LINES:
+            self.log_text.delete("1.0", f"{n_lines - LOG_MAX_LINES + 1}.0")
         self.log_text.configure(state="disabled")
-        self.log_text.see("end")
+        if follow:
+            self.log_text.see("end")
 
 
     def initialize(self):
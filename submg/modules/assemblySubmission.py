@@ -1,12 +1,9 @@
 import os
 import csv
-import requests
-import gzip
-import shutil
 import xml.etree.ElementTree as ET
 from requests.auth import HTTPBasicAuth
 
-from submg.modules import utility, loggingC
+from submg.modules import utility, loggingC, coverageEngine, stagingEngine, runJournal, httpClient, performanceReport
 from submg.modules.utility import from_config, stamped_from_config
 from submg.modules.statConf import staticConfig
 from submg.modules.webinWrapper import webin_cli
@@ -76,6 +73,7 @@ def __prep_coassembly_samplesheet(config: dict,
     return outpath
 
 
+@performanceReport.timed('samplesheet POST')
 def __submit_coassembly_samplesheet(sample_xml: str,
                                     staging_dir: str,
                                     logging_dir: str,
@@ -101,11 +99,12 @@ def __submit_coassembly_samplesheet(sample_xml: str,
     usr, pwd = utility.get_login()
 
     loggingC.message(f">Trying to submit samplesheet through ENA API.", threshold=0)
-    response = requests.post(url,
+    response = httpClient.post(url,
                 files={
                     'SUBMISSION': open(submission_xml, "rb"),
                     'SAMPLE': open(sample_xml, "rb"),
-                }, auth=HTTPBasicAuth(usr, pwd))
+                }, auth=HTTPBasicAuth(usr, pwd),
+                endpoint='ENA drop-box')
     loggingC.message("\tHTTP status: "+str(response.status_code), threshold=1)
     utility.api_response_check(response)
 
@@ -119,21 +118,20 @@ def __submit_coassembly_samplesheet(sample_xml: str,
 def __prep_assembly_manifest(config: dict,
                              logging_dir: str,
                              outdir: str,
-                             depth_files,
+                             contig_table,
                              run_accessions,
                              sample_accession: str,
-                             fasta_path: str,
-                             threads=4) -> str:
+                             fasta_path: str) -> str:
     """
     Prepares the assembly manifest.
 
     Args:
         config (dict): The configuration dictionary.
         outdir (str): The directory where the manifest will be written.
-        depth_files (str): The path to the depth files.
+        contig_table (dict): The contig coverage table built from the BAM
+            files or None if the coverage is known.
         sample_accession (str): The accession number of the sample.
         fasta_path (str): The path to the fasta file.
-        threads (int, optional): The number of threads to use. Defaults to 4.
         
     Returns:
         Tuple[str, str]: The upload directory and the path to the manifest file.
@@ -141,13 +139,12 @@ def __prep_assembly_manifest(config: dict,
     loggingC.message(f">Preparing assembly manifest file", threshold=0)
     
     # Determine coverage
-    if depth_files is None:
+    if contig_table is None:
         COVERAGE = utility.from_config(config, 'ASSEMBLY', 'COVERAGE_VALUE')
     else:
         coverage_outfile = os.path.join(logging_dir, "assembly_coverage.txt")
-        COVERAGE = utility.calculate_coverage(depth_files,
-                                              outfile=coverage_outfile,
-                                              threads=threads)
+        COVERAGE = coverageEngine.coverage_from_table(contig_table,
+                                                      outfile=coverage_outfile)
 
     # Write manifest
     PLATFORM = utility.from_config(config, 'SEQUENCING_PLATFORMS')
@@ -184,16 +181,43 @@ def __prep_assembly_manifest(config: dict,
     return manifest_path
 
 
+def stage_assembly_fasta(config: dict,
+                         staging_dir: str,
+                         staticConfig=staticConfig) -> str:
+    """
+    Stage the assembly fasta file for upload. This does not need any
+    accessions, so it can run before the samples are registered.
+
+    Args:
+        config (dict): The configuration dictionary.
+        staging_dir (str): The staging directory.
+        staticConfig (staticConfig, optional): The static configuration object.
+            Defaults to staticConfig.
+
+    Returns:
+        str: The path to the staged fasta file.
+    """
+    fasta_submission_dir = os.path.join(staging_dir, "assembly_submission", "fasta")
+    runJournal.makedirs(fasta_submission_dir)
+
+    fasta_path, gzipped = utility.check_fasta(from_config(config, 'ASSEMBLY', 'FASTA_FILE'))
+    gzipped_fasta_path = os.path.join(fasta_submission_dir, f"assembly_upload{staticConfig.zipped_fasta_extension}")
+    if not gzipped:
+        loggingC.message(f">Gzipping assembly fasta file", threshold=0)
+    stagingEngine.stage_file(fasta_path, gzipped_fasta_path, compress=not gzipped)
+    return gzipped_fasta_path
+
+
 def submit_assembly(config: dict,
                     staging_dir: str,
                     logging_dir: str,
-                    depth_files: str,
+                    contig_table: dict,
                     sample_accessions_data,
                     run_accessions,
-                    threads: int = 4,
                     test: bool = True,
                     submit: bool = True,
-                    staticConfig=staticConfig):
+                    staticConfig=staticConfig,
+                    staged_fasta: str = None):
     """
     Submits the assembly to ENA.
 
@@ -201,15 +225,17 @@ def submit_assembly(config: dict,
         config (dict): The configuration dictionary.
         staging_dir (str): The staging directory.
         logging_dir (str): The logging directory.
-        depth_files (str): The path to the depth files.
+        contig_table (dict): The contig coverage table built from the BAM
+            files or None if the coverage is known.
         sample_accessions_data (list): The sample accessions.
         run_accessions (list): The run accessions.
-        threads (int, optional): The number of threads to use. Defaults to 4.
         test (bool, optional): Whether to use the test server. Defaults to True.
         submit (bool, optional): Whether to submit the assembly. Defaults to
             True.
         staticConfig (staticConfig, optional): The static configuration object.
             Defaults to staticConfig.
+        staged_fasta (str, optional): The result of stage_assembly_fasta, if
+            the fasta file was already staged. Defaults to None.
 
     Returns:
         Tuple[str, str]: The assembly sample accession and the assembly
@@ -225,7 +251,7 @@ def submit_assembly(config: dict,
 
     loggingC.message(f">Preparing assembly submission directory", threshold=1)
     assembly_submission_dir = os.path.join(staging_dir, "assembly_submission")
-    os.makedirs(assembly_submission_dir, exist_ok=False)
+    os.makedirs(assembly_submission_dir, exist_ok=staged_fasta is not None or runJournal.resuming)
 
     # If there is multiple samples referenced, then this is a co-assembly
     # and we need to create a samplesheet and upload it
@@ -236,48 +262,41 @@ def submit_assembly(config: dict,
         loggingC.message(f">For a co-assembly, a virtual sample object will be created in ENA", threshold=0)
         ## make a directory for the samplesheet submission
         sample_submission_dir = os.path.join(assembly_submission_dir, "co_assembly_sample")
-        os.makedirs(sample_submission_dir, exist_ok=False)
+        runJournal.makedirs(sample_submission_dir)
         ## add a logging directory
         sample_logging_dir = os.path.join(logging_dir, "co_assembly_sample")
-        os.makedirs(sample_logging_dir, exist_ok=False)
+        runJournal.makedirs(sample_logging_dir)
         ## make xml and submit
 
         samplesheet_path = __prep_coassembly_samplesheet(config,
                                                          sample_submission_dir,
                                                          origin_samples)
-        assembly_sample_accession = __submit_coassembly_samplesheet(samplesheet_path,
-                                                           sample_submission_dir,
-                                                           sample_logging_dir,
-                                                           url)
+        assembly_sample_accession = runJournal.run_step('assembly:co_assembly_sample',
+                                                        __submit_coassembly_samplesheet,
+                                                        samplesheet_path,
+                                                        sample_submission_dir,
+                                                        sample_logging_dir,
+                                                        url)
     else:
         assembly_sample_accession = origin_samples[0]
 
     # Upload the actual assembly
-    ## make a directory and stage the fasta file
-    fasta_submission_dir = os.path.join(assembly_submission_dir, "fasta")
-    os.makedirs(fasta_submission_dir, exist_ok=False)
-
-    fasta_path, gzipped = utility.check_fasta(from_config(config, 'ASSEMBLY', 'FASTA_FILE'))
-    gzipped_fasta_path = os.path.join(fasta_submission_dir, f"assembly_upload{staticConfig.zipped_fasta_extension}")
-    if not gzipped:
-        loggingC.message(f">Gzipping assembly fasta file", threshold=0)
-        with open(fasta_path, 'rb') as f_in:
-            with gzip.open(gzipped_fasta_path, 'wb', compresslevel=5) as f_out:
-                f_out.writelines(f_in)
-    else:
-        shutil.copyfile(fasta_path, gzipped_fasta_path)
+    ## stage the fasta file
+    if staged_fasta is None:
+        staged_fasta = stage_assembly_fasta(config, staging_dir, staticConfig)
+    gzipped_fasta_path = staged_fasta
+    fasta_submission_dir = os.path.dirname(gzipped_fasta_path)
     ## add a logging directory
     fasta_logging_dir = os.path.join(logging_dir, "assembly_fasta")
-    os.makedirs(fasta_logging_dir, exist_ok=False)
+    runJournal.makedirs(fasta_logging_dir)
     ## make a manifest and submit
     manifest_path = __prep_assembly_manifest(config,
                                              logging_dir,
                                              fasta_submission_dir,
-                                             depth_files,
+                                             contig_table,
                                              run_accessions,
                                              assembly_sample_accession,
-                                             gzipped_fasta_path,
-                                             threads=threads)
+                                             gzipped_fasta_path)
 
     loggingC.message(f">Using ENA Webin-CLI to submit assembly.", threshold=0)
     assembly_name = utility.stamped_from_config(config, 'ASSEMBLY','ASSEMBLY_NAME')
@@ -289,7 +308,8 @@ def submit_assembly(config: dict,
                                    password=pwd,
                                    subdir_name=assembly_name,
                                    submit=submit,
-                                   test=test)
+                                   test=test,
+                                   journal_key='assembly')
     
     # Parse the receipt
     assembly_fasta_accession = utility.read_receipt(receipt)
@@ -1,48 +1,15 @@
 import csv
 import os
 import sys
-import requests
 from tqdm import tqdm
-import shutil
-import gzip
 import xml.etree.ElementTree as ET
 from requests.auth import HTTPBasicAuth
 
-from submg.modules import loggingC, utility
-from submg.modules.webinWrapper import webin_cli
+from submg.modules import loggingC, utility, coverageEngine, stagingEngine, runJournal, httpClient, performanceReport
+from submg.modules.webinWrapper import webin_cli_pool
 from submg.modules.statConf import staticConfig
 
 
-def __calculate_bin_coverage(fasta: str,
-                             depth_files: list,
-                             threads=4) -> float:
-    """
-    Extract the names of contigs in the bin and calculate the bin coverage
-    based on the depth files.
-
-    Args:
-        fasta (str): Path to the fasta file of the bin.
-        depth_files (list): A list of paths to the depth files.
-        threads (int, optional): Number of threads to use for samtools. Defaults to 4.
-
-    Returns:
-        float: The average coverage of the contigs in the bin.
-    """
-    # Extract the names of all contigs from the fasta file
-    contig_names = []
-    with open(fasta, 'r') as f:
-        for line in f:
-            if line.startswith('>'):
-                contig_names.append(line.strip().split(' ')[0][1:])
-    # Get the average coverage of the contigs of this bin
-    coverage = utility.calculate_coverage(depth_files,
-                                          contig_names,
-                                          threads=threads,
-                                          silent=True)
-    
-    return coverage
-
-
 def get_bin_quality(config, silent=False) -> dict:
     """
     Based on CheckM output (or any other tsv with the columns 'Bin Id',
@@ -281,6 +248,7 @@ def read_bin_samples_receipt(receipt_path: str) -> dict:
 
     return bin_to_accession
 
+@performanceReport.timed('samplesheet POST')
 def __submit_bins_samplesheet(sample_xml: str,
                               staging_dir: str,
                               logging_dir: str,
@@ -307,11 +275,12 @@ def __submit_bins_samplesheet(sample_xml: str,
     loggingC.message(">Submitting bins samplesheet through ENA API.", threshold=0)
     receipt_path = os.path.join(logging_dir, "bins_samplesheet_receipt.xml")
     usr, pwd = utility.get_login()
-    response = requests.post(url,
+    response = httpClient.post(url,
                 files={
                     'SUBMISSION': open(submission_xml, "rb"),
                     'SAMPLE': open(sample_xml, "rb"),
-                }, auth=HTTPBasicAuth(usr, pwd))
+                }, auth=HTTPBasicAuth(usr, pwd),
+                endpoint='ENA drop-box')
     loggingC.message(f"\tHTTP status: {response.status_code}", threshold=1)
 
     # Process response
@@ -381,66 +350,57 @@ def __prep_bin_manifest(config: dict,
 
     return manifest_path
 
-def __stage_bin_submission(staging_directory: str,
-                           bin_name: str,
-                           bin_fasta: str,
-                           config: dict,
-                           bin_sample_accession: str,
-                           run_accessions: list,
-                           bin_coverage) -> None:
+def stage_bin_fastas(filtered_bins: list,
+                     config: dict,
+                     staging_dir: str) -> dict:
     """
-    Prepares a bin submission by creating a manifest file inside the staging
-    directory and copying the fasta file to the staging directory.
+    Create a staging directory for each bin and stage its fasta file there.
+    This does not need any accessions, so it can run before the bin samples
+    are registered.
 
     Args:
-        staging_directory (str): The directory where the manifest will be
-            written to.
-        bin_name (str): The name of the bin.
-        bin_fasta (str): Path to the fasta file of the bin.
+        filtered_bins (list): A list of bin names to submit.
         config (dict): The config dictionary.
-        bin_sample_accession (str): The accession number of the bin sample.
-        bin_coverage (float): The coverage of the bin.
+        staging_dir (str): The directory where the bins will be staged.
 
     Returns:
-        str: The path to the manifest file.
+        dict: Bin name as key, path of the staged fasta file as value.
     """
-    
-    # Stage the fasta file
-    gzipped_fasta_path = os.path.join(staging_directory, "bin"+f"assembly_upload{staticConfig.zipped_fasta_extension}")
-    if bin_fasta.endswith('.gz'):
-        shutil.copyfile(bin_fasta, gzipped_fasta_path)
-    else:
-        with open(bin_fasta, 'rb') as f_in:
-            with gzip.open(gzipped_fasta_path, 'wb', compresslevel=5) as f_out:
-                f_out.writelines(f_in)
-
-    # Make the MANIFEST file
-    manifest_path = __prep_bin_manifest(config,
-                                        staging_directory,
-                                        bin_coverage,
-                                        bin_sample_accession,
-                                        run_accessions,
-                                        gzipped_fasta_path)  
-
-    return manifest_path          
+    loggingC.message(">Staging bin submission sequences...", threshold=0)
+    bins_directory = utility.from_config(config, 'BINS', 'BINS_DIRECTORY')
+    bin_name_to_fasta = get_bins_in_dir(bins_directory)
+    staged_fastas = {}
+    staging_jobs = []
+    for bin_name in filtered_bins:
+        staging_directory = os.path.join(staging_dir, f"bin_{bin_name}_staging")
+        runJournal.makedirs(staging_directory)
+        gzipped_fasta_path = os.path.join(staging_directory, "bin"+f"assembly_upload{staticConfig.zipped_fasta_extension}")
+        staged_fastas[bin_name] = gzipped_fasta_path
+        # Bins that were submitted by the run that is resumed are not
+        # submitted again, so their files are not needed
+        if not runJournal.completed(f"bins:{bin_name}"):
+            staging_jobs.append((bin_name_to_fasta[bin_name], gzipped_fasta_path))
+    stagingEngine.stage_files(staging_jobs)
+    return staged_fastas
 
     
-def bin_coverage_from_depth(depth_files: str,
+def bin_coverage_from_table(contig_table: dict,
                             bin_name_to_fasta: dict,
-                            outfile: str=None,
-                            threads: int = 4) -> dict:
+                            outfile: str=None) -> dict:
     """
-    Calculate coverage for each bin from depth files.
+    Calculate coverage for each bin from the contig coverage table.
 
     Args:
-        depth_files (str): Path to the depth files.
+        contig_table (dict): Contig coverage table as built by the
+            coverageEngine module.
         bin_name_to_fasta (dict): Dictionary mapping bin names to fasta files.
-        threads (int, optional): Number of threads to use for calculation. Defaults to 4.
+        outfile (str, optional): If given, the bin coverages are written to
+            this tsv file.
 
     Returns:
         dict: Dictionary mapping bin names to coverage values.
     """
-    msg = ">Calculating coverage for each bin from depth files."
+    msg = ">Calculating coverage for each bin from the contig coverage table."
     loggingC.message(msg, threshold=0)
     msg = f">A coverage file will be written to {outfile}\n You can use it to " \
           " provide a KNOWN_COVERAGE_FILE instead of BAM_FILES in the config " \
@@ -450,9 +410,10 @@ def bin_coverage_from_depth(depth_files: str,
         
     bin_coverages = {}
     for bin_name, bin_fasta in tqdm(bin_name_to_fasta.items(), leave=False):
-        coverage = __calculate_bin_coverage(bin_fasta,
-                                            depth_files,
-                                            threads=threads)
+        contig_names = coverageEngine.fasta_contig_names(bin_fasta)
+        coverage = coverageEngine.coverage_from_table(contig_table,
+                                                      contig_names,
+                                                      silent=True)
         bin_coverages[bin_name] = coverage
 
     if outfile:
@@ -524,11 +485,12 @@ def submit_bins(filtered_bins: list,
                 run_accessions,
                 staging_dir: str,
                 logging_dir: str,
-                depth_files: list,
+                contig_table: dict,
                 bin_coverage_file: str,
-                threads: int = 4,
                 test: bool = True,
-                submit: bool = True) -> tuple:
+                submit: bool = True,
+                workers: int = 1,
+                staged_fastas: dict = None) -> tuple:
     """
     Submits a samplesheet for all metagenomic bins to the ENA. Then submits each
     bin as an individual analysis object using webin-cli.
@@ -543,15 +505,18 @@ def submit_bins(filtered_bins: list,
         run_accessions (list): A list of accession numbers of the runs.
         staging_dir (str): The directory where the bins will be staged.
         logging_dir (str): The directory where the logs will be written to.
-        depth_files (list): A list of paths to the depth files. Either this or
-            bin_coverage_file must be specified.
+        contig_table (dict): The contig coverage table built from the BAM
+            files. Either this or bin_coverage_file must be specified.
         bin_coverage_file (str): Path to a tsv file with the coverage for each
-            bin. Either this or depth_files must be specified.
-        threads (int, optional): Number of threads to use for samtools. Defaults to 4.
+            bin. Either this or contig_table must be specified.
         test (bool, optional): If True, the ENA dev server will be used
             instead of the production server. Defaults to True.
         submit (bool, optional): If True, the bins will be submitted to ENA.
             Otherwise only validation will happen. Defaults to True.
+        workers (int, optional): Number of concurrent webin-cli submissions.
+            Defaults to 1.
+        staged_fastas (dict, optional): The result of stage_bin_fastas, if
+            the bins were already staged. Defaults to None.
 
     Returns:
         tuple: A tuple with the receipt paths and the accession numbers of the
@@ -575,11 +540,10 @@ def submit_bins(filtered_bins: list,
     # Get the coverage for each bin file
     loggingC.message(">Deriving bin coverage", threshold=1)
     coverage_outfile = os.path.join(logging_dir, 'bin_coverages.tsv')
-    if depth_files is not None:
-        bin_coverages = bin_coverage_from_depth(depth_files,
+    if contig_table is not None:
+        bin_coverages = bin_coverage_from_table(contig_table,
                                                 bin_name_to_fasta,
-                                                coverage_outfile,
-                                                threads=threads)
+                                                coverage_outfile)
     elif bin_coverage_file is not None:
         bin_coverages = bin_coverage_from_tsv(filtered_bins,
                                               bin_coverage_file,
@@ -589,7 +553,7 @@ def submit_bins(filtered_bins: list,
     # Make a samplesheet for filtered bins
     loggingC.message(">Making bin samplesheet", threshold=1)
     samples_submission_dir = os.path.join(staging_dir, 'bin_samplesheet')
-    os.makedirs(samples_submission_dir, exist_ok=False)
+    runJournal.makedirs(samples_submission_dir)
     samplesheet = __prep_bins_samplesheet(filtered_bins,
                                           config,
                                           sample_accession_data,
@@ -599,11 +563,13 @@ def submit_bins(filtered_bins: list,
     # Upload the samplesheet
     loggingC.message(">Starting bin samplesheet upload", threshold=1)
     samples_logging_dir = os.path.join(logging_dir, 'bin_samplesheet')
-    os.makedirs(samples_logging_dir, exist_ok=False)
-    prefixbin_to_accession = __submit_bins_samplesheet(samplesheet,
-                                                       samples_submission_dir,
-                                                       samples_logging_dir,
-                                                       url)
+    runJournal.makedirs(samples_logging_dir)
+    prefixbin_to_accession = runJournal.run_step('bins:samplesheet',
+                                                 __submit_bins_samplesheet,
+                                                 samplesheet,
+                                                 samples_submission_dir,
+                                                 samples_logging_dir,
+                                                 url)
     
     # Remove the prefixes
     assembly_name = utility.stamped_from_config(config, 'ASSEMBLY', 'ASSEMBLY_NAME').replace(' ', '_')
@@ -615,44 +581,45 @@ def submit_bins(filtered_bins: list,
         bin_to_accession[bin_name] = accession
     
     # Stage the bins
+    if staged_fastas is None:
+        staged_fastas = stage_bin_fastas(filtered_bins, config, staging_dir)
     staging_directories = {}
-    loggingC.message(">Staging bin submission sequences and manifests...", threshold=0)
+    loggingC.message(">Preparing bin submission manifests...", threshold=0)
     bin_manifests = {}
     for bin_name in filtered_bins:
-        bin_fasta = bin_name_to_fasta[bin_name]
-        bin_sample_accession = bin_to_accession[bin_name]
-        staging_directory = os.path.join(staging_dir, f"bin_{bin_name}_staging")
+        gzipped_fasta_path = staged_fastas[bin_name]
+        staging_directory = os.path.dirname(gzipped_fasta_path)
         staging_directories[bin_name] = staging_directory
-        os.makedirs(staging_directory, exist_ok=False)
-        loggingC.message(f"\t...staging bin {bin_name}", threshold=1)
-        bin_manifests[bin_name] = __stage_bin_submission(staging_directory,
-                                                         bin_name,
-                                                         bin_fasta,
-                                                         config,
-                                                         bin_sample_accession,
-                                                         run_accessions,
-                                                         bin_coverages[bin_name])
+        bin_manifests[bin_name] = __prep_bin_manifest(config,
+                                                      staging_directory,
+                                                      bin_coverages[bin_name],
+                                                      bin_to_accession[bin_name],
+                                                      run_accessions,
+                                                      gzipped_fasta_path)
 
     # Submit the bins
     loggingC.message(f">Using ENA Webin-CLI to submit bins.", threshold=0)
     usr, pwd = utility.get_login()
-    bin_receipts = {}
-    bin_accessions = {}
+    submissions = {}
     for bin_name, bin_staging_dir in staging_directories.items():
         bin_logging_dir = os.path.join(logging_dir, f"{bin_name}")
-        os.makedirs(bin_logging_dir, exist_ok=False)
+        runJournal.makedirs(bin_logging_dir)
         bin_manifest = bin_manifests[bin_name]
         assembly_name = utility.stamped_from_config(config, 'ASSEMBLY','ASSEMBLY_NAME')
         subdir_name = assembly_name + '_' + bin_name
 
-        bin_receipts[bin_name], bin_accessions[bin_name] = webin_cli(manifest=bin_manifest,
-                                                                     inputdir=bin_staging_dir,
-                                                                     outputdir=bin_logging_dir,
-                                                                     username=usr,
-                                                                     password=pwd,
-                                                                     subdir_name=subdir_name,
-                                                                     submit=submit,
-                                                                     test=test)
+        submissions[bin_name] = dict(manifest=bin_manifest,
+                                     inputdir=bin_staging_dir,
+                                     outputdir=bin_logging_dir,
+                                     username=usr,
+                                     password=pwd,
+                                     subdir_name=subdir_name,
+                                     submit=submit,
+                                     test=test,
+                                     journal_key=f"bins:{bin_name}")
+    results = webin_cli_pool(submissions, workers=workers)
+    bin_receipts = {bin_name: result[0] for bin_name, result in results.items()}
+    bin_accessions = {bin_name: result[1] for bin_name, result in results.items()}
     loggingC.message("\n>Bin submission completed!", threshold=0)
 
     # Process the results    
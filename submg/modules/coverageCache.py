@@ -0,0 +1,138 @@
+import os
+import json
+import hashlib
+
+from submg.modules import loggingC, utility
+from submg.modules.webinWrapper import get_persistent_storage_path
+from submg.modules.statConf import staticConfig
+
+
+# Bump this if the way coverage is calculated changes, so that old cache
+# entries are not used anymore.
+CACHE_FORMAT_VERSION = 1
+
+
+def __cache_dir() -> str:
+    """
+    Returns the directory where cached contig tables are stored.
+    """
+    return os.path.join(get_persistent_storage_path(), 'coverage_cache')
+
+
+def __index_file(bam_file: str):
+    """
+    Find the index file belonging to a BAM file.
+
+    Args:
+        bam_file (str): Path to the BAM file.
+
+    Returns:
+        str: Path to the index file or None if the BAM file is not indexed.
+    """
+    stem = os.path.splitext(bam_file)[0]
+    for candidate in (bam_file + '.bai', stem + '.bai', bam_file + '.csi'):
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def bam_fingerprint(bam_file: str) -> str:
+    """
+    Create the cache key of a BAM file from its absolute path, size,
+    modification time and the checksum of its index.
+
+    Args:
+        bam_file (str): Path to the BAM file.
+
+    Returns:
+        str: A hex digest identifying this version of the BAM file.
+    """
+    stat = os.stat(bam_file)
+    index_file = __index_file(bam_file)
+    index_md5 = utility.calculate_md5(index_file) if index_file else ''
+    key = [CACHE_FORMAT_VERSION,
+           os.path.abspath(bam_file),
+           stat.st_size,
+           stat.st_mtime_ns,
+           index_md5]
+    return hashlib.sha256(json.dumps(key).encode()).hexdigest()
+
+
+def load(fingerprint: str):
+    """
+    Load a cached contig table. A successful lookup marks the entry as
+    recently used.
+
+    Args:
+        fingerprint (str): The cache key as created by bam_fingerprint.
+
+    Returns:
+        dict: Contig name as key, [summed depth, length] as value. None if
+            there is no usable entry for this key.
+    """
+    entry = os.path.join(__cache_dir(), fingerprint + '.json')
+    try:
+        with open(entry, 'r') as f:
+            contig_table = json.load(f)
+        os.utime(entry)
+    except (OSError, ValueError):
+        return None
+    return contig_table
+
+
+def store(fingerprint: str,
+          contig_table: dict):
+    """
+    Write a contig table to the cache, then evict the least recently used
+    entries if the cache exceeds its size limit. Failing to write the cache
+    is not an error, the submission just continues without it.
+
+    Args:
+        fingerprint (str): The cache key as created by bam_fingerprint.
+        contig_table (dict): Contig name as key, [summed depth, length] as
+            value.
+    """
+    cache_dir = __cache_dir()
+    entry = os.path.join(cache_dir, fingerprint + '.json')
+    tmp_entry = f"{entry}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(tmp_entry, 'w') as f:
+            json.dump(contig_table, f, separators=(',', ':'))
+        os.replace(tmp_entry, entry)
+    except OSError as e:
+        warn = f"WARNING: Could not write coverage cache entry {entry} ({e})."
+        loggingC.message(warn, threshold=1)
+        return
+    __evict(staticConfig.coverage_cache_max_mb * 1024 * 1024)
+
+
+def __evict(max_bytes: int):
+    """
+    Delete the least recently used cache entries until the cache is smaller
+    than max_bytes.
+
+    Args:
+        max_bytes (int): Size limit of the cache in bytes.
+    """
+    cache_dir = __cache_dir()
+    entries = []
+    for name in os.listdir(cache_dir):
+        if not name.endswith('.json'):
+            continue
+        path = os.path.join(cache_dir, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        loggingC.message(f"\t...removed {path} from the coverage cache.", threshold=2)
@@ -0,0 +1,565 @@
+import io
+import os
+import csv
+import sys
+import concurrent.futures
+try:
+    import pysam
+    HAS_PYSAM = True
+except ImportError:
+    HAS_PYSAM = False
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+from yaspin import yaspin
+
+from submg.modules import loggingC, utility, coverageCache, performanceReport
+
+
+# Reads with these flags are ignored by 'samtools depth' (UNMAP, SECONDARY,
+# QCFAIL, DUP), so we ignore them too.
+EXCLUDED_FLAGS = 0x4 | 0x100 | 0x200 | 0x400
+# CIGAR operations that add to the depth of a position (M, =, X)
+ALIGNED_CIGAR_OPS = (0, 7, 8)
+# Number of bytes the vectorised parser reads from a depth file at once
+DEPTH_CHUNK_SIZE = 64 * 1024 * 1024
+
+
+def contigs_coverage(depth_file):
+    """
+    Calculates the coverage per contig from a depth file.
+
+    Args:
+    depth_file (str): File path to the depth file.
+
+    Returns:
+    dict: Contig name as key, coverage as value.
+    dict: Contig name as key, length as value.
+    """
+    contig_coverage = {}
+    contig_length = {}
+    reader = csv.reader(depth_file, delimiter='\t')
+    for row in reader:
+        contig = row[0].strip().split(' ')[0]
+        position = int(row[1].strip())
+        coverage = int(row[2].strip())
+        if not contig in contig_coverage:
+            contig_coverage[contig] = 0
+            contig_length[contig] = 0
+        contig_coverage[contig] += coverage
+        if position > contig_length[contig]: # Contig positions should be ordered, so we just need the last one. But we do this just to be safe
+            contig_length[contig] = position
+    return contig_coverage, contig_length
+
+
+def __parse_int_fields(data, starts, ends):
+    """
+    Convert the ASCII digits between starts and ends (exclusive) of each field
+    into integers. Instead of looping over the fields, we loop over the digit
+    places (ones, tens, ...) and handle all fields at once.
+
+    Args:
+        data (numpy.ndarray): The raw bytes as uint8 array.
+        starts (numpy.ndarray): Index of the first byte of each field.
+        ends (numpy.ndarray): Index after the last byte of each field.
+
+    Returns:
+        numpy.ndarray: The integer value of each field.
+    """
+    lengths = ends - starts
+    values = np.zeros(len(ends), dtype=np.int64)
+    for place in range(int(lengths.max())):
+        digits = data[ends - 1 - place].astype(np.int64) - 48
+        if place > 0:
+            digits[lengths <= place] = 0
+        values += digits * (10 ** place)
+    return values
+
+
+def __contig_runs(chunk: bytes,
+                  line_starts,
+                  name_ends,
+                  positions) -> list:
+    """
+    Find the runs of consecutive lines that belong to the same contig. Since
+    samtools writes the lines of each contig en bloc, the end of each run is
+    found with a binary search over the line starts.
+
+    Args:
+        chunk (bytes): Complete lines of a depth file.
+        line_starts (numpy.ndarray): Index of the first byte of each line.
+        name_ends (numpy.ndarray): Index of the first tab of each line.
+        positions (numpy.ndarray): The position column of each line.
+
+    Returns:
+        list: Tuples of (contig, first line, line after the last line) or None
+            if the lines of a contig are not grouped and ordered.
+    """
+    name_lengths = name_ends - line_starts
+    n_lines = len(line_starts)
+    runs = []
+    run_start = 0
+    while run_start < n_lines:
+        name = chunk[line_starts[run_start]:name_ends[run_start] + 1]
+        low = run_start + 1
+        high = n_lines
+        while low < high:
+            middle = (low + high) // 2
+            if chunk.startswith(name, line_starts[middle]):
+                low = middle + 1
+            else:
+                high = middle
+        # The binary search is only valid for grouped input
+        if (name_lengths[run_start:low] != name_lengths[run_start]).any():
+            return None
+        if (np.diff(positions[run_start:low]) <= 0).any():
+            return None
+        contig = name.decode().strip().split(' ')[0]
+        runs.append((contig, run_start, low))
+        run_start = low
+    return runs
+
+
+def __reduce_depth_chunk_csv(chunk: bytes,
+                             contig_coverage: dict,
+                             contig_length: dict):
+    """
+    Parse a block of complete depth file lines with contigs_coverage and add
+    the results to contig_coverage and contig_length.
+
+    Args:
+        chunk (bytes): Complete lines of a depth file.
+        contig_coverage (dict): Contig name as key, coverage as value.
+        contig_length (dict): Contig name as key, length as value.
+    """
+    partial_coverage, partial_length = contigs_coverage(io.StringIO(chunk.decode()))
+    for contig, coverage in partial_coverage.items():
+        contig_coverage[contig] = contig_coverage.get(contig, 0) + coverage
+        contig_length[contig] = max(contig_length.get(contig, 0), partial_length[contig])
+
+
+def __reduce_depth_chunk(chunk: bytes,
+                         contig_coverage: dict,
+                         contig_length: dict):
+    """
+    Parse a block of complete depth file lines and add the summed depth and
+    the maximum position of each contig to contig_coverage and contig_length.
+    Position and depth columns are converted in bulk, lines are then reduced
+    per run of identical contig names.
+
+    Args:
+        chunk (bytes): Complete lines of a depth file.
+        contig_coverage (dict): Contig name as key, coverage as value.
+        contig_length (dict): Contig name as key, length as value.
+    """
+    if not HAS_NUMPY:
+        __reduce_depth_chunk_csv(chunk, contig_coverage, contig_length)
+        return
+    data = np.frombuffer(chunk, dtype=np.uint8)
+    newlines = np.flatnonzero(data == 10)
+    tabs = np.flatnonzero(data == 9)
+    runs = None
+    if (len(newlines) > 0) and (len(tabs) == 2 * len(newlines)) and not (b'\r' in chunk):
+        tabs = tabs.reshape(-1, 2)
+        line_starts = np.empty(len(newlines), dtype=np.int64)
+        line_starts[0] = 0
+        line_starts[1:] = newlines[:-1] + 1
+        positions = __parse_int_fields(data, tabs[:, 0] + 1, tabs[:, 1])
+        depths = __parse_int_fields(data, tabs[:, 1] + 1, newlines)
+        runs = __contig_runs(chunk, line_starts, tabs[:, 0], positions)
+
+    if runs is None:
+        # Not a plain, grouped three column depth file. Let the csv parser
+        # handle this block.
+        __reduce_depth_chunk_csv(chunk, contig_coverage, contig_length)
+        return
+
+    for contig, run_start, run_end in runs:
+        coverage = int(depths[run_start:run_end].sum())
+        length = int(positions[run_start:run_end].max())
+        contig_coverage[contig] = contig_coverage.get(contig, 0) + coverage
+        contig_length[contig] = max(contig_length.get(contig, 0), length)
+
+
+def __read_depth_segment(depth_path: str,
+                         start: int,
+                         end: int,
+                         chunk_size: int = DEPTH_CHUNK_SIZE):
+    """
+    Calculate the coverage per contig for the lines between the byte offsets
+    start and end of a depth file. Both offsets have to be line boundaries.
+    This runs in worker processes, so it must not log anything.
+
+    Args:
+        depth_path (str): File path to the depth file.
+        start (int): Offset of the first byte to read.
+        end (int): Offset after the last byte to read.
+        chunk_size (int, optional): Number of bytes read per block.
+
+    Returns:
+        dict: Contig name as key, coverage as value.
+        dict: Contig name as key, length as value.
+    """
+    contig_coverage = {}
+    contig_length = {}
+    remainder = b''
+    with open(depth_path, 'rb') as f:
+        f.seek(start)
+        to_read = end - start
+        while to_read > 0:
+            block = f.read(min(chunk_size, to_read))
+            if not block:
+                break
+            to_read -= len(block)
+            block = remainder + block
+            cut = block.rfind(b'\n') + 1
+            remainder = block[cut:]
+            if cut > 0:
+                __reduce_depth_chunk(block[:cut], contig_coverage, contig_length)
+    if remainder.strip():
+        __reduce_depth_chunk(remainder + b'\n', contig_coverage, contig_length)
+    return contig_coverage, contig_length
+
+
+def contigs_coverage_chunked(depth_path: str,
+                             chunk_size: int = DEPTH_CHUNK_SIZE):
+    """
+    Calculates the coverage per contig from a depth file by reading it in large
+    blocks and reducing each block with NumPy. Gives the same results as
+    contigs_coverage.
+
+    Args:
+        depth_path (str): File path to the depth file.
+        chunk_size (int, optional): Number of bytes read per block.
+
+    Returns:
+        dict: Contig name as key, coverage as value.
+        dict: Contig name as key, length as value.
+    """
+    return __read_depth_segment(depth_path,
+                                0,
+                                os.path.getsize(depth_path),
+                                chunk_size=chunk_size)
+
+
+def __depth_file_segments(depth_path: str,
+                          n_segments: int) -> list:
+    """
+    Split a depth file into up to n_segments byte ranges of similar size. All
+    ranges start and end at line boundaries.
+
+    Args:
+        depth_path (str): File path to the depth file.
+        n_segments (int): The desired number of segments.
+
+    Returns:
+        list: A list of (start, end) byte offsets.
+    """
+    size = os.path.getsize(depth_path)
+    boundaries = [0]
+    with open(depth_path, 'rb') as f:
+        for i in range(1, n_segments):
+            f.seek(size * i // n_segments)
+            f.readline()
+            boundary = f.tell()
+            if boundaries[-1] < boundary < size:
+                boundaries.append(boundary)
+    boundaries.append(size)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def __run_in_processes(function,
+                       tasks: list,
+                       processes: int):
+    """
+    Run function on each task (a tuple of arguments) in a pool of worker
+    processes and yield (task index, result) as soon as a task is done. Runs
+    in the current process if there is nothing to parallelize.
+
+    Args:
+        function: A module level function, so it can be pickled.
+        tasks (list): A list of argument tuples.
+        processes (int): The maximum number of worker processes.
+    """
+    if processes <= 1 or len(tasks) <= 1:
+        for i, task in enumerate(tasks):
+            yield i, function(*task)
+        return
+    with concurrent.futures.ProcessPoolExecutor(max_workers=min(processes, len(tasks)),
+                                                initializer=loggingC.set_up_worker,
+                                                initargs=(loggingC.worker_state(),)) as executor:
+        future_to_index = {
+            executor.submit(function, *task): i
+            for i, task in enumerate(tasks)
+        }
+        for future in concurrent.futures.as_completed(future_to_index):
+            yield future_to_index[future], future.result()
+
+
+def __merge_tables(partial_tables) -> dict:
+    """
+    Merge the contig tables of several depth files or BAM files by summing
+    depth and length of each contig.
+
+    Args:
+        partial_tables (iterable): The contig tables to merge.
+
+    Returns:
+        dict: Contig name as key, [summed depth, summed length] as value.
+    """
+    contig_table = {}
+    for partial_table in partial_tables:
+        for contig, (depth, length) in partial_table.items():
+            if not contig in contig_table:
+                contig_table[contig] = [0, 0]
+            contig_table[contig][0] += depth
+            contig_table[contig][1] += length
+    return contig_table
+
+
+@performanceReport.timed('coverage from depth files')
+def contig_table_from_depth_files(depth_files: list,
+                                  threads: int = 4) -> dict:
+    """
+    Read every depth file exactly once and build a table with the summed depth
+    and the summed length of each contig over all depth files. All coverage
+    values of a run (assembly, bins and MAGs) are resolved from this table.
+    Large depth files are split into segments at line boundaries, which are
+    reduced by worker processes. Only the per contig sums of each segment are
+    sent back to this process.
+
+    Args:
+        depth_files (list): List of paths to the depth files.
+        threads (int, optional): Number of processes to use. Defaults to 4.
+
+    Returns:
+        dict: Contig name as key, [summed depth, summed length] as value.
+    """
+    loggingC.message(">Reading depth files to build the contig coverage table. This might take a while.", threshold=0)
+
+    tasks = []
+    task_files = []
+    for i, depth_file in enumerate(depth_files):
+        n_segments = max(1, min(threads, os.path.getsize(depth_file) // DEPTH_CHUNK_SIZE))
+        for start, end in __depth_file_segments(depth_file, n_segments):
+            tasks.append((depth_file, start, end))
+            task_files.append(i)
+
+    # A contig can be split between two segments of the same file, so its
+    # length is the maximum over the segments of that file.
+    file_coverages = [{} for _ in depth_files]
+    file_lengths = [{} for _ in depth_files]
+    inuse = max(1, min(threads, len(tasks)))
+    with yaspin(text=f"Processing {len(tasks)} segments with {inuse} processes...\t", color="yellow"):
+        for i, (contig_coverage, contig_length) in __run_in_processes(__read_depth_segment, tasks, threads):
+            coverages = file_coverages[task_files[i]]
+            lengths = file_lengths[task_files[i]]
+            for contig, coverage in contig_coverage.items():
+                coverages[contig] = coverages.get(contig, 0) + coverage
+                lengths[contig] = max(lengths.get(contig, 0), contig_length[contig])
+
+    contig_table = __merge_tables(
+        {contig: [coverages[contig], lengths[contig]] for contig in coverages}
+        for coverages, lengths in zip(file_coverages, file_lengths)
+    )
+
+    loggingC.message(f"\t...found {len(contig_table)} contigs in {len(depth_files)} depth files.", threshold=1)
+    performanceReport.count('depth_files', len(depth_files))
+    performanceReport.count('depth_bytes', sum(os.path.getsize(f) for f in depth_files))
+    performanceReport.count('contigs', len(contig_table))
+
+    return contig_table
+
+
+def __read_bam_references(bam_file: str,
+                          contigs: list) -> dict:
+    """
+    Iterate over some references of an indexed BAM file and sum up the aligned
+    bases of each contig. The result is identical to summing up the output of
+    'samtools depth -a' for each contig, without writing a depth file.
+    This runs in worker processes, so it must not log anything.
+
+    Args:
+        bam_file (str): Path to the sorted and indexed BAM file.
+        contigs (list): The names of the references to process.
+
+    Returns:
+        dict: Contig name as key, [summed depth, length] as value.
+    """
+    contig_table = {}
+    with pysam.AlignmentFile(bam_file, 'rb') as bam:
+        for contig in contigs:
+            depth = 0
+            has_reads = False
+            for read in bam.fetch(contig):
+                if read.flag & EXCLUDED_FLAGS:
+                    continue
+                has_reads = True
+                cigar_stats = read.get_cigar_stats()[0]
+                for op in ALIGNED_CIGAR_OPS:
+                    depth += int(cigar_stats[op])
+            # 'samtools depth -a' skips contigs without any reads
+            if has_reads:
+                contig_table[contig] = [depth, bam.get_reference_length(contig)]
+    return contig_table
+
+
+def __reference_groups(bam_file: str,
+                       n_groups: int) -> list:
+    """
+    Split the references of a BAM file into up to n_groups groups with a
+    similar number of mapped reads.
+
+    Args:
+        bam_file (str): Path to the sorted and indexed BAM file.
+        n_groups (int): The desired number of groups.
+
+    Returns:
+        list: A list of lists of reference names.
+    """
+    with pysam.AlignmentFile(bam_file, 'rb') as bam:
+        weights = [(stat.contig, stat.mapped + 1) for stat in bam.get_index_statistics()]
+    groups = [[] for _ in range(max(1, n_groups))]
+    group_weights = [0] * len(groups)
+    for contig, weight in sorted(weights, key=lambda x: x[1], reverse=True):
+        lightest = group_weights.index(min(group_weights))
+        groups[lightest].append(contig)
+        group_weights[lightest] += weight
+    return [group for group in groups if group]
+
+
+@performanceReport.timed('coverage from BAM files')
+def contig_table_from_bam_files(bam_files: list,
+                                threads: int = 4,
+                                use_cache: bool = True,
+                                sorted_dir: str = None) -> dict:
+    """
+    Build the contig coverage table directly from the BAM files, without
+    materialising depth files in the staging directory. The references of each
+    BAM file are split into groups which are reduced by worker processes.
+    The table of each BAM file is kept in a persistent cache, so BAM files
+    that did not change since an earlier run are not read again.
+
+    Args:
+        bam_files (list): List of paths to the BAM files.
+        threads (int, optional): Number of threads to use. Defaults to 4.
+        use_cache (bool, optional): Look up and store the tables of the BAM
+            files in the coverage cache. Defaults to True.
+        sorted_dir (str, optional): Directory for sorted copies of unsorted
+            BAM files. Defaults to the directory of each BAM file.
+
+    Returns:
+        dict: Contig name as key, [summed depth, summed length] as value.
+    """
+    if not HAS_PYSAM:
+        err = "\nERROR: pysam is not installed, but needed for coverage calculations. You CANNOT use pysam on a windows system."
+        loggingC.message(err, threshold=-1)
+        sys.exit(1)
+    loggingC.message(">Calculating contig coverage from bam files. This might take a while.", threshold=0)
+
+    file_tables = [None] * len(bam_files)
+    if use_cache:
+        for i, bam_file in enumerate(bam_files):
+            file_tables[i] = coverageCache.load(coverageCache.bam_fingerprint(bam_file))
+            if file_tables[i] is not None:
+                loggingC.message(f"\t...using cached coverage of {bam_file}", threshold=1)
+    todo = [i for i, table in enumerate(file_tables) if table is None]
+
+    if len(todo) > 0:
+        sorted_bam_files = utility.prepare_bam_files([bam_files[i] for i in todo],
+                                                     threads,
+                                                     sorted_dir=sorted_dir)
+
+        tasks = []
+        task_files = []
+        for i, sorted_bam_file in zip(todo, sorted_bam_files):
+            file_tables[i] = {}
+            for contigs in __reference_groups(sorted_bam_file, threads):
+                tasks.append((sorted_bam_file, contigs))
+                task_files.append(i)
+
+        inuse = max(1, min(threads, len(tasks)))
+        with yaspin(text=f"Processing {len(tasks)} reference groups with {inuse} processes...\t", color="yellow"):
+            # A reference is in only one group per BAM file
+            for j, partial_table in __run_in_processes(__read_bam_references, tasks, threads):
+                file_tables[task_files[j]].update(partial_table)
+
+        if use_cache:
+            # The fingerprint is taken after preparation, since preparing
+            # a sorted BAM file creates its index.
+            for i in todo:
+                coverageCache.store(coverageCache.bam_fingerprint(bam_files[i]), file_tables[i])
+
+    contig_table = __merge_tables(file_tables)
+
+    loggingC.message(f"\t...found {len(contig_table)} contigs in {len(bam_files)} bam files.", threshold=1)
+    performanceReport.count('bam_files', len(bam_files))
+    performanceReport.count('cached_bam_files', len(bam_files) - len(todo))
+    performanceReport.count('contigs', len(contig_table))
+
+    return contig_table
+
+
+def coverage_from_table(contig_table: dict,
+                        target_contigs=None,
+                        outfile=None,
+                        silent=False) -> float:
+    """
+    Calculate the average coverage of a set of contigs from a contig table.
+
+    Args:
+        contig_table (dict): Table as created by contig_table_from_depth_files
+            or contig_table_from_bam_files.
+        target_contigs (iterable, optional): Contigs to calculate coverage for.
+            If None, the coverage of the whole assembly is calculated.
+        outfile (str, optional): If given, the coverage value is written here.
+        silent (bool, optional): If True, do not log the coverage value.
+
+    Returns:
+        float: Average depth of coverage of the contigs.
+    """
+    total_coverage = 0
+    total_length = 0
+    if target_contigs is None:
+        target_contigs = contig_table.keys()
+    for contig in target_contigs:
+        if not contig in contig_table:
+            continue
+        depth, length = contig_table[contig]
+        total_coverage += depth
+        total_length += length
+
+    average_coverage = total_coverage / total_length if total_length > 0 else 0
+
+    if not silent:
+        loggingC.message(f"\t...coverage is {str(average_coverage)}", threshold=0)
+
+    if outfile:
+        msg = f">The coverage value will be written to {outfile} in case you " \
+              " want to provide a KNOWN_COVERAGE in the ASSEMBLY section " \
+              " in the config for subsequent submission attempts."
+        loggingC.message(msg, threshold=0)
+        with open(outfile, 'w') as f:
+            f.write(str(average_coverage))
+
+    return average_coverage
+
+
+def fasta_contig_names(fasta: str) -> list:
+    """
+    Extract the names of all contigs from a fasta file.
+
+    Args:
+        fasta (str): Path to the fasta file.
+
+    Returns:
+        list: The contig names.
+    """
+    contig_names = []
+    with open(fasta, 'r') as f:
+        for line in f:
+            if line.startswith('>'):
+                contig_names.append(line.strip().split(' ')[0][1:])
+    return contig_names
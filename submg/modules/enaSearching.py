@@ -1,12 +1,14 @@
-import requests
 import sys
 from requests.exceptions import ConnectionError, ConnectTimeout, HTTPError, RequestException
 
 
-from submg.modules import loggingC
+from submg.modules import loggingC, httpClient
 from submg.modules.statConf import staticConfig
 
 
+# Servers that answered ensure_server_online during this run
+__online_servers = set()
+
 
 def ensure_server_online(url: str, timeout: float = 5.0):
     """
@@ -17,10 +19,13 @@ def ensure_server_online(url: str, timeout: float = 5.0):
       - ConnectionError: unable to establish a TCP connection (server offline).
       - HTTPError with status >= 500: server-side errors.
     Treats 4xx responses as “reachable but client-side issues” and does not exit.
+    Each server is only checked once per run.
     """
+    if url in __online_servers:
+        return
     try:
         # Use OPTIONS since some APIs reject HEAD without params
-        resp = requests.options(url, timeout=timeout)
+        resp = httpClient.options(url, timeout=timeout, endpoint='ENA portal availability')
         resp.raise_for_status()
     except ConnectTimeout as e:
         loggingC.message(
@@ -45,6 +50,7 @@ def ensure_server_online(url: str, timeout: float = 5.0):
     except RequestException:
         # Other errors (e.g., TooManyRedirects); propagate or handle as needed
         raise
+    __online_servers.add(url)
 
 
 def study_exists(study_accession: str,
@@ -70,7 +76,7 @@ def study_exists(study_accession: str,
         "result": "study",
         "fields": "study_accession"
     }
-    response = requests.get(url, params=params)
+    response = httpClient.get(url, params=params, endpoint='ENA portal search')
 
     data = response.text.split('\n')
     if (data[0] != 'study_accession') or (data[1] not in [study_accession, '']):
@@ -110,7 +116,7 @@ def sample_accession_exists(sample_accession: str,
         "result": "sample",
         "fields": "sample_accession"
     }
-    response = requests.get(url, params=params)
+    response = httpClient.get(url, params=params, endpoint='ENA portal search')
 
     data = response.text.split('\n')
     if (data[0] != 'sample_accession') or (data[1] not in [sample_accession, '']):
@@ -144,7 +150,7 @@ def sample_alias_accession(sample_alias: str,
         "result": "sample",
         "fields": "sample_accession"
     }
-    response = requests.get(url, params=params)
+    response = httpClient.get(url, params=params, endpoint='ENA portal search')
     try:
         data = response.text.split('\n')[1]
     except:
@@ -177,7 +183,7 @@ def sample_title_accession(sample_title: str,
         "result": "sample",
         "fields": "sample_accession"
     }
-    response = requests.get(url, params=params)
+    response = httpClient.get(url, params=params, endpoint='ENA portal search')
     try:
         data = response.text.split('\n')[1]
     except:
@@ -211,7 +217,7 @@ def run_alias_accession(run_alias: str,
         "result": "read_run",
         "fields": "run_accession"
     }
-    response = requests.get(url, params=params)
+    response = httpClient.get(url, params=params, endpoint='ENA portal search')
     try:
         data = response.text.split('\n')[1]
     except:
@@ -221,6 +227,156 @@ def run_alias_accession(run_alias: str,
     return data
 
 
+def __batched_search(result: str,
+                     field: str,
+                     values: list,
+                     fields: list,
+                     devserver: bool,
+                     study_accession: str = None) -> list:
+    """
+    Look up many values of one field with as few portal API requests as
+    possible. The values are OR-combined into one query, which is split into
+    several requests if it gets longer than
+    staticConfig.ena_search_max_query_length.
+
+    Args:
+        result (str): The result type, e.g. 'sample' or 'read_run'.
+        field (str): The field that is searched for the values.
+        values (list): The values to look up.
+        fields (list): The fields that are returned for each hit.
+        devserver (bool): Whether to use the test server.
+        study_accession (str, optional): Only return hits of this study.
+
+    Returns:
+        list: A dictionary per hit, field name as key.
+    """
+    if devserver:
+        url = staticConfig.ena_test_search_url
+    else:
+        url = staticConfig.ena_search_url
+    values = sorted(set(values))
+    if len(values) == 0:
+        return []
+    ensure_server_online(url)
+
+    # Split the values into batches that keep the query short enough for a URL
+    suffix = f" AND study_accession={study_accession}" if study_accession else ""
+    batches = [[]]
+    length = 0
+    for value in values:
+        clause = f'{field}="{value}"'
+        if batches[-1] and length + len(clause) + 4 > staticConfig.ena_search_max_query_length:
+            batches.append([])
+            length = 0
+        batches[-1].append(clause)
+        length += len(clause) + 4
+
+    hits = []
+    for batch in batches:
+        params = {
+            "query": f"({' OR '.join(batch)}){suffix}",
+            "result": result,
+            "fields": ",".join(fields),
+            "limit": 0,
+        }
+        response = httpClient.get(url, params=params, endpoint='ENA portal search')
+        if response.status_code != 200:
+            msg = f"ENA portal API returned status code {response.status_code} when looking up {len(batch)} values of {field}."
+            if devserver:
+                # The development server is not always reliable, so an
+                # answer of the production server has to do
+                loggingC.message(f"\nWARNING: {msg}", threshold=1)
+                continue
+            loggingC.message(f"\nERROR: {msg}", threshold=-1)
+            sys.exit(1)
+        lines = response.text.splitlines()
+        if len(lines) == 0:
+            continue
+        header = lines[0].split('\t')
+        for line in lines[1:]:
+            if line:
+                hits.append(dict(zip(header, line.split('\t'))))
+    return hits
+
+
+def run_alias_accessions(run_aliases: list,
+                         study_accession: str,
+                         devserver: bool) -> dict:
+    """
+    Batched version of run_alias_accession.
+
+    Args:
+        run_aliases (list):     The run names.
+        study_accession (str):  The study accession.
+        devserver (bool):        Whether to use the test server.
+
+    Returns:
+        dict: Each run name that exists in ENA as key, its accession as value.
+    """
+    hits = __batched_search('read_run', 'run_alias', run_aliases,
+                            ['run_alias', 'run_accession'], devserver, study_accession)
+    return {hit['run_alias']: hit['run_accession'] for hit in hits}
+
+
+def sample_alias_accessions(sample_aliases: list,
+                            study_accession: str,
+                            devserver: bool) -> dict:
+    """
+    Batched version of sample_alias_accession.
+
+    Args:
+        sample_aliases (list):  The sample aliases.
+        study_accession (str):  The study accession.
+        devserver (bool):        Whether to use the test server.
+
+    Returns:
+        dict: Each alias that exists in ENA as key, its accession as value.
+    """
+    hits = __batched_search('sample', 'sample_alias', sample_aliases,
+                            ['sample_alias', 'sample_accession'], devserver, study_accession)
+    return {hit['sample_alias']: hit['sample_accession'] for hit in hits}
+
+
+def sample_title_accessions(sample_titles: list,
+                            study_accession: str,
+                            devserver: bool) -> dict:
+    """
+    Batched version of sample_title_accession.
+
+    Args:
+        sample_titles (list):   The sample titles.
+        study_accession (str):  The study accession.
+        devserver (bool):        Whether to use the test server.
+
+    Returns:
+        dict: Each title that exists in ENA as key, its accession as value.
+    """
+    hits = __batched_search('sample', 'sample_title', sample_titles,
+                            ['sample_title', 'sample_accession'], devserver, study_accession)
+    return {hit['sample_title']: hit['sample_accession'] for hit in hits}
+
+
+def existing_sample_accessions(sample_accessions: list,
+                               devserver: bool) -> set:
+    """
+    Batched version of sample_accession_exists. Accessions may be given in
+    the SAMEA or the ERS format.
+
+    Args:
+        sample_accessions (list): The sample accessions.
+        devserver (bool):          Whether to use the test server.
+
+    Returns:
+        set: The sample accessions that exist in ENA.
+    """
+    hits = __batched_search('sample', 'sample_accession', sample_accessions,
+                            ['sample_accession', 'secondary_sample_accession'], devserver)
+    found = set()
+    for hit in hits:
+        found.update(hit.values())
+    return found.intersection(sample_accessions)
+
+
 def search_samples_by_assembly_analysis(assembly_analysis_accession: str,
                                         devserver: bool) -> list:
     """
@@ -243,7 +399,7 @@ def search_samples_by_assembly_analysis(assembly_analysis_accession: str,
         "result": "analysis",
         "fields": "sample_accession"
     }
-    response = requests.get(url, params=params)
+    response = httpClient.get(url, params=params, endpoint='ENA portal search')
 
     try:
         sample_accession = response.text.split('\n')[1:-1][0]
@@ -280,7 +436,7 @@ def search_scientific_name_by_sample(sample_accession: str,
         "result": "sample",
         "fields": "scientific_name"
     }
-    response = requests.get(url, params=params)
+    response = httpClient.get(url, params=params, endpoint='ENA portal search')
     try:
         scientific_name = response.text.split('\n')[1:-1][0]
         scientific_name = scientific_name.split('\t')[0]
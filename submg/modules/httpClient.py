@@ -0,0 +1,271 @@
+import time
+import asyncio
+import threading
+import collections
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from submg.modules import loggingC
+from submg.modules.statConf import staticConfig
+
+
+# Responses with these status codes are retried with backoff
+RETRY_STATUS = (429, 500, 502, 503, 504)
+# Only these methods are retried after the request reached the server.
+# Repeating a drop-box POST could register objects twice.
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Global variables of the shared HTTP layer
+__session = None
+__session_lock = threading.Lock()
+__counters = collections.defaultdict(lambda: {'requests': 0,
+                                              'retries': 0,
+                                              'errors': 0,
+                                              'seconds': 0.0,
+                                              'max_seconds': 0.0})
+__counters_lock = threading.Lock()
+# Token buckets of rate limited endpoints, endpoint name as key
+__buckets = {}
+__buckets_lock = threading.Lock()
+
+
+def session() -> requests.Session:
+    """
+    Returns the session shared by all ENA calls. Its connections are kept
+    alive, so only the first call to a server pays for the TLS handshake.
+    """
+    global __session
+    with __session_lock:
+        if __session is None:
+            __session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=staticConfig.http_pool_size,
+                                  pool_maxsize=staticConfig.http_pool_size)
+            __session.mount('https://', adapter)
+            __session.mount('http://', adapter)
+        return __session
+
+
+def __count(endpoint: str,
+            seconds: float,
+            retries: int,
+            error: bool):
+    """
+    Add a finished request to the latency counters of its endpoint.
+    """
+    with __counters_lock:
+        counter = __counters[endpoint]
+        counter['requests'] += 1
+        counter['retries'] += retries
+        counter['errors'] += int(error)
+        counter['seconds'] += seconds
+        counter['max_seconds'] = max(counter['max_seconds'], seconds)
+
+
+def __acquire_token(endpoint: str,
+                    rate_limit: float):
+    """
+    Wait until the token bucket of an endpoint allows another request. All
+    threads share the bucket, so the endpoint sees at most rate_limit
+    requests per second no matter how many threads send them. The bucket
+    holds a single token, so requests are not sent in bursts.
+
+    Args:
+        endpoint (str): Name of the endpoint.
+        rate_limit (float): Allowed requests per second.
+    """
+    interval = 1.0 / rate_limit
+    with __buckets_lock:
+        now = time.monotonic()
+        # Time at which the next token becomes available
+        next_token = max(__buckets.get(endpoint, now), now)
+        __buckets[endpoint] = next_token + interval
+    wait = next_token - now
+    if wait > 0:
+        time.sleep(wait)
+
+
+def __backoff(attempt: int,
+              response=None) -> float:
+    """
+    Returns how long to wait before the next attempt. A Retry-After header
+    of the server is respected.
+    """
+    if response is not None:
+        retry_after = response.headers.get('Retry-After')
+        if retry_after is not None and retry_after.isdigit():
+            return float(retry_after)
+    return staticConfig.http_backoff * (2 ** attempt)
+
+
+def request(method: str,
+            url: str,
+            endpoint: str = None,
+            timeout=None,
+            rate_limit: float = None,
+            **kwargs) -> requests.Response:
+    """
+    Send a request through the shared session. Failed connections are
+    retried with exponential backoff. Responses with status 429 or 5xx are
+    retried as well, but only for idempotent methods. The response of the
+    last attempt is returned, exceptions of the last attempt are raised.
+
+    Args:
+        method (str): The HTTP method.
+        url (str): The URL.
+        endpoint (str, optional): Name of the endpoint in the latency
+            counters. Defaults to the method, host and path of the URL.
+        timeout (optional): Connect and read timeout in seconds. Defaults to
+            staticConfig.http_timeout.
+        rate_limit (float, optional): Maximum requests per second to this
+            endpoint, shared by all threads. Retries count as well. Defaults
+            to no limit.
+        **kwargs: Passed on to requests.Request (params, data, files, auth,
+            ...).
+
+    Returns:
+        requests.Response: The response.
+    """
+    method = method.upper()
+    if timeout is None:
+        timeout = staticConfig.http_timeout
+    s = session()
+    # The body is encoded once, so it can be sent again after a failure
+    prepared = s.prepare_request(requests.Request(method, url, **kwargs))
+    if endpoint is None:
+        endpoint = f"{method} {prepared.url.split('?')[0]}"
+
+    start = time.perf_counter()
+    attempt = 0
+    while True:
+        if rate_limit:
+            __acquire_token(endpoint, rate_limit)
+        try:
+            response = s.send(prepared, timeout=timeout)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            # Unless the connection could not be opened, the server might
+            # have processed the request already
+            can_retry = isinstance(e, requests.exceptions.ConnectTimeout) \
+                or method in IDEMPOTENT_METHODS
+            if attempt >= staticConfig.http_retries or not can_retry:
+                __count(endpoint, time.perf_counter() - start, attempt, True)
+                raise
+            wait = __backoff(attempt)
+            loggingC.message(f"\t...{endpoint} failed ({e}), retrying in {wait:.0f}s", threshold=1)
+        except requests.exceptions.RequestException:
+            __count(endpoint, time.perf_counter() - start, attempt, True)
+            raise
+        else:
+            if response.status_code not in RETRY_STATUS \
+                    or method not in IDEMPOTENT_METHODS \
+                    or attempt >= staticConfig.http_retries:
+                __count(endpoint, time.perf_counter() - start, attempt, response.status_code >= 400)
+                return response
+            wait = __backoff(attempt, response)
+            loggingC.message(f"\t...{endpoint} returned status {response.status_code}, retrying in {wait:.0f}s", threshold=1)
+        time.sleep(wait)
+        attempt += 1
+
+
+def get(url: str,
+        **kwargs) -> requests.Response:
+    """
+    Send a GET request, see request.
+    """
+    return request('GET', url, **kwargs)
+
+
+def post(url: str,
+         **kwargs) -> requests.Response:
+    """
+    Send a POST request, see request.
+    """
+    return request('POST', url, **kwargs)
+
+
+def options(url: str,
+            **kwargs) -> requests.Response:
+    """
+    Send an OPTIONS request, see request.
+    """
+    return request('OPTIONS', url, **kwargs)
+
+
+async def request_async(method: str,
+                        url: str,
+                        **kwargs) -> requests.Response:
+    """
+    Send a request from a coroutine. The request runs in a worker thread and
+    uses the same pooled session as request.
+
+    Args:
+        method (str): The HTTP method.
+        url (str): The URL.
+        **kwargs: See request.
+
+    Returns:
+        requests.Response: The response.
+    """
+    return await asyncio.to_thread(request, method, url, **kwargs)
+
+
+async def __gather(calls: list,
+                   concurrency: int) -> list:
+    """
+    Run requests concurrently, at most concurrency at a time.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(call):
+        method, url, kwargs = call
+        async with semaphore:
+            return await request_async(method, url, **kwargs)
+
+    return await asyncio.gather(*(limited(call) for call in calls))
+
+
+def fetch_all(calls: list,
+              concurrency: int = None) -> list:
+    """
+    Send many requests concurrently and wait for all of them. Must not be
+    called from a running event loop, use request_async there.
+
+    Args:
+        calls (list): Tuples of (method, url, kwargs), kwargs as for request.
+        concurrency (int, optional): Maximum number of requests in flight.
+            Defaults to staticConfig.http_pool_size.
+
+    Returns:
+        list: The responses, in the order of calls.
+    """
+    if len(calls) == 0:
+        return []
+    if concurrency is None:
+        concurrency = staticConfig.http_pool_size
+    return asyncio.run(__gather(calls, max(1, concurrency)))
+
+
+def latency_counters() -> dict:
+    """
+    Returns a copy of the latency counters, endpoint name as key.
+    """
+    with __counters_lock:
+        return {endpoint: dict(counter) for endpoint, counter in __counters.items()}
+
+
+def latency_message() -> str:
+    """
+    Describe the latency of all endpoints that were called.
+
+    Returns:
+        str: A table with one row per endpoint, empty if there were no calls.
+    """
+    counters = latency_counters()
+    if len(counters) == 0:
+        return ""
+    lines = [">HTTP requests to ENA:",
+             f"\t{'endpoint':<50}{'calls':>8}{'retries':>9}{'errors':>8}{'mean s':>9}{'max s':>9}"]
+    for endpoint, c in sorted(counters.items(), key=lambda item: -item[1]['seconds']):
+        mean = c['seconds'] / c['requests']
+        lines.append(f"\t{endpoint[:50]:<50}{c['requests']:>8}{c['retries']:>9}{c['errors']:>8}{mean:>9.2f}{c['max_seconds']:>9.2f}")
+    return "\n".join(lines)
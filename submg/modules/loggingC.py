@@ -3,26 +3,43 @@
 
 import os
 import sys
+import time
+import queue
+import atexit
+import threading
+
+from submg.modules.statConf import staticConfig
 
 # Global variables for logging
 logfile_path = None
 verbosity_level = None
 listeners = []
+# Messages are written to the logfile and passed to the listeners by a
+# background thread of the process that set up logging
+__queue = queue.Queue()
+__writer = None
+__owner_pid = None
 
 def set_up_logging(logging_dir: str,
                    verbose: int,
                    timestamp: str,
-                   listener=None):
+                   listener=None,
+                   resume=False):
     """
     Set up logging.
 
     Args:
         logfile: The path to the logfile.
         verbose: The verbosity level.
+        resume: If True, continue the log of an earlier run in the same
+            directory.
     """
     # Set up global variables
     global logfile_path
     global verbosity_level
+
+    # A previous log of this process is completed first
+    shutdown()
     
     verbosity_level = verbose
 
@@ -37,6 +54,13 @@ def set_up_logging(logging_dir: str,
     # Create a subdirectory for the current timestamp
     stamped_logging_dir = os.path.join(logging_dir, timestamp)
 
+    if resume:
+        logfile_path = os.path.join(stamped_logging_dir, 'submg.log')
+        with open(logfile_path, 'a') as f:
+            f.write('\n')
+        __start_writer()
+        return stamped_logging_dir
+
     # Check if the stamped logging dir already exists. Throw an error if it does
     if os.path.exists(stamped_logging_dir):
         print(f"\nERROR: Logging directory already exists: {stamped_logging_dir}")
@@ -53,10 +77,129 @@ def set_up_logging(logging_dir: str,
     # Create empty logfile
     with open(logfile_path, 'w') as f:
         f.write('')
+    __start_writer()
 
     return stamped_logging_dir
 
 
+def __start_writer():
+    """
+    Start the background thread that writes to the logfile. It keeps the
+    logfile open and flushes it every staticConfig.log_flush_interval
+    seconds, on flush() and when the program exits.
+    """
+    global __writer
+    global __owner_pid
+    handle = open(logfile_path, 'a', buffering=1024 * 1024)
+    __owner_pid = os.getpid()
+    __writer = threading.Thread(target=__write_messages,
+                                args=(handle,),
+                                name='submg-log-writer',
+                                daemon=True)
+    __writer.start()
+
+
+def __write_messages(handle):
+    """
+    Body of the writer thread. A message is a tuple of the text and whether it
+    is passed to the listeners. An Event asks for a flush and is set once the
+    logfile was flushed, None ends the thread.
+
+    Args:
+        handle: The open logfile.
+    """
+    last_flush = time.monotonic()
+    while True:
+        try:
+            item = __queue.get(timeout=staticConfig.log_flush_interval)
+        except queue.Empty:
+            item = threading.Event()
+        if item is None or isinstance(item, threading.Event):
+            try:
+                handle.flush()
+            except OSError as e:
+                print(f"\nERROR: Could not write to the logfile at {handle.name} ({e}).", file=sys.stderr)
+            last_flush = time.monotonic()
+            if item is None:
+                handle.close()
+                return
+            item.set()
+            continue
+        text, broadcast = item
+        try:
+            handle.write(f"{text}\n")
+            if time.monotonic() - last_flush > staticConfig.log_flush_interval:
+                handle.flush()
+                last_flush = time.monotonic()
+        except OSError as e:
+            print(f"\nERROR: Could not write to the logfile at {handle.name} ({e}).", file=sys.stderr)
+        if broadcast:
+            __notify_listeners(text)
+
+
+def __notify_listeners(text: str):
+    """
+    Pass a message to the listeners. A failing listener is reported but
+    does not stop the logging.
+
+    Args:
+        text: The message.
+    """
+    for listener in listeners:
+        try:
+            listener(text)
+        except Exception as e:
+            print(f"\nERROR: A log listener failed ({e!r}).", file=sys.stderr)
+
+
+def flush():
+    """
+    Wait until all messages logged so far are written to the logfile.
+    """
+    if __writer is None or not __writer.is_alive() or os.getpid() != __owner_pid:
+        return
+    done = threading.Event()
+    __queue.put(done)
+    done.wait()
+
+
+def shutdown():
+    """
+    Write all pending messages, close the logfile and stop the writer thread.
+    Runs automatically when the program exits.
+    """
+    global __writer
+    if __writer is None or os.getpid() != __owner_pid:
+        return
+    if __writer.is_alive():
+        __queue.put(None)
+        __writer.join()
+    __writer = None
+
+
+atexit.register(shutdown)
+
+
+def worker_state() -> tuple:
+    """
+    Returns what set_up_worker needs to log from a worker process.
+    """
+    return logfile_path, verbosity_level
+
+
+def set_up_worker(state: tuple):
+    """
+    Use the logfile of the main process in a worker process. Pass this as
+    the initializer of a process pool, with worker_state() as its argument.
+
+    Args:
+        state (tuple): The result of worker_state in the main process.
+    """
+    global logfile_path
+    global verbosity_level
+    logfile_path, verbosity_level = state
+
+
 def __add_listener(listener):
     """
     Add a listener function to receive log updates.
@@ -71,24 +214,34 @@ def message(message: str,
             threshold: int = -1):
     """
     Log a message to the logfile and print it to stdout if the verbosity level is high enough.
+    The logfile is written and the listeners are called by a background
+    thread, so this returns right away and can be called from any thread.
 
     Args:
         message:   The message to log.
         threshold: The verbosity level threshold.
     """
-    # Make sure the log file exists
-    if not os.path.isfile(logfile_path):
-        print(f"\nERROR: There should be a logfile at {logfile_path} but it seems to have been deleted.")
-        sys.exit(1)
+    # Commands other than submit do not set up logging, just print for them
+    if logfile_path is None:
+        if threshold < 1:
+            print(message)
+        return
+
+    broadcast = verbosity_level > threshold
+    if broadcast:
+        # print to stdout
+        print(message)
+
+    writer = __writer
+    if writer is not None and writer.is_alive() and os.getpid() == __owner_pid:
+        # The writer thread writes to the logfile and calls the listeners
+        __queue.put((message, broadcast))
+        return
 
-    # Write a new line to the logfile
+    # Worker processes, and the main process after shutdown or if the writer
+    # thread died, append to the logfile directly. A line written with a single call in append mode is
+    # not mixed up with lines of other processes.
     with open(logfile_path, 'a') as f:
         f.write(f"{message}\n")
-
-    # If verbosity level is high enough
-    if verbosity_level > threshold:
-        # print to stdout
-        print(message)
-        # broadcast to listeners
-        for listener in listeners:
-            listener(message)
+    if broadcast and os.getpid() == __owner_pid:
+        __notify_listeners(message)
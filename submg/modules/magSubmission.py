@@ -4,12 +4,9 @@ import sys
 
 import xml.etree.ElementTree as ET
 
-import gzip
-import requests
-import shutil
 
 from requests.auth import HTTPBasicAuth
-from submg.modules import loggingC, utility, binSubmission, webinWrapper
+from submg.modules import loggingC, utility, binSubmission, webinWrapper, stagingEngine, runJournal, httpClient, performanceReport
 from submg.modules.statConf import staticConfig
 
 
@@ -215,6 +212,7 @@ def __prep_mags_samplesheet(config: dict,
     return outpath
 
 
+@performanceReport.timed('samplesheet POST')
 def __submit_mags_samplesheet(samplesheet: str,
                               staging_dir: str,
                               logging_dir: str,
@@ -241,11 +239,12 @@ def __submit_mags_samplesheet(samplesheet: str,
     loggingC.message(">Submitting MAGs samplesheet through ENA API.", threshold=0)
     receipt_path = os.path.join(logging_dir, "MAGs_samplesheet_receipt.xml")
     usr, pwd = utility.get_login()
-    response = requests.post(url,
-                             files={
-                                 'SUBMISSION': open(submission_xml, 'rb'),
-                                 'SAMPLE': open(samplesheet, 'rb')
-                             }, auth=HTTPBasicAuth(usr, pwd))
+    response = httpClient.post(url,
+                               files={
+                                   'SUBMISSION': open(submission_xml, 'rb'),
+                                   'SAMPLE': open(samplesheet, 'rb')
+                               }, auth=HTTPBasicAuth(usr, pwd),
+                               endpoint='ENA drop-box')
     loggingC.message(f"\tHTTP status: {response.status_code}", threshold=1)
 
     # Process response
@@ -263,9 +262,11 @@ def __stage_mag_submission(metadata,
                            config: dict,
                            mag_sample_accession: str,
                            coverage: float,
-                           run_accessions: list) -> str:
+                           run_accessions: list,
+                           staging_jobs: list) -> str:
     """
-    Stages all files needed for MAG submission and writes a MANIFEST file.
+    Adds all files needed for MAG submission to staging_jobs and writes a
+    MANIFEST file.
 
     Args:
         metadata (dict): The metadata for the MAG.
@@ -275,6 +276,7 @@ def __stage_mag_submission(metadata,
         mag_sample_accession (str): The sample accession for the MAG.
         coverage (float): The coverage of the MAG.
         run_accessions (list): A list of the run accessions.
+        staging_jobs (list): Tuples of (source, target) for the stagingEngine.
 
     Returns:
         str: The path to the MANIFEST file.
@@ -309,22 +311,12 @@ def __stage_mag_submission(metadata,
     if not metadata['Chromosomes_path'] is None:
         chromsomes_target = os.path.join(staging_directory, 'CHROMOSOMES.tsv.gz')
         chromosomes_source = metadata['Chromosomes_path']
-        if chromosomes_source.endswith('.gz'):
-            shutil.copyfile(chromosomes_source, chromsomes_target)
-        else:
-            with open(chromosomes_source, 'rb') as f_in:
-                with gzip.open(chromsomes_target, 'wb', compresslevel=5) as f_out:
-                    f_out.writelines(f_in)
+        staging_jobs.append((chromosomes_source, chromsomes_target))
         rows.append(['CHROMOSOME_LIST', chromsomes_target])
         if not metadata['Unlocalised_path'] is None:
             unlocalised_target = os.path.join(staging_directory, 'UNLOCALISED.tsv.gz')
             unlocalised_source = metadata['Unlocalised_path']
-            if unlocalised_source.endswith('.gz'):
-                shutil.copyfile(unlocalised_source, unlocalised_target)
-            else:
-                with open(unlocalised_source, 'rb') as f_in:
-                    with gzip.open(unlocalised_target, 'wb', compresslevel=5) as f_out:
-                        f_out.writelines(f_in)
+            staging_jobs.append((unlocalised_source, unlocalised_target))
             rows.append(['UNLOCALISED_LIST', unlocalised_target])
 
 
@@ -336,24 +328,14 @@ def __stage_mag_submission(metadata,
         bins_directory = utility.from_config(config, 'BINS', 'BINS_DIRECTORY')
         bin_to_fasta = binSubmission.get_bins_in_dir(bins_directory)
         fasta = bin_to_fasta[mag_id]
-        if fasta.endswith('.gz'):
-            shutil.copyfile(fasta, gzipped_fasta_path)
-        else:
-            with open(fasta, 'rb') as f_in:
-                with gzip.open(gzipped_fasta_path, 'wb', compresslevel=5) as f_out:
-                    f_out.writelines(f_in)
+        staging_jobs.append((fasta, gzipped_fasta_path))
         rows.append(['FASTA', gzipped_fasta_path])
     else:
         flatfile_path = metadata['Flatfile_path']
         gzipped_flatfile_target = os.path.join(staging_directory, "mag"+f"asmbly_upload{staticConfig.zipped_emblff_extension}")
         print("Flatfile path is", flatfile_path)
         print("Gzipped flatfile target is", gzipped_flatfile_target)
-        if flatfile_path.endswith('.gz'):
-            shutil.copyfile(flatfile_path, gzipped_flatfile_target)
-        else:
-            with open(flatfile_path, 'rb') as f_in:
-                with gzip.open(gzipped_flatfile_target, 'wb', compresslevel=5) as f_out:
-                    f_out.writelines(f_in)
+        staging_jobs.append((flatfile_path, gzipped_flatfile_target))
         rows.append(['FLATFILE', gzipped_flatfile_target])
     
     # Write the Manifest
@@ -373,11 +355,11 @@ def submit_mags(config: dict,
                 bin_taxonomy_data: dict,
                 staging_dir: str,
                 logging_dir: str,
-                depth_files: str,
+                contig_table: dict,
                 bin_coverage_file: str,
-                threads: int = 4,
                 test: bool = True,
-                submit: bool = True) -> tuple:
+                submit: bool = True,
+                workers: int = 1) -> tuple:
     """
     Submits a samplesheet for all MAGs to ENA. Then submits each MAG as an
     individual analysis object using webin-cli.
@@ -392,15 +374,16 @@ def submit_mags(config: dict,
             name for each bin.
         staging_dir (str): The directory where the bins will be staged.
         logging_dir (str): The directory where the logs will be written to.
-        depth_files (list): A list of paths to the depth files. Either this or
-            bin_coverage_file must be specified.
+        contig_table (dict): The contig coverage table built from the BAM
+            files. Either this or bin_coverage_file must be specified.
         bin_coverage_file (str): Path to a tsv file with the coverage for each
-            bin. Either this or depth_files must be specified.
-        threads (int, optional): Number of threads to use for samtools. Defaults to 4.
+            bin. Either this or contig_table must be specified.
         test (bool, optional): If True, the ENA dev server will be used
             instead of the production server. Defaults to True.
         submit (bool, optional): If True, the bins will be submitted to ENA.
             Otherwise only validation will happen. Defaults to True.
+        workers (int, optional): Number of concurrent webin-cli submissions.
+            Defaults to 1.
     """
 
     if test:
@@ -418,10 +401,9 @@ def submit_mags(config: dict,
     # Get the coverage for each MAG
     loggingC.message(">Deriving MAG coverage", threshold=1)
     bin_files = binSubmission.get_bins_in_dir(bins_directory)
-    if not depth_files is None:
-        bin_coverages = binSubmission.bin_coverage_from_depth(depth_files,
-                                                              bin_files,
-                                                              threads=threads)
+    if not contig_table is None:
+        bin_coverages = binSubmission.bin_coverage_from_table(contig_table,
+                                                              bin_files)
     elif not bin_coverage_file is None:
         bin_coverages = binSubmission.bin_coverage_from_tsv(mag_metadata.keys(),
                                                             bin_coverage_file,
@@ -430,7 +412,7 @@ def submit_mags(config: dict,
     # Make a samplesheet for all MAGs
     loggingC.message(">Making MAG samplesheet", threshold=1)
     samples_submission_dir = os.path.join(staging_dir, 'mag_samplesheet')
-    os.makedirs(samples_submission_dir, exist_ok=False)
+    runJournal.makedirs(samples_submission_dir)
     samplesheet = __prep_mags_samplesheet(config,
                                           sample_accession_data,
                                           mag_metadata,
@@ -443,11 +425,13 @@ def submit_mags(config: dict,
     # Upload the samplesheet
     loggingC.message(">Starting MAG samplesheet upload", threshold=1)
     samples_logging_dir = os.path.join(logging_dir, 'mag_samplesheet')
-    os.makedirs(samples_logging_dir, exist_ok=False)
-    prefixmag_to_accession = __submit_mags_samplesheet(samplesheet,
-                                                       samples_logging_dir,
-                                                       samples_submission_dir,
-                                                       url)
+    runJournal.makedirs(samples_logging_dir)
+    prefixmag_to_accession = runJournal.run_step('mags:samplesheet',
+                                                 __submit_mags_samplesheet,
+                                                 samplesheet,
+                                                 samples_logging_dir,
+                                                 samples_submission_dir,
+                                                 url)
 
 
     # Remove the prefiexes
@@ -464,11 +448,12 @@ def submit_mags(config: dict,
     staging_directories = {}
     loggingC.message(">Staging MAG submission sequences and manifests...", threshold=0)
     mag_manifests = {}
+    staging_jobs = []
     for mag_id in mag_metadata.keys():
         mag_sample_accession = mag_to_accession[mag_id]
         mag_id_staging_directory = os.path.join(staging_dir, f"mag_{mag_id}_staging")
         staging_directories[mag_id] = mag_id_staging_directory
-        os.makedirs(mag_id_staging_directory, exist_ok=False)
+        runJournal.makedirs(mag_id_staging_directory)
         coverage = bin_coverages[mag_id]
         metadata = mag_metadata[mag_id]
         loggingC.message(f"\t...staging MAG {mag_id}", threshold=1)
@@ -478,26 +463,31 @@ def submit_mags(config: dict,
                                                        config,
                                                        mag_sample_accession,
                                                        coverage,
-                                                       run_accessions)
+                                                       run_accessions,
+                                                       staging_jobs)
+    stagingEngine.stage_files(staging_jobs)
 
     # Submit the MAGs
     loggingC.message(f">Using ENA Webin-CLI to submit MAGS.", threshold=0)
     usr, pwd = utility.get_login()
-    mag_receipts = {}
-    mag_accessions = {}
+    submissions = {}
     for mag_id, mag_staging_dir in staging_directories.items():
         mag_logging_dir = os.path.join(logging_dir, f"{mag_id}")
-        os.makedirs(mag_logging_dir, exist_ok=False)
+        runJournal.makedirs(mag_logging_dir)
         mag_manifest = mag_manifests[mag_id]
         assembly_name = utility.stamped_from_config(config, 'ASSEMBLY','ASSEMBLY_NAME')
         subdir_name = assembly_name + '_' + mag_id
-        mag_receipts[mag_id], mag_accessions[mag_id] = webinWrapper.webin_cli(manifest=mag_manifest,
-                                                                              inputdir=mag_staging_dir,
-                                                                              outputdir=mag_logging_dir,
-                                                                              username=usr,
-                                                                              password=pwd,
-                                                                              subdir_name=subdir_name,
-                                                                              submit=submit)
+        submissions[mag_id] = dict(manifest=mag_manifest,
+                                   inputdir=mag_staging_dir,
+                                   outputdir=mag_logging_dir,
+                                   username=usr,
+                                   password=pwd,
+                                   subdir_name=subdir_name,
+                                   submit=submit,
+                                   journal_key=f"mags:{mag_id}")
+    results = webinWrapper.webin_cli_pool(submissions, workers=workers)
+    mag_receipts = {mag_id: result[0] for mag_id, result in results.items()}
+    mag_accessions = {mag_id: result[1] for mag_id, result in results.items()}
     loggingC.message(f"\n>MAG submission completed!", threshold=0)
 
     # Process the results
@@ -0,0 +1,246 @@
+import os
+import json
+import time
+import functools
+import threading
+import contextlib
+from dataclasses import dataclass, field, asdict
+
+from submg.modules import loggingC
+from submg.modules.statConf import staticConfig
+
+
+# Names of the report files in the logging subdirectory
+REPORT_JSON = 'performance.json'
+REPORT_TABLE = 'performance.txt'
+
+# Global variables for the spans of the current run
+__spans = []
+__lock = threading.Lock()
+__local = threading.local()
+__run_start = time.time()
+__run_times = os.times()
+
+
+@dataclass
+class Span:
+    """
+    A timed stage of the run. CPU time and I/O are those of the thread that
+    ran the stage. Work of worker threads and processes is not included,
+    stages that use them record what they processed in counts instead.
+    process_cpu_seconds is the CPU time of the whole process and its
+    children during the stage, which includes concurrent stages.
+    """
+    name: str
+    label: str = None
+    parent: str = None
+    thread: str = None
+    start: float = None
+    wall_seconds: float = None
+    cpu_seconds: float = None
+    process_cpu_seconds: float = None
+    bytes_read: int = None
+    bytes_written: int = None
+    counts: dict = field(default_factory=dict)
+
+
+def start_run():
+    """
+    Forget the spans of an earlier run and start timing a new one.
+    """
+    global __run_start
+    global __run_times
+    with __lock:
+        __spans.clear()
+        __run_start = time.time()
+        __run_times = os.times()
+
+
+def __thread_io() -> tuple:
+    """
+    Returns the bytes the current thread read and wrote through system
+    calls, or (None, None) if the system does not report them (only Linux
+    does).
+    """
+    try:
+        with open('/proc/thread-self/io', 'r') as f:
+            values = dict(line.split(': ') for line in f.read().splitlines())
+        return int(values['rchar']), int(values['wchar'])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def __process_cpu() -> float:
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def __stack() -> list:
+    if not hasattr(__local, 'stack'):
+        __local.stack = []
+    return __local.stack
+
+
+@contextlib.contextmanager
+def span(name: str,
+         label: str = None):
+    """
+    Time a stage of the run. Spans can be nested, the innermost span of a
+    thread receives count() and label().
+
+    Args:
+        name (str): The stage. Spans with the same name are summed up in the
+            summary table.
+        label (str, optional): What the stage worked on, e.g. a file.
+
+    Yields:
+        Span: The span, filled in when the stage is done.
+    """
+    stack = __stack()
+    s = Span(name=name,
+             label=label,
+             parent=stack[-1].name if stack else None,
+             thread=threading.current_thread().name,
+             start=time.time() - __run_start)
+    stack.append(s)
+    wall = time.perf_counter()
+    cpu = time.thread_time()
+    process_cpu = __process_cpu()
+    read, written = __thread_io()
+    try:
+        yield s
+    finally:
+        s.wall_seconds = time.perf_counter() - wall
+        s.cpu_seconds = time.thread_time() - cpu
+        s.process_cpu_seconds = __process_cpu() - process_cpu
+        end_read, end_written = __thread_io()
+        if read is not None and end_read is not None:
+            s.bytes_read = end_read - read
+            s.bytes_written = end_written - written
+        stack.pop()
+        with __lock:
+            __spans.append(s)
+
+
+def timed(name: str):
+    """
+    Decorator that runs every call of a function in a span.
+
+    Args:
+        name (str): The stage, see span.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(key: str,
+          n: int = 1):
+    """
+    Add to a counter of the innermost span of the current thread, e.g. the
+    number of files or bytes it processed. Does nothing outside of a span.
+
+    Args:
+        key (str): Name of the counter.
+        n (int, optional): The amount to add. Defaults to 1.
+    """
+    stack = __stack()
+    if stack:
+        counts = stack[-1].counts
+        counts[key] = counts.get(key, 0) + n
+
+
+def label(text: str):
+    """
+    Set what the innermost span of the current thread works on.
+
+    Args:
+        text (str): The label.
+    """
+    stack = __stack()
+    if stack:
+        stack[-1].label = text
+
+
+def spans() -> list:
+    """
+    Returns the spans that are done, in the order they ended.
+    """
+    with __lock:
+        return list(__spans)
+
+
+def __mb(n_bytes) -> str:
+    if n_bytes is None:
+        return 'n/a'
+    return f"{n_bytes / 1024 / 1024:.1f}"
+
+
+def summary_table() -> str:
+    """
+    Sum up the spans of each stage.
+
+    Returns:
+        str: A table with one row per stage, in the order the stages first
+            started.
+    """
+    stages = {}
+    for s in sorted(spans(), key=lambda s: s.start):
+        stage = stages.setdefault(s.name, {'calls': 0, 'wall': 0.0, 'max': 0.0, 'cpu': 0.0,
+                                           'read': None, 'written': None, 'counts': {}})
+        stage['calls'] += 1
+        stage['wall'] += s.wall_seconds
+        stage['max'] = max(stage['max'], s.wall_seconds)
+        stage['cpu'] += s.cpu_seconds
+        if s.bytes_read is not None:
+            stage['read'] = (stage['read'] or 0) + s.bytes_read
+            stage['written'] = (stage['written'] or 0) + s.bytes_written
+        for key, n in s.counts.items():
+            stage['counts'][key] = stage['counts'].get(key, 0) + n
+    lines = [f"{'stage':<32}{'calls':>7}{'wall s':>10}{'max s':>10}{'cpu s':>10}{'read MB':>10}{'written MB':>12}  counts"]
+    for name, stage in stages.items():
+        counts = ', '.join(f"{key}={n}" for key, n in stage['counts'].items())
+        lines.append(f"{name[:32]:<32}{stage['calls']:>7}{stage['wall']:>10.1f}{stage['max']:>10.1f}{stage['cpu']:>10.1f}"
+                     f"{__mb(stage['read']):>10}{__mb(stage['written']):>12}  {counts}")
+    return "\n".join(lines)
+
+
+def write_report(logging_subdir: str) -> str:
+    """
+    Write all spans of the run to performance.json and the summary table to
+    performance.txt in the logging subdirectory.
+
+    Args:
+        logging_subdir (str): The logging subdirectory of the run.
+
+    Returns:
+        str: The summary table.
+    """
+    from submg.modules import httpClient
+
+    end_times = os.times()
+    report = {
+        'submg_version': staticConfig.submg_version,
+        'started': time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(__run_start)),
+        'wall_seconds': time.time() - __run_start,
+        'cpu_seconds': (end_times.user + end_times.system) - (__run_times.user + __run_times.system),
+        'children_cpu_seconds': (end_times.children_user + end_times.children_system)
+                                - (__run_times.children_user + __run_times.children_system),
+        'spans': [asdict(s) for s in sorted(spans(), key=lambda s: s.start)],
+        'http': httpClient.latency_counters(),
+    }
+    table = summary_table()
+    try:
+        with open(os.path.join(logging_subdir, REPORT_JSON), 'w') as f:
+            json.dump(report, f, indent=2)
+        with open(os.path.join(logging_subdir, REPORT_TABLE), 'w') as f:
+            f.write(f"Run started {report['started']}, {report['wall_seconds']:.1f}s wall time, "
+                    f"{report['cpu_seconds']:.1f}s CPU, {report['children_cpu_seconds']:.1f}s CPU of child processes\n\n")
+            f.write(table + "\n")
+    except OSError as e:
+        loggingC.message(f"WARNING: Could not write the performance report to {logging_subdir} ({e}).", threshold=0)
+    return table
@@ -197,13 +197,19 @@ def __check_samples(arguments: dict,
         err = f"\nERROR: The TITLEs in the SAMPLES section are not unique."
         loggingC.message(err, threshold=-1)
         checks_failed = True
-    # Does one of the sample titles already exist in ENA
+    # Does one of the sample titles already exist in ENA. All titles are
+    # looked up at once on each server.
+    existing_titles = set()
+    existing_aliases = set()
+    for devserver in {False, bool(testmode)}:
+        existing_titles.update(enaSearching.sample_title_accessions(titles, study, devserver))
+        existing_aliases.update(enaSearching.sample_alias_accessions(titles, study, devserver))
     for title in titles:
-        if enaSearching.sample_title_accession(title, study, False) or enaSearching.sample_title_accession(title, study, testmode):
+        if title in existing_titles:
             err = f"\nERROR: The sample title '{title}' was provided in the samples section but already exists on the ENA server as a sample title."
             loggingC.message(err, threshold=-1)
             checks_failed = True
-        if enaSearching.sample_alias_accession(title, study, False) or enaSearching.sample_title_accession(title, study, testmode):
+        if title in existing_aliases:
             err = f"\nERROR: The sample title '{title}' was provided in the samples section but already exists on the ENA server as a sample alias."
             loggingC.message(err, threshold=-1)
             checks_failed = True
@@ -246,6 +252,23 @@ def __check_read_type(paired: bool,
     else:
         mandatory_fields.append(('RELATED_SAMPLE_ACCESSION',  str),)
 
+    # Look up all run aliases and sample accessions at once on each server
+    study = utility.from_config(config, 'STUDY')
+    testmode = arguments['development_service']
+    all_aliases = [s['NAME'] for s in read_items if 'NAME' in s]
+    all_sample_accessions = [s['RELATED_SAMPLE_ACCESSION'] for s in read_items
+                             if 'RELATED_SAMPLE_ACCESSION' in s]
+    existing_aliases = set()
+    production_samples = set()
+    testmode_samples = set()
+    if all_aliases:
+        for devserver in {False, bool(testmode)}:
+            existing_aliases.update(enaSearching.run_alias_accessions(all_aliases, study, devserver))
+    if all_sample_accessions and not arguments['submit_samples']:
+        production_samples = enaSearching.existing_sample_accessions(all_sample_accessions, False)
+        if testmode and len(production_samples) < len(set(all_sample_accessions)):
+            testmode_samples = enaSearching.existing_sample_accessions(all_sample_accessions, testmode)
+
     read_aliases = []
     for s in read_items:
         # Check if all fields are present and not empty
@@ -255,9 +278,7 @@ def __check_read_type(paired: bool,
         # Check if the read name already exists as aliases in ENA
         read_alias = s['NAME']
         read_aliases.append(read_alias)
-        study = utility.from_config(config, 'STUDY')
-        testmode = arguments['development_service']
-        if enaSearching.run_alias_accession(read_alias, study, False) or enaSearching.run_alias_accession(read_alias, study, testmode):
+        if read_alias in existing_aliases:
             err = f"\nERROR: The NAME '{read_alias}' was provided in the reads section but already exists on the ENA server as a run alias."
             loggingC.message(err, threshold=-1)
             checks_failed = True
@@ -275,8 +296,8 @@ def __check_read_type(paired: bool,
         else:
             sample_accession = s['RELATED_SAMPLE_ACCESSION']
             # Do the samples exist in ENA
-            if not enaSearching.sample_accession_exists(sample_accession, False):
-                if not enaSearching.sample_accession_exists(sample_accession, testmode):
+            if not sample_accession in production_samples:
+                if not sample_accession in testmode_samples:
                     if testmode:
                         wrn = f"\nWARNING: The sample accession '{sample_accession}' cannot be found on the ENA server. This might be okay if you just created it on the development server. Consider using --skip-checks"
                         loggingC.message(wrn, threshold=-1)
@@ -1,15 +1,13 @@
 import os
 import csv
 import sys
+import concurrent.futures
 
-from submg.modules import loggingC, utility
+from submg.modules import loggingC, utility, stagingEngine, runJournal
 from submg.modules.utility import from_config, stamped_from_config
 from submg.modules.statConf import staticConfig
 from submg.modules.webinWrapper import webin_cli
 
-import shutil
-import gzip
-
 def __prep_reads_manifest(config: dict,
                           sample_accession_data,
                           data: dict,
@@ -79,30 +77,16 @@ def __prep_reads_manifest(config: dict,
     return manifest_path
 
 
-def __zipcopy(input: str,
-              output: str) -> None:
-    """
-    Copy a file, compressing it if the input file does not have a '.gz' extension.
-
-    Args:
-        input (str): The path to the input file.
-        output (str): The path to the output file.
-    """
-    if input.endswith('gz'):
-        shutil.copyfile(input, output)
-    else:
-        with open(input, 'rb') as f_in:
-            with gzip.open(output, 'wb', compresslevel=5) as f_out:
-                f_out.writelines(f_in)
-
-
 def __stage_reads_submission(config: dict,
                              sample_accession_data,
                              data: dict,
                              staging_dir: str,
-                             logging_dir: str) -> str:
+                             logging_dir: str,
+                             staging_jobs: list) -> str:
     """
-    Stage the reads for submission.
+    Prepare the staging of the reads for submission. The fastq files are not
+    staged here, instead they are added to staging_jobs so all read files
+    can be compressed together.
 
     Args:
         config (dict): The configuration dictionary.
@@ -113,6 +97,7 @@ def __stage_reads_submission(config: dict,
         staging_dir (str): The directory where the reads will be staged.
         logging_dir (str): The directory where the submission logs will be
             written.
+        staging_jobs (list): Tuples of (source, target) for the stagingEngine.
 
     Returns:
         str: The path to the manifest file.
@@ -126,9 +111,9 @@ def __stage_reads_submission(config: dict,
     else: # Paired-end reads
         fastq1_path = from_config(data, 'FASTQ1_FILE')
         fastq2_path = from_config(data, 'FASTQ2_FILE')
-    __zipcopy(fastq1_path, gzipped_fastq1_path)
+    staging_jobs.append((fastq1_path, gzipped_fastq1_path))
     if not fastq2_path is None:
-        __zipcopy(fastq2_path, gzipped_fastq2_path)
+        staging_jobs.append((fastq2_path, gzipped_fastq2_path))
 
     # Make the MANIFEST file
     manifest = __prep_reads_manifest(config,
@@ -145,9 +130,11 @@ def submit_reads(config,
                  staging_dir,
                  logging_dir,
                  test=True,
-                 minitest=False):
+                 minitest=False,
+                 workers=1):
     """
-    Submits the specified reads to ENA.
+    Submits the specified reads to ENA. Staging and uploading overlap: each
+    read set is uploaded as soon as it is staged.
 
     Args:
         config (dict): The configuration dictionary.
@@ -159,11 +146,15 @@ def submit_reads(config,
             written.
         test (bool, optional): If True, use the Webin test submission service
         (default is True).
+        minitest (bool, optional): If True, only submit the first read set of
+        each kind (default is False).
+        workers (int, optional): Number of concurrent uploads (default is 1).
 
     Returns:
         list: The accessions of the submitted reads.
     """
     read_manifests = {}
+    read_staging_jobs = {}
 
     counter = 0
     if 'PAIRED_END_READS' in config.keys():
@@ -171,14 +162,16 @@ def submit_reads(config,
         for i, data in enumerate(from_config(config, 'PAIRED_END_READS')):
             name = stamped_from_config(data, 'NAME').replace(' ', '_')
             read_set_staging_dir = os.path.join(staging_dir, f"reads_{name}")
-            os.makedirs(read_set_staging_dir, exist_ok=False)
+            runJournal.makedirs(read_set_staging_dir)
             read_set_logging_dir = os.path.join(logging_dir, f"reads_{name}")
-            os.makedirs(read_set_logging_dir, exist_ok=False)
+            runJournal.makedirs(read_set_logging_dir)
+            staging_jobs = read_staging_jobs.setdefault(name, [])
             manifest = __stage_reads_submission(config,
                                                 sample_accession_data,
                                                 data,
                                                 read_set_staging_dir,
-                                                read_set_logging_dir)                                                
+                                                read_set_logging_dir,
+                                                staging_jobs)                                                
             if not name in read_manifests:
                 read_manifests[name] = manifest  
             counter = i + 1
@@ -193,14 +186,16 @@ def submit_reads(config,
             i = counter + j
             name = stamped_from_config(data, 'NAME').replace(' ', '_')
             read_set_staging_dir = os.path.join(staging_dir, f"reads_{name}")
-            os.makedirs(read_set_staging_dir, exist_ok=False)
+            runJournal.makedirs(read_set_staging_dir)
             read_set_logging_dir = os.path.join(logging_dir, f"reads_{name}")
-            os.makedirs(read_set_logging_dir, exist_ok=False)
+            runJournal.makedirs(read_set_logging_dir)
+            staging_jobs = read_staging_jobs.setdefault(name, [])
             manifest = __stage_reads_submission(config,
                                                 sample_accession_data,
                                                 data,
                                                 read_set_staging_dir,
-                                                read_set_logging_dir)         
+                                                read_set_logging_dir,
+                                                staging_jobs)         
             
             if not name in read_manifests:
                 read_manifests[name] = manifest    
@@ -209,24 +204,45 @@ def submit_reads(config,
                 loggingC.message(msg, threshold=0)
                 break                                
 
-    # Upload the reads
+    # Stage and upload the reads. Each read set is uploaded as soon as it is
+    # staged, while the next read set is being compressed.
     loggingC.message(f">Using ENA Webin-CLI to submit reads.", threshold=0)
     usr, pwd = utility.get_login()
     read_receipts = {}
     read_accessions = {}
-    for name, manifest in read_manifests.items():
-        loggingC.message(f">Submitting file at {manifest}", threshold=2)
-        read_set_logging_dir = os.path.join(logging_dir, f"reads_{name}")
-
-        read_receipts[name], read_accessions[name] = webin_cli(manifest=manifest,
-                                                               inputdir=os.path.dirname(manifest),
-                                                               outputdir=read_set_logging_dir,
-                                                               username=usr,
-                                                               password=pwd,
-                                                               subdir_name=name,
-                                                               submit=True,
-                                                               test=test,
-                                                               context='reads')
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers))
+    try:
+        uploads = {}
+        for name, manifest in read_manifests.items():
+            # Read sets that were submitted by the run that is resumed are
+            # not submitted again, so their files are not needed
+            if not runJournal.completed(f"reads:{name}"):
+                loggingC.message(f">Staging read set {name}", threshold=1)
+                stagingEngine.stage_files(read_staging_jobs[name])
+            # Stop early if an upload failed in the meantime
+            for upload in uploads.values():
+                if upload.done():
+                    upload.result()
+            loggingC.message(f">Submitting file at {manifest}", threshold=2)
+            read_set_logging_dir = os.path.join(logging_dir, f"reads_{name}")
+            uploads[name] = executor.submit(webin_cli,
+                                            manifest=manifest,
+                                            inputdir=os.path.dirname(manifest),
+                                            outputdir=read_set_logging_dir,
+                                            username=usr,
+                                            password=pwd,
+                                            subdir_name=name,
+                                            submit=True,
+                                            test=test,
+                                            context='reads',
+                                            log_prefix=f"[{name}] ",
+                                            journal_key=f"reads:{name}")
+        for name, upload in uploads.items():
+            read_receipts[name], read_accessions[name] = upload.result()
+    except BaseException:
+        executor.shutdown(wait=True, cancel_futures=True)
+        raise
+    executor.shutdown(wait=True)
         
     loggingC.message("\n>Read submission completed!", threshold=0)
     loggingC.message(">Read receipt paths are:", threshold=1)
@@ -0,0 +1,179 @@
+import os
+import sys
+import json
+import time
+import threading
+
+from submg.modules import loggingC
+
+
+# Name of the journal inside the logging subdirectory of a submission
+JOURNAL_FILE = 'journal.jsonl'
+
+# Global variables for the journal of the current submission
+journal_path = None
+resuming = False
+__entries = {}
+__lock = threading.Lock()
+
+
+def __read_entries(path: str) -> dict:
+    """
+    Read a journal. A line that was cut off because the run was killed while
+    writing it is ignored.
+
+    Args:
+        path (str): The path to the journal.
+
+    Returns:
+        dict: Name of each step as key, its entry as value.
+    """
+    entries = {}
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            entries[entry['step']] = entry
+    return entries
+
+
+def load_run(logging_subdir: str) -> dict:
+    """
+    Read the settings of an earlier run from its journal, so the run can be
+    resumed. This happens before logging is set up.
+
+    Args:
+        logging_subdir (str): The logging subdirectory of the earlier run.
+
+    Returns:
+        dict: The settings that were recorded when the run started.
+    """
+    path = os.path.join(logging_subdir, JOURNAL_FILE)
+    if not os.path.isfile(path):
+        print(f"\nERROR: There is no submission journal at {path}. Only runs started with this version of subMG can be resumed.")
+        sys.exit(1)
+    entries = __read_entries(path)
+    if not 'run' in entries:
+        print(f"\nERROR: The submission journal at {path} does not describe a run.")
+        sys.exit(1)
+    return entries['run']['result']
+
+
+def set_up(logging_subdir: str,
+           run: dict,
+           resume: bool = False):
+    """
+    Set up the journal of the current submission. When resuming, the steps
+    that were completed earlier are read from the journal. Otherwise the
+    settings of the run are recorded.
+
+    Args:
+        logging_subdir (str): The logging subdirectory of the submission.
+        run (dict): The settings needed to resume the run.
+        resume (bool, optional): Whether an earlier run is resumed. Defaults
+            to False.
+    """
+    global journal_path
+    global resuming
+    global __entries
+    journal_path = os.path.join(logging_subdir, JOURNAL_FILE)
+    resuming = resume
+    if resume:
+        __entries = __read_entries(journal_path)
+        steps = len([step for step in __entries if step != 'run'])
+        loggingC.message(f">Resuming the submission, {steps} steps were already completed.", threshold=0)
+    else:
+        __entries = {}
+        record('run', run)
+
+
+def record(step: str,
+           result=None):
+    """
+    Append a completed step to the journal. The line is flushed to disk
+    before this returns, so the step survives a crash right after it.
+
+    Args:
+        step (str): A unique name of the step.
+        result: What the step produced, e.g. an accession. Must be JSON
+            serializable.
+    """
+    entry = {
+        'step': step,
+        'time': time.strftime("%Y-%m-%d %H:%M:%S"),
+        'result': result,
+    }
+    line = json.dumps(entry) + '\n'
+    with __lock:
+        __entries[step] = entry
+        if journal_path is None:
+            return
+        with open(journal_path, 'a') as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def completed(step: str) -> bool:
+    """
+    Check if a step was completed, in this run or in the run that is resumed.
+
+    Args:
+        step (str): The name of the step.
+
+    Returns:
+        bool: True if the step is in the journal.
+    """
+    with __lock:
+        return step in __entries
+
+
+def result(step: str):
+    """
+    Get what a completed step produced.
+
+    Args:
+        step (str): The name of the step.
+
+    Returns:
+        The result that was recorded for the step.
+    """
+    with __lock:
+        return __entries[step]['result']
+
+
+def run_step(step: str,
+             function,
+             *args,
+             **kwargs):
+    """
+    Run a step unless it is already in the journal, then record its result.
+
+    Args:
+        step (str): A unique name of the step.
+        function: The function to run.
+        *args: Positional arguments for the function.
+        **kwargs: Keyword arguments for the function.
+
+    Returns:
+        The result of the function or the recorded result of the step.
+    """
+    if completed(step):
+        loggingC.message(f">Skipping {step}, it was completed earlier.", threshold=0)
+        return result(step)
+    step_result = function(*args, **kwargs)
+    record(step, step_result)
+    return step_result
+
+
+def makedirs(path: str):
+    """
+    Create a directory of the submission. It may only exist already if an
+    earlier run is resumed.
+
+    Args:
+        path (str): The directory to create.
+    """
+    os.makedirs(path, exist_ok=resuming)
@@ -1,7 +1,7 @@
 import os
 import sys
 
-from submg.modules import loggingC, utility
+from submg.modules import loggingC, utility, runJournal, httpClient, performanceReport
 from submg.modules.utility import from_config, stamped_from_config
 from submg.modules.statConf import staticConfig
 
@@ -103,6 +103,7 @@ def __read_samplesheet_receipt(receipt_path: str) -> list:
     return sample_accessions
 
     
+@performanceReport.timed('samplesheet POST')
 def __submit_samplesheet(samplesheet: str,
                          staging_dir: str,
                          logging_dir: str,
@@ -131,11 +132,12 @@ def __submit_samplesheet(samplesheet: str,
 
     loggingC.message(">Submitting biological samples samplesheet through ENA API", threshold=0)
 
-    response = requests.post(url,
-                             files={
-                                'SUBMISSION': open(submission_xml, 'rb'),
-                                'SAMPLE': open(samplesheet, 'rb'),},
-                             auth=requests.auth.HTTPBasicAuth(usr, pwd))
+    response = httpClient.post(url,
+                               files={
+                                  'SUBMISSION': open(submission_xml, 'rb'),
+                                  'SAMPLE': open(samplesheet, 'rb'),},
+                               auth=requests.auth.HTTPBasicAuth(usr, pwd),
+                               endpoint='ENA drop-box')
     loggingC.message(f"\t...HTTP status: {response.status_code}", threshold=0)
     utility.api_response_check(response)
 
@@ -184,10 +186,12 @@ def submit_samples(config: dict,
     loggingC.message(">Uploading samplesheet for biological samples", threshold=0)
     sample_logging_dir = os.path.join(logging_dir, 'biological_samples')
     os.makedirs(sample_logging_dir, exist_ok=True)
-    sample_accessions = __submit_samplesheet(samplesheet,
-                                     sample_staging_dir,
-                                     sample_logging_dir,
-                                     url=url)
+    sample_accessions = runJournal.run_step('samples',
+                                            __submit_samplesheet,
+                                            samplesheet,
+                                            sample_staging_dir,
+                                            sample_logging_dir,
+                                            url=url)
     
     samples_accessions_file = os.path.join(sample_logging_dir, 'sample_preliminary_accessions.txt')
     with open(samples_accessions_file, 'w') as f:
@@ -0,0 +1,475 @@
+import os
+import sys
+import gzip
+import zlib
+import hashlib
+import collections
+import concurrent.futures
+try:
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:
+    HAS_FCNTL = False
+
+from yaspin import yaspin
+
+from submg.modules import loggingC, runJournal, performanceReport
+
+
+# Total number of threads used for compressing files, set from --threads
+threads = 4
+# Files are compressed in blocks of this many bytes. Each block becomes one
+# gzip member of the staged file. Concatenated members are a valid gzip file
+# and are accepted by ENA.
+BLOCK_SIZE = 32 * 1024 * 1024
+COMPRESS_LEVEL = 5
+# Buffer size for reading files that are verified or copied
+READ_BUFFER_SIZE = 16 * 1024 * 1024
+# zlib window bits for decompressing gzip members with header and trailer
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+# Name of the md5sum style checksum file written next to each MANIFEST
+CHECKSUM_FILE = 'CHECKSUMS.md5'
+# ioctl request to share the data blocks of a file (btrfs, XFS, ...)
+FICLONE = 0x40049409
+
+
+def set_threads(num_threads: int):
+    """
+    Set the number of threads used for staging.
+
+    Args:
+        num_threads (int): The total number of threads.
+    """
+    global threads
+    threads = max(1, num_threads)
+
+
+def __compress_block(block: bytes) -> bytes:
+    """
+    Compress a block of data into a single gzip member. zlib releases the
+    GIL while compressing, so blocks are compressed in parallel threads.
+
+    Args:
+        block (bytes): The uncompressed data.
+
+    Returns:
+        bytes: A complete gzip member.
+    """
+    return gzip.compress(block, compresslevel=COMPRESS_LEVEL, mtime=0)
+
+
+def __read_blocks(jobs: list):
+    """
+    Yield the blocks of all files that have to be compressed, in order.
+
+    Args:
+        jobs (list): Tuples of (source, target, compress).
+
+    Yields:
+        (int, bytes): The index of the job and the next block of its source.
+    """
+    for i, (source, _, compress) in enumerate(jobs):
+        if not compress:
+            continue
+        with open(source, 'rb') as f_in:
+            block = f_in.read(BLOCK_SIZE)
+            # An empty file still becomes a valid (empty) gzip file
+            yield i, block
+            while True:
+                block = f_in.read(BLOCK_SIZE)
+                if not block:
+                    break
+                yield i, block
+
+
+def __reflink(source: str,
+              target: str):
+    """
+    Create target as a copy-on-write clone of source. Raises OSError if the
+    filesystem does not support it.
+
+    Args:
+        source (str): The path to the input file.
+        target (str): The path of the clone.
+    """
+    if not HAS_FCNTL:
+        raise OSError("reflinks are not supported on this system")
+    with open(source, 'rb') as f_in:
+        try:
+            with open(target, 'xb') as f_out:
+                fcntl.ioctl(f_out.fileno(), FICLONE, f_in.fileno())
+        except FileExistsError:
+            raise
+        except OSError:
+            os.remove(target)
+            raise
+
+
+def __temporary_path(target: str) -> str:
+    """
+    Returns the path a staged file is written to before it is moved to its
+    target, so an existing file is never opened for writing.
+    """
+    return f"{target}.{os.getpid()}.tmp"
+
+
+def __verify_gzip_stream(source: str,
+                         target: str = None) -> str:
+    """
+    Read a gzip file once with large buffers. Every gzip member is
+    decompressed, which checks its CRC32 and ISIZE. The MD5 of the
+    compressed data is computed on the way. If target is given, the data is
+    also copied there in the same pass. The copy is written to a temporary
+    file that replaces the target once the file is verified.
+
+    Args:
+        source (str): The path to the gzip file.
+        target (str, optional): Where to copy the file to.
+
+    Returns:
+        str: The MD5 hex digest of the file.
+
+    Raises:
+        ValueError: If the file is not a complete and valid gzip file.
+    """
+    md5 = hashlib.md5()
+    decompressor = zlib.decompressobj(GZIP_WBITS)
+    in_member = False
+    f_out = open(__temporary_path(target), 'wb') if target else None
+    try:
+        with open(source, 'rb') as f_in:
+            while True:
+                buffer = f_in.read(READ_BUFFER_SIZE)
+                if not buffer:
+                    break
+                md5.update(buffer)
+                if f_out:
+                    f_out.write(buffer)
+                data = buffer
+                while data:
+                    if not in_member and not data.strip(b'\0'):
+                        # Some tools pad gzip files with zeros
+                        break
+                    in_member = True
+                    try:
+                        decompressor.decompress(data, READ_BUFFER_SIZE)
+                    except zlib.error as e:
+                        raise ValueError(str(e))
+                    data = decompressor.unconsumed_tail
+                    if decompressor.eof:
+                        data = decompressor.unused_data
+                        decompressor = zlib.decompressobj(GZIP_WBITS)
+                        in_member = False
+        if in_member:
+            raise ValueError("unexpected end of file")
+        if md5.digest() == hashlib.md5(b'').digest():
+            raise ValueError("empty file")
+    except BaseException:
+        if f_out:
+            f_out.close()
+            os.remove(f_out.name)
+        raise
+    if f_out:
+        f_out.close()
+        os.replace(f_out.name, target)
+    return md5.hexdigest()
+
+
+def __target_exists(target: str):
+    """
+    Stop if a file appeared at a target while staging. It might be a link to
+    the input file, so it is neither written to nor used.
+    """
+    err = f"\nERROR: {target} was created by another process while it was being staged. Please make sure no other submission uses the same staging directory."
+    loggingC.message(err, threshold=-1)
+    sys.exit(1)
+
+
+def __remove_staged(source: str,
+                    target: str):
+    """
+    Remove a file that an earlier run left at a target before staging it
+    again. The file might be a link to the input file, which must not be
+    written through.
+
+    Args:
+        source (str): The path to the input file.
+        target (str): The path of the staged file.
+    """
+    if not os.path.lexists(target):
+        return
+    if not os.path.islink(target) and os.path.realpath(target) == os.path.realpath(source):
+        err = f"\nERROR: The input file {source} is in the staging directory at the place of the staged file. Please move it or use a different staging directory."
+        loggingC.message(err, threshold=-1)
+        sys.exit(1)
+    os.remove(target)
+
+
+def __link_or_copy(source: str,
+                   target: str) -> str:
+    """
+    Put an already compressed file into the staging directory without
+    duplicating its data where possible. Tries a hardlink, a reflink and a
+    symlink (webin-cli follows it). If none of them works, the file has to
+    be copied, which is done while verifying it.
+
+    Args:
+        source (str): The path to the input file.
+        target (str): The path of the staged file.
+
+    Returns:
+        str: The method that was used, 'copy' if the file still has to be
+            copied.
+    """
+    try:
+        os.link(source, target)
+        return 'hardlink'
+    except FileExistsError:
+        __target_exists(target)
+    except OSError:
+        pass
+    try:
+        __reflink(source, target)
+        return 'reflink'
+    except FileExistsError:
+        __target_exists(target)
+    except OSError:
+        pass
+    try:
+        os.symlink(os.path.abspath(source), target)
+        return 'symlink'
+    except FileExistsError:
+        __target_exists(target)
+    except OSError:
+        pass
+    return 'copy'
+
+
+def __normalize_jobs(jobs: list) -> list:
+    """
+    Bring staging jobs to the form (source, target, compress). Files are
+    compressed unless their name ends in '.gz', if not stated otherwise.
+
+    Args:
+        jobs (list): Tuples of (source, target) or (source, target, compress).
+
+    Returns:
+        list: Tuples of (source, target, compress).
+    """
+    normalized = []
+    for job in jobs:
+        source, target = job[0], job[1]
+        compress = job[2] if len(job) > 2 and job[2] is not None else not source.endswith('.gz')
+        normalized.append((source, target, compress))
+    return normalized
+
+
+def __write_checksums(checksums: dict):
+    """
+    Write the MD5 of each staged file to a CHECKSUMS.md5 file (md5sum
+    format) in the directory of the file, next to its MANIFEST. Entries of
+    files staged earlier into the same directory are kept, unless the file
+    was staged again.
+
+    Args:
+        checksums (dict): Path of the staged file as key, MD5 as value.
+    """
+    by_directory = collections.defaultdict(dict)
+    for target, md5 in checksums.items():
+        by_directory[os.path.dirname(os.path.abspath(target))][os.path.basename(target)] = md5
+    for directory, entries in by_directory.items():
+        path = os.path.join(directory, CHECKSUM_FILE)
+        merged = {}
+        if os.path.isfile(path):
+            with open(path, 'r') as f:
+                for line in f:
+                    md5, _, name = line.rstrip('\n').partition('  ')
+                    if name:
+                        merged[name] = md5
+        merged.update(entries)
+        tmp_path = __temporary_path(path)
+        with open(tmp_path, 'w') as f:
+            for name, md5 in sorted(merged.items()):
+                f.write(f"{md5}  {name}\n")
+        os.replace(tmp_path, path)
+
+
+def __journal_step(target: str) -> str:
+    """
+    Returns the name under which a staged file is recorded in the run
+    journal.
+    """
+    return f"staged:{os.path.abspath(target)}"
+
+
+def __already_staged(source: str,
+                     target: str):
+    """
+    Check if a file was staged by the run that is resumed and can be reused.
+    This is the case if the source did not change and the staged file still
+    has the size it had.
+
+    Args:
+        source (str): The path to the input file.
+        target (str): The path of the staged file.
+
+    Returns:
+        str: The MD5 of the staged file or None if it has to be staged again.
+    """
+    step = __journal_step(target)
+    if not runJournal.resuming or not runJournal.completed(step):
+        return None
+    recorded = runJournal.result(step)
+    stat = os.stat(source)
+    if recorded['source'] != os.path.abspath(source) \
+            or recorded['size'] != stat.st_size \
+            or recorded['mtime_ns'] != stat.st_mtime_ns:
+        return None
+    if not os.path.exists(target) or os.path.getsize(target) != recorded['target_size']:
+        return None
+    return recorded['md5']
+
+
+def __record_staged(jobs: list,
+                    checksums: dict):
+    """
+    Record staged files in the run journal, so a resumed run can reuse them.
+
+    Args:
+        jobs (list): Tuples of (source, target, compress).
+        checksums (dict): Path of each staged file as key, its MD5 as value.
+    """
+    for source, target, _ in jobs:
+        stat = os.stat(source)
+        runJournal.record(__journal_step(target), {
+            'source': os.path.abspath(source),
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'target_size': os.path.getsize(target),
+            'md5': checksums[target],
+        })
+
+
+@performanceReport.timed('staging')
+def stage_files(jobs: list) -> dict:
+    """
+    Stage several files for upload in a single pass over each file. Files
+    that are already compressed are linked into the staging directory if
+    possible, otherwise copied. They are read once to verify every gzip
+    member and compute the MD5. All other files are split into blocks which
+    are gzipped in parallel, independent of the file they belong to. The
+    compressed blocks are written to their targets in order and hashed on
+    the way. At most two blocks per thread are held in memory at the same
+    time. The checksums are written to a CHECKSUMS.md5 file next to the
+    staged files. When resuming a run, files it already staged are reused.
+
+    Args:
+        jobs (list): Tuples of (source, target) or (source, target, compress).
+
+    Returns:
+        dict: Path of each staged file as key, its MD5 as value.
+    """
+    reused = {}
+    remaining = []
+    for source, target, compress in __normalize_jobs(jobs):
+        md5 = __already_staged(source, target)
+        if md5 is None:
+            # Left behind by an earlier run, possibly before it was complete
+            __remove_staged(source, target)
+            remaining.append((source, target, compress))
+        else:
+            loggingC.message(f"\t...reusing {target} staged by the earlier run", threshold=1)
+            reused[target] = md5
+    jobs = remaining
+    if len(jobs) == 0:
+        return reused
+    checksums = {}
+    n_compress = len([job for job in jobs if job[2]])
+    total_size = sum(os.path.getsize(source) for source, _, _ in jobs)
+    performanceReport.count('files', len(jobs))
+    performanceReport.count('reused_files', len(reused))
+    performanceReport.count('source_bytes', total_size)
+    msg = f"Staging {len(jobs)} files ({total_size / 1024 / 1024:.0f} MB) with {threads} threads...\t"
+
+    # Blocks are written in the order of the jobs, so only one target is
+    # open at a time. Each target is written to a temporary file first.
+    current = {'index': None, 'file': None, 'md5': None}
+
+    def close_current():
+        if current['file'] is not None:
+            current['file'].close()
+            target = jobs[current['index']][1]
+            os.replace(current['file'].name, target)
+            checksums[target] = current['md5'].hexdigest()
+            current['file'] = None
+
+    def discard_current():
+        if current['file'] is not None:
+            current['file'].close()
+            os.remove(current['file'].name)
+            current['file'] = None
+
+    def write(i, future):
+        if current['index'] != i:
+            close_current()
+            current['index'] = i
+            current['file'] = open(__temporary_path(jobs[i][1]), 'wb')
+            current['md5'] = hashlib.md5()
+        member = future.result()
+        current['file'].write(member)
+        current['md5'].update(member)
+
+    with yaspin(text=msg, color="yellow"), \
+            concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
+        verifications = {}
+        for source, target, compress in jobs:
+            if not compress:
+                method = __link_or_copy(source, target)
+                loggingC.message(f"\t...staged {source} ({method})", threshold=1)
+                copy_target = target if method == 'copy' else None
+                verifications[target] = (source, executor.submit(__verify_gzip_stream, source, copy_target))
+
+        if n_compress > 0:
+            try:
+                pending = collections.deque()
+                for i, block in __read_blocks(jobs):
+                    pending.append((i, executor.submit(__compress_block, block)))
+                    while len(pending) >= 2 * threads:
+                        write(*pending.popleft())
+                while pending:
+                    write(*pending.popleft())
+                close_current()
+            except BaseException:
+                discard_current()
+                raise
+
+        for target, (source, future) in verifications.items():
+            try:
+                checksums[target] = future.result()
+            except ValueError as e:
+                err = f"\nERROR: {source} is not a valid gzip file ({e}). The file might be truncated or corrupted."
+                loggingC.message(err, threshold=-1)
+                sys.exit(1)
+
+    __write_checksums(checksums)
+    __record_staged(jobs, checksums)
+    checksums.update(reused)
+    return checksums
+
+
+def stage_file(source: str,
+               target: str,
+               compress: bool = None):
+    """
+    Stage a single file for upload, see stage_files.
+
+    Args:
+        source (str): The path to the input file.
+        target (str): The path of the staged file.
+        compress (bool, optional): Whether to gzip the file. By default,
+            files are compressed unless their name ends in '.gz'.
+
+    Returns:
+        str: The MD5 of the staged file.
+    """
+    return stage_files([(source, target, compress)])[target]
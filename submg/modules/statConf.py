@@ -43,6 +43,16 @@ class staticConfig:
     max_assembly_name_length: int = 50 - len('webin-genome-' + '_SAMEA________')
     timestamp_length: int = 4
     ena_rest_rate_limit: int = 50 # requests per second
+    coverage_cache_max_mb: int = 512 # size limit of the persistent coverage cache
+    webin_cli_class_sharing: bool = True # share loaded webin-cli classes between JVM starts
+    http_pool_size: int = 10 # connections kept alive per ENA server
+    http_timeout: tuple = (10, 300) # connect and read timeout of ENA calls in seconds
+    http_retries: int = 4 # retries of failed ENA calls
+    http_backoff: float = 1.0 # seconds before the first retry, doubled for every retry
+    taxonomy_cache_ttl_days: int = 30 # age after which cached ENA taxonomy answers are fetched again
+    taxonomy_cache_max_entries: int = 100000 # size limit of the persistent taxonomy cache
+    log_flush_interval: float = 1.0 # seconds between writes of buffered log messages to the logfile
+    ena_search_max_query_length: int = 2000 # characters of a batched ENA portal query, longer batches are split
     submission_modes_message: str = """
         The following modes of submission are supported:
 
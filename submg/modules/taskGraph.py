@@ -0,0 +1,116 @@
+import time
+import concurrent.futures
+from dataclasses import dataclass, field
+
+from submg.modules import loggingC, performanceReport
+
+
+@dataclass
+class Task:
+    """
+    A step of the submission. The function is called with a dict that maps
+    the names of the dependencies to their results.
+    """
+    name: str
+    function: object
+    dependencies: list = field(default_factory=list)
+    result: object = None
+    start: float = None
+    end: float = None
+
+
+def run_tasks(tasks: list) -> dict:
+    """
+    Run tasks as soon as all of their dependencies are done, so independent
+    tasks overlap. If a task fails, tasks that did not start yet are not run
+    and the error is raised once the running tasks are done.
+
+    Args:
+        tasks (list): The tasks. Dependencies must refer to tasks in this
+            list.
+
+    Returns:
+        dict: Name of each task as key, its result as value.
+    """
+    by_name = {task.name: task for task in tasks}
+    for task in tasks:
+        for dependency in task.dependencies:
+            if not dependency in by_name:
+                raise ValueError(f"Task {task.name} depends on unknown task {dependency}")
+
+    def run(task):
+        task.start = time.time()
+        try:
+            with performanceReport.span(f"task: {task.name}"):
+                return task.function({d: by_name[d].result for d in task.dependencies})
+        finally:
+            task.end = time.time()
+
+    done = set()
+    waiting = list(tasks)
+    running = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, len(tasks))) as executor:
+        while waiting or running:
+            for task in [t for t in waiting if all(d in done for d in t.dependencies)]:
+                waiting.remove(task)
+                loggingC.message(f">Starting: {task.name}", threshold=2)
+                running[executor.submit(run, task)] = task
+            if not running:
+                names = ', '.join(task.name for task in waiting)
+                raise ValueError(f"Tasks with circular dependencies: {names}")
+            finished, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in finished:
+                task = running.pop(future)
+                try:
+                    task.result = future.result()
+                except BaseException:
+                    waiting.clear()
+                    concurrent.futures.wait(running)
+                    raise
+                done.add(task.name)
+    return {task.name: task.result for task in tasks}
+
+
+def critical_path(tasks: list) -> list:
+    """
+    Find the chain of tasks that determined how long the run took. Starting
+    from the task that finished last, we follow the dependency that finished
+    last, since that is the one the task waited for.
+
+    Args:
+        tasks (list): Tasks that were run with run_tasks.
+
+    Returns:
+        list: The tasks on the critical path, in the order they ran.
+    """
+    by_name = {task.name: task for task in tasks}
+    finished = [task for task in tasks if task.end is not None]
+    if len(finished) == 0:
+        return []
+    path = [max(finished, key=lambda task: task.end)]
+    while path[-1].dependencies:
+        path.append(max((by_name[d] for d in path[-1].dependencies),
+                        key=lambda task: task.end))
+    return path[::-1]
+
+
+def critical_path_message(tasks: list) -> str:
+    """
+    Describe the critical path of a run.
+
+    Args:
+        tasks (list): Tasks that were run with run_tasks.
+
+    Returns:
+        str: A table with the start and duration of each task on the path.
+    """
+    path = critical_path(tasks)
+    if len(path) == 0:
+        return ""
+    first_start = min(task.start for task in tasks if task.start is not None)
+    total = path[-1].end - first_start
+    work = sum(task.end - task.start for task in tasks if task.end is not None)
+    lines = [f">Critical path of the submission ({total:.1f}s wall time, {work:.1f}s of work in all steps):"]
+    for task in path:
+        lines.append(f"\t{task.name:<40} started at {task.start - first_start:>8.1f}s, took {task.end - task.start:>8.1f}s")
+    return "\n".join(lines)
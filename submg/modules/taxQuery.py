@@ -1,14 +1,16 @@
 import os
 import csv
-import requests
-import time
 import re
 import sys
+import concurrent.futures
 
 from tqdm import tqdm
-from submg.modules import utility, loggingC, binSubmission
+from submg.modules import utility, loggingC, binSubmission, httpClient, taxonomyCache, taxonomyIndex, performanceReport
 from submg.modules.statConf import staticConfig
 
+# If True, taxonomy is only resolved with the local taxonomy index
+offline = False
+
 
 def __is_whole_word(term, text):
     """Return True if *term* appears as a whole word in *text* (case‑insensitive)."""
@@ -387,24 +389,21 @@ def __filter_ena_suggestions(level: str,
 
 
 
-def __ena_taxonomy_suggestion(level: str,
-                            domain: str,
-                            classification: str,
-                            filtered: bool = True) -> list:
+def __suggestion_query(level: str,
+                       domain: str,
+                       classification: str) -> str:
     """ 
-    Based on the query string, use the ENA REST API to get a suggestion for the
-    taxonomy. An exception for deltaproteobacteria family doesn't seem to be
-    necessary when using the suggest_for_submission API.
+    Build the query string for the ENA suggest-for-submission API. An
+    exception for deltaproteobacteria family doesn't seem to be necessary
+    when using this API.
 
     Args:
         level (str): The taxonomic level of the query string.
         domain (str): The domain of the query string.
         classification (str): The query string.
-        filtered (bool, optional): If True, only return the best suggestion.
-            Defaults to True.
 
     Returns:
-        list: A list of dictionaries with the suggestions from the ENA REST API.
+        str: The query.
     """
     # If we know the species we just query for that.
     if level == 'species':
@@ -443,9 +442,35 @@ def __ena_taxonomy_suggestion(level: str,
             query = classification
         else:
             query = f"{classification} {dstring}"    
+    return query
 
+
+def __ena_taxonomy_suggestion(level: str,
+                            domain: str,
+                            classification: str) -> list:
+    """ 
+    Based on the query string, use the ENA REST API to get all suggestions
+    for the taxonomy. Use __filter_ena_suggestions to get the suitable ones.
+    Requests from all threads together stay below
+    staticConfig.ena_rest_rate_limit. Answers are kept in the persistent
+    taxonomy cache.
+
+    Args:
+        level (str): The taxonomic level of the query string.
+        domain (str): The domain of the query string.
+        classification (str): The query string.
+
+    Returns:
+        list: A list of dictionaries with the suggestions from the ENA REST API.
+    """
+    query = __suggestion_query(level, domain, classification)
+    suggestions = taxonomyCache.get(taxonomyCache.SUGGESTION, query)
+    if suggestions is not None:
+        return suggestions
     url = f"https://www.ebi.ac.uk/ena/taxonomy/rest/suggest-for-submission/{query}"
-    response = requests.get(url)
+    response = httpClient.get(url,
+                              endpoint='ENA taxonomy suggest-for-submission',
+                              rate_limit=staticConfig.ena_rest_rate_limit)
     if response.status_code == 200:
         raw = response.json()
 
@@ -457,9 +482,7 @@ def __ena_taxonomy_suggestion(level: str,
                 "scientificName": s.get("scientificName", "N/A"),
                 "displayName": s.get("displayName", "N/A"),
             })
-        if filtered:
-            suggestions = __filter_ena_suggestions(level, domain, classification, suggestions)
-
+        taxonomyCache.put(taxonomyCache.SUGGESTION, query, suggestions)
         return suggestions
     else:
         err = f"\nERROR: Trying to fetch taxonomy suggestion for {level}: {classification} (domain: {domain}) but ENA REST API returned status code {response.status_code}"
@@ -468,6 +491,39 @@ def __ena_taxonomy_suggestion(level: str,
         sys.exit(1)
     
 
+def __local_taxonomy_suggestion(level: str,
+                                domain: str,
+                                classification: str) -> list:
+    """
+    Look up the names that ENA would suggest in the local taxonomy index built
+    with build-taxdb. These are the query of __suggestion_query and its
+    "Candidatus" variant, so __filter_ena_suggestions applies to the result
+    the same way as to the suggestions of the ENA REST API.
+
+    Args:
+        level (str): The taxonomic level of the query string.
+        domain (str): The domain of the query string.
+        classification (str): The query string.
+
+    Returns:
+        list: A list of dictionaries in the format of
+            __ena_taxonomy_suggestion.
+    """
+    query = __suggestion_query(level, domain, classification)
+    names = [query]
+    if not level == 'domain' and not domain == 'metagenome':
+        names.append(f"Candidatus {query}")
+    suggestions = []
+    for name in names:
+        for scientific_name, tax_id in taxonomyIndex.lookup(name):
+            suggestions.append({
+                "tax_id": tax_id,
+                "scientificName": scientific_name,
+                "displayName": scientific_name,
+            })
+    return suggestions
+
+
 def __parse_classification_tsvs(ncbi_taxonomy_files: list) -> dict:
     """
     Read the output of GTDB-TKs 'gtdb_to_ncbi_majority_vote.py' script or a file
@@ -490,6 +546,98 @@ def __parse_classification_tsvs(ncbi_taxonomy_files: list) -> dict:
     return all_classifications
 
 
+def __fetch_suggestions(keys: list) -> dict:
+    """
+    Get the ENA suggestions for several classifications concurrently. If a
+    local taxonomy index exists, classifications with a unique match in it
+    are resolved without querying ENA. Other classifications are sent to ENA
+    unless offline is set.
+
+    Args:
+        keys (list): Distinct tuples of (level, domain, classification).
+
+    Returns:
+        dict: The tuple as key, all suggestions of ENA as value.
+    """
+    all_ena_suggestions = {}
+    if taxonomyIndex.available():
+        remaining = []
+        for key in keys:
+            suggestions = __local_taxonomy_suggestion(*key)
+            if offline or len(__filter_ena_suggestions(*key, suggestions)) == 1:
+                all_ena_suggestions[key] = suggestions
+            else:
+                remaining.append(key)
+        loggingC.message(f"\t...{len(all_ena_suggestions)} classifications resolved with the local taxonomy index", threshold=1)
+        keys = remaining
+    if len(keys) == 0:
+        return all_ena_suggestions
+
+    # tqdm can crash in Windows GUI / PyInstaller --noconsole, because stdout/stderr can be None.
+    tqdm_file = None
+
+    if sys.stderr is not None:
+        tqdm_file = sys.stderr
+    elif sys.stdout is not None:
+        tqdm_file = sys.stdout
+    elif getattr(sys, "__stderr__", None) is not None:
+        tqdm_file = sys.__stderr__
+    elif getattr(sys, "__stdout__", None) is not None:
+        tqdm_file = sys.__stdout__
+
+    use_tqdm = True
+    if tqdm_file is None:
+        use_tqdm = False
+    else:
+        if not hasattr(tqdm_file, "write"):
+            use_tqdm = False
+        if not hasattr(tqdm_file, "flush"):
+            use_tqdm = False
+
+    # The queries run concurrently, the rate limit of the ENA API is
+    # enforced by httpClient.
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=staticConfig.http_pool_size)
+    futures = {executor.submit(__ena_taxonomy_suggestion, *key): key for key in keys}
+    iterator = concurrent.futures.as_completed(futures)
+    if use_tqdm:
+        iterator = tqdm(
+            iterator,
+            total=len(futures),
+            leave=False,
+            file=tqdm_file
+        )
+
+    try:
+        for future in iterator:
+            all_ena_suggestions[futures[future]] = future.result()
+    except BaseException:
+        executor.shutdown(wait=True, cancel_futures=True)
+        raise
+    executor.shutdown(wait=True)
+
+    return all_ena_suggestions
+
+
+def warm_taxonomy_cache(ncbi_taxonomy_files: list) -> int:
+    """
+    Fetch the ENA suggestions for all classifications in NCBI taxonomy files
+    into the taxonomy cache, so later submissions do not need to query ENA.
+
+    Args:
+        ncbi_taxonomy_files (list): Files in the format of NCBI_TAXONOMY_FILES.
+
+    Returns:
+        int: The number of distinct classifications.
+    """
+    classifications = __parse_classification_tsvs(ncbi_taxonomy_files)
+    keys = set()
+    for taxonomy in classifications.values():
+        keys.add((taxonomy['level'], taxonomy['domain'], taxonomy['classification']))
+    __fetch_suggestions(sorted(keys))
+    return len(keys)
+
+
+@performanceReport.timed('taxonomy')
 def get_bin_taxonomy(filtered_bins, config) -> dict:
     """
     Based on the NCBI taxonomy files and manual taxonomy file defined in the
@@ -553,76 +701,45 @@ def get_bin_taxonomy(filtered_bins, config) -> dict:
     loggingC.message(">Querying ENA for taxids and scientific names for each bin.", threshold=0)
 
     issues = []
-    min_interval = 1.0 / staticConfig.ena_rest_rate_limit
-    last_request_time = time.time() - min_interval
-
-    # tqdm can crash in Windows GUI / PyInstaller --noconsole, because stdout/stderr can be None.
-    tqdm_file = None
-
-    if sys.stderr is not None:
-        tqdm_file = sys.stderr
-    elif sys.stdout is not None:
-        tqdm_file = sys.stdout
-    elif getattr(sys, "__stderr__", None) is not None:
-        tqdm_file = sys.__stderr__
-    elif getattr(sys, "__stdout__", None) is not None:
-        tqdm_file = sys.__stdout__
 
-    use_tqdm = True
-    if tqdm_file is None:
-        use_tqdm = False
-    else:
-        if not hasattr(tqdm_file, "write"):
-            use_tqdm = False
-        if not hasattr(tqdm_file, "flush"):
-            use_tqdm = False
-
-    if use_tqdm:
-        iterator = tqdm(
-            annotated_bin_taxonomies.items(),
-            leave=False,
-            file=tqdm_file
-        )
-    else:
-        iterator = annotated_bin_taxonomies.items()
-
-
-    for bin_name, taxonomy in iterator:
+    # Bins that share a classification share a single query
+    queries = {}
+    for bin_name, taxonomy in annotated_bin_taxonomies.items():
         # Only check the bins that we actually want to submit
         if bin_name not in filtered_bins:
             continue
-        # Make sure we don't run into the ENA API rate limit
-        current_time = time.time()
-        time_since_last_request = current_time - last_request_time
-        if time_since_last_request < min_interval:
-            time.sleep(min_interval - time_since_last_request)
-        last_request_time = time.time()
-
-        # Get Taxonomy
         if bin_name in upload_taxonomy_data:
             loggingC.message(f">INFO: Bin {bin_name} was found in the manual taxonomy file and will be skipped.", threshold=1)
             continue
-        suggestions = __ena_taxonomy_suggestion(taxonomy['level'],
-                                              taxonomy['domain'],
-                                              taxonomy['classification'],
-                                              filtered=True)
-        if len(suggestions) == 1:
-            upload_taxonomy_data[bin_name] = {
-                'scientific_name': suggestions[0]['scientificName'],
-                'tax_id': suggestions[0]['tax_id'],
-            }
-        else:
-            all_ena_suggestions = __ena_taxonomy_suggestion(taxonomy['level'],
-                                                          taxonomy['domain'],
-                                                          taxonomy['classification'],
-                                                          filtered=False)
-
-            issues.append({
-                'mag_bin': bin_name,
-                'level': taxonomy['level'],
-                'classification': taxonomy['classification'],
-                'suggestions': all_ena_suggestions,
-            })
+        key = (taxonomy['level'], taxonomy['domain'], taxonomy['classification'])
+        queries.setdefault(key, []).append(bin_name)
+    loggingC.message(f"\t...{len(queries)} distinct classifications", threshold=1)
+    performanceReport.count('bins', sum(len(bin_names) for bin_names in queries.values()))
+    performanceReport.count('queries', len(queries))
+
+    all_ena_suggestions = __fetch_suggestions(list(queries.keys()))
+
+    # One response serves both the filtered suggestions and, if they are
+    # not unique, the full list that is shown to the user.
+    filtered_suggestions = {
+        key: __filter_ena_suggestions(*key, suggestions)
+        for key, suggestions in all_ena_suggestions.items()
+    }
+    for key, bin_names in queries.items():
+        suggestions = filtered_suggestions[key]
+        for bin_name in bin_names:
+            if len(suggestions) == 1:
+                upload_taxonomy_data[bin_name] = {
+                    'scientific_name': suggestions[0]['scientificName'],
+                    'tax_id': suggestions[0]['tax_id'],
+                }
+            else:
+                issues.append({
+                    'mag_bin': bin_name,
+                    'level': key[0],
+                    'classification': key[2],
+                    'suggestions': all_ena_suggestions[key],
+                })
 
     # Add any bins that are missing from the taxonomy files als unclassified
     for bin_name in filtered_bins:
@@ -649,15 +766,29 @@ def get_bin_taxonomy(filtered_bins, config) -> dict:
 
 def taxid_from_scientific_name(scientific_name: str) -> str:
     """
-    Get the taxid for a given scientific name from the ENA API. Returns None
-    if no taxid is found.
+    Get the taxid for a given scientific name from the local taxonomy index
+    or the ENA API. Returns None if no taxid is found. Answers of the API are
+    kept in the persistent taxonomy cache.
 
     Args:
         scientific_name (str): The scientific name to query for.
     """
-    url = f"https://www.ebi.ac.uk/ena/taxonomy/rest/scientific-name/{scientific_name}"
-    response = requests.get(url)
-    items = response.json()
+    if taxonomyIndex.available():
+        matches = [tax_id for name, tax_id in taxonomyIndex.lookup(scientific_name)
+                   if name == scientific_name]
+        if len(matches) == 1:
+            return matches[0]
+        if offline:
+            return None
+    items = taxonomyCache.get(taxonomyCache.SCIENTIFIC_NAME, scientific_name)
+    if items is None:
+        url = f"https://www.ebi.ac.uk/ena/taxonomy/rest/scientific-name/{scientific_name}"
+        response = httpClient.get(url,
+                                  endpoint='ENA taxonomy scientific-name',
+                                  rate_limit=staticConfig.ena_rest_rate_limit)
+        items = response.json()
+        if response.status_code == 200:
+            taxonomyCache.put(taxonomyCache.SCIENTIFIC_NAME, scientific_name, items)
     if not (len(items) == 1):
         return None
     if not (scientific_name == items[0]['scientificName']):
@@ -0,0 +1,166 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+from submg.modules import loggingC
+from submg.modules.webinWrapper import get_persistent_storage_path
+from submg.modules.statConf import staticConfig
+
+
+# Answers of the ENA taxonomy API are stored per kind of query
+SUGGESTION = 'suggest-for-submission'
+SCIENTIFIC_NAME = 'scientific-name'
+
+# Global variables for the cache connection
+enabled = True
+__connection = None
+__lock = threading.Lock()
+
+
+def cache_file() -> str:
+    """
+    Returns the path of the SQLite database of the taxonomy cache.
+    """
+    return os.path.join(get_persistent_storage_path(), 'taxonomy_cache.sqlite')
+
+
+def __connect():
+    """
+    Open the cache database once and create its table. If that fails, the
+    cache is disabled for this run and queries go to ENA.
+
+    Returns:
+        sqlite3.Connection: The connection or None if the cache is disabled.
+    """
+    global __connection
+    global enabled
+    if __connection is not None or not enabled:
+        return __connection
+    try:
+        os.makedirs(os.path.dirname(cache_file()), exist_ok=True)
+        connection = sqlite3.connect(cache_file(), timeout=30, check_same_thread=False)
+        connection.execute("CREATE TABLE IF NOT EXISTS responses ("
+                           "kind TEXT NOT NULL, "
+                           "query TEXT NOT NULL, "
+                           "payload TEXT NOT NULL, "
+                           "fetched REAL NOT NULL, "
+                           "last_used REAL NOT NULL, "
+                           "PRIMARY KEY (kind, query))")
+        connection.commit()
+    except sqlite3.Error as e:
+        warn = f"WARNING: Could not open the taxonomy cache at {cache_file()} ({e}). Continuing without it."
+        loggingC.message(warn, threshold=0)
+        enabled = False
+        return None
+    __connection = connection
+    return __connection
+
+
+def __ttl_seconds() -> float:
+    return staticConfig.taxonomy_cache_ttl_days * 24 * 3600
+
+
+def get(kind: str,
+        query: str):
+    """
+    Look up an answer of the ENA taxonomy API. Entries older than
+    staticConfig.taxonomy_cache_ttl_days are ignored.
+
+    Args:
+        kind (str): SUGGESTION or SCIENTIFIC_NAME.
+        query (str): The query string that was sent to ENA.
+
+    Returns:
+        The decoded JSON answer or None if there is no valid entry.
+    """
+    with __lock:
+        connection = __connect()
+        if connection is None:
+            return None
+        now = time.time()
+        try:
+            row = connection.execute("SELECT payload FROM responses "
+                                     "WHERE kind = ? AND query = ? AND fetched > ?",
+                                     (kind, query, now - __ttl_seconds())).fetchone()
+            if row is None:
+                return None
+            connection.execute("UPDATE responses SET last_used = ? WHERE kind = ? AND query = ?",
+                               (now, kind, query))
+            connection.commit()
+        except sqlite3.Error:
+            return None
+    return json.loads(row[0])
+
+
+def put(kind: str,
+        query: str,
+        payload):
+    """
+    Store an answer of the ENA taxonomy API. If the cache holds more than
+    staticConfig.taxonomy_cache_max_entries entries, expired and then least
+    recently used entries are removed.
+
+    Args:
+        kind (str): SUGGESTION or SCIENTIFIC_NAME.
+        query (str): The query string that was sent to ENA.
+        payload: The decoded JSON answer.
+    """
+    with __lock:
+        connection = __connect()
+        if connection is None:
+            return
+        now = time.time()
+        try:
+            connection.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                               (kind, query, json.dumps(payload), now, now))
+            connection.execute("DELETE FROM responses WHERE fetched <= ?",
+                               (now - __ttl_seconds(),))
+            connection.execute("DELETE FROM responses WHERE rowid IN ("
+                               "SELECT rowid FROM responses ORDER BY last_used DESC "
+                               "LIMIT -1 OFFSET ?)",
+                               (staticConfig.taxonomy_cache_max_entries,))
+            connection.commit()
+        except sqlite3.Error as e:
+            loggingC.message(f"WARNING: Could not write to the taxonomy cache ({e}).", threshold=1)
+
+
+def info() -> dict:
+    """
+    Describe the content of the cache.
+
+    Returns:
+        dict: The path and size of the cache file and the number of valid and
+            expired entries of each kind.
+    """
+    result = {'path': cache_file(), 'size': 0, 'entries': {}}
+    with __lock:
+        connection = __connect()
+        if connection is None:
+            return result
+        cutoff = time.time() - __ttl_seconds()
+        rows = connection.execute("SELECT kind, SUM(fetched > ?), SUM(fetched <= ?) "
+                                  "FROM responses GROUP BY kind",
+                                  (cutoff, cutoff)).fetchall()
+    for kind, valid, expired in rows:
+        result['entries'][kind] = {'valid': valid, 'expired': expired}
+    result['size'] = os.path.getsize(cache_file())
+    return result
+
+
+def clear() -> int:
+    """
+    Remove all entries from the cache.
+
+    Returns:
+        int: The number of removed entries.
+    """
+    with __lock:
+        connection = __connect()
+        if connection is None:
+            return 0
+        removed = connection.execute("DELETE FROM responses").rowcount
+        connection.commit()
+        connection.execute("VACUUM")
+    return removed
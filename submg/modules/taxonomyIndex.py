@@ -0,0 +1,176 @@
+import io
+import os
+import sys
+import mmap
+import array
+import struct
+import tarfile
+
+from submg.modules import loggingC
+from submg.modules.webinWrapper import get_persistent_storage_path
+
+
+# The index file starts with this magic string and the number of names. It is
+# followed by an array of uint32 offsets (one more than there are names) and
+# the names. Each name is stored as '<scientific name>\t<taxid>' and names
+# are sorted case-insensitively, so they can be binary searched in place.
+INDEX_MAGIC = b'SUBMGTX1'
+HEADER_FORMAT = '=8sI4x'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+# Ranks whose names can be used for submissions
+SUBMITTABLE_RANKS = ('species',)
+
+# Global variables for the opened index
+__index = None
+
+
+def index_file() -> str:
+    """
+    Returns the path of the local taxonomy index.
+    """
+    return os.path.join(get_persistent_storage_path(), 'taxdb', 'ncbi_taxonomy.idx')
+
+
+def __open_taxdump_member(taxdump: str,
+                          name: str):
+    """
+    Open names.dmp or nodes.dmp of an NCBI taxdump, which is either a
+    directory or the taxdump.tar.gz archive.
+
+    Args:
+        taxdump (str): The directory or archive.
+        name (str): The file name inside the taxdump.
+
+    Returns:
+        A text stream of the file.
+    """
+    if os.path.isdir(taxdump):
+        path = os.path.join(taxdump, name)
+        if not os.path.isfile(path):
+            print(f"\nERROR: {path} does not exist.")
+            sys.exit(1)
+        return open(path, 'r', encoding='utf-8')
+    archive = tarfile.open(taxdump, 'r:*')
+    try:
+        member = archive.extractfile(name)
+    except KeyError:
+        print(f"\nERROR: {taxdump} does not contain {name}.")
+        sys.exit(1)
+    return io.TextIOWrapper(member, encoding='utf-8')
+
+
+def __submittable_taxids(taxdump: str) -> set:
+    """
+    Read nodes.dmp and collect the taxids that have a submittable rank.
+    """
+    taxids = set()
+    with __open_taxdump_member(taxdump, 'nodes.dmp') as f:
+        for line in f:
+            fields = line.split('\t|\t', 3)
+            if fields[2] in SUBMITTABLE_RANKS:
+                taxids.add(int(fields[0]))
+    return taxids
+
+
+def build_index(taxdump: str) -> int:
+    """
+    Build the local taxonomy index from the scientific names of all
+    submittable taxa in an NCBI taxdump. The index is written to a temporary
+    file first, so an existing index stays usable until the new one is
+    complete.
+
+    Args:
+        taxdump (str): A directory with names.dmp and nodes.dmp or the
+            taxdump.tar.gz archive.
+
+    Returns:
+        int: The number of names in the index.
+    """
+    taxids = __submittable_taxids(taxdump)
+    records = []
+    with __open_taxdump_member(taxdump, 'names.dmp') as f:
+        for line in f:
+            fields = line.split('\t|\t', 4)
+            if not fields[3].startswith('scientific name'):
+                continue
+            taxid = int(fields[0])
+            if taxid in taxids:
+                records.append(f"{fields[1]}\t{taxid}".encode('utf-8'))
+    records.sort(key=lambda record: (record.lower(), record))
+
+    offsets = array.array('I', [0])
+    for record in records:
+        offsets.append(offsets[-1] + len(record))
+
+    path = index_file()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(struct.pack(HEADER_FORMAT, INDEX_MAGIC, len(records)))
+        offsets.tofile(f)
+        for record in records:
+            f.write(record)
+    os.replace(tmp_path, path)
+    return len(records)
+
+
+def available() -> bool:
+    """
+    Returns True if a local taxonomy index was built.
+    """
+    return __index is not None or os.path.isfile(index_file())
+
+
+def __load():
+    """
+    Memory-map the index on first use. Only the pages that a lookup touches
+    are read from disk.
+
+    Returns:
+        tuple: The mapped file, the offsets and the number of names.
+    """
+    global __index
+    if __index is None:
+        with open(index_file(), 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count = struct.unpack_from(HEADER_FORMAT, mapped)
+        if magic != INDEX_MAGIC:
+            err = f"\nERROR: {index_file()} is not a taxonomy index of this version of subMG. Please run submg-cli build-taxdb again."
+            loggingC.message(err, threshold=-1)
+            sys.exit(1)
+        offsets = memoryview(mapped)[HEADER_SIZE:HEADER_SIZE + 4 * (count + 1)].cast('I')
+        __index = (mapped, offsets, count, HEADER_SIZE + 4 * (count + 1))
+    return __index
+
+
+def lookup(name: str) -> list:
+    """
+    Find a scientific name in the index, ignoring case.
+
+    Args:
+        name (str): The scientific name.
+
+    Returns:
+        list: Tuples of (scientific name, taxid) of all matching taxa.
+    """
+    mapped, offsets, count, data_start = __load()
+
+    def record(i):
+        return mapped[data_start + offsets[i]:data_start + offsets[i + 1]]
+
+    key = name.encode('utf-8').lower()
+    lo, hi = 0, count
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if record(mid).rsplit(b'\t', 1)[0].lower() < key:
+            lo = mid + 1
+        else:
+            hi = mid
+    matches = []
+    while lo < count:
+        scientific_name, taxid = record(lo).rsplit(b'\t', 1)
+        if scientific_name.lower() != key:
+            break
+        matches.append((scientific_name.decode('utf-8'), taxid.decode('ascii')))
+        lo += 1
+    return matches
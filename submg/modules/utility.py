@@ -1,20 +1,16 @@
 import os
-import csv
 import yaml
 import sys
-try:
-    import pysam
-    HAS_PYSAM = True
-except ImportError:
-    HAS_PYSAM = False
 import time
-import requests
 import hashlib
 import xml.etree.ElementTree as ET
 import concurrent.futures
-from yaspin import yaspin
 
-from submg.modules import loggingC
+# pysam and yaspin take a while to import and are only needed to work on
+# .bam files, so they are imported on first use
+pysam = None
+
+from submg.modules import loggingC, runJournal, performanceReport
 from submg.modules.statConf import staticConfig
 
 
@@ -48,11 +44,16 @@ def full_timestamp():
     return timestamp
 
 
-def set_up_timestamps(arguments: dict):
+def set_up_timestamps(arguments: dict,
+                      stamp: str = None):
     """
     Set up the timestamp for the submission. Data is only timestamped with
     the hour, minute and second. Because of daily resets, this is sufficient to
     prevent name clashes on the development server.
+
+    Args:
+        arguments: The arguments of the submission.
+        stamp: The timestamp of an earlier run that is resumed.
     """
     global timestamp
     global keys_to_stamp
@@ -64,23 +65,31 @@ def set_up_timestamps(arguments: dict):
     ]
     if arguments['submit_assembly']:
         keys_to_stamp.append("ASSEMBLY_NAME")
-    timestamp = time.strftime("%H%M%S")
+    timestamp = stamp if stamp else time.strftime("%H%M%S")
 
 
 def set_up_staging(staging_dir: str,
-                   timestamp: str):
+                   timestamp: str,
+                   resume: bool = False):
     """
-    Set up the staging subdirectory for the submission. Make sure it is empty.
+    Set up the staging subdirectory for the submission. Make sure it is empty,
+    unless an earlier run is resumed.
 
     Args:
         staging_dir: The path to the parent staging directory.
         timestamp: The timestamp for the submission.
+        resume: Whether the staging subdirectory of an earlier run is reused.
     """
     if not os.path.exists(staging_dir):
         os.makedirs(staging_dir)
 
     stamped_staging_dir = os.path.join(staging_dir, timestamp)
 
+    if resume:
+        if not os.path.isdir(stamped_staging_dir):
+            os.makedirs(stamped_staging_dir)
+        return stamped_staging_dir
+
     if os.path.exists(stamped_staging_dir):
         err = f"\nERROR: Staging directory already exists: {stamped_staging_dir}"
         loggingC.message(err, threshold=-1)
@@ -95,9 +104,29 @@ def set_up_staging(staging_dir: str,
 
     return stamped_staging_dir
 
+
+def __import_pysam() -> bool:
+    """
+    Import pysam on first use.
+
+    Returns:
+        bool: False if pysam is not installed.
+    """
+    global pysam
+    if pysam is None:
+        try:
+            import pysam as module
+        except ImportError:
+            return False
+        pysam = module
+    return True
+
+
+@performanceReport.timed('depth construction')
 def construct_depth_files(staging_dir: str,
                           threads: int,
-                          bam_files: list) -> dict:
+                          bam_files: list,
+                          sorted_dir: str = None) -> dict:
     """
     Construct depth files from bam files.
 
@@ -105,33 +134,31 @@ def construct_depth_files(staging_dir: str,
         staging_dir: The staging directory.
         threads: The total number of threads to use.
         bam_files: The list of bam files.
+        sorted_dir: Directory for sorted copies of unsorted bam files.
     """
     loggingC.message(">Constructing depth files from bam files. This might take a while.", threshold=0)
     
     depth_directory = os.path.join(staging_dir, 'depth')
     os.makedirs(depth_directory, exist_ok=True)
-    
-    threads_per_file = max(1, threads // len(bam_files))
-    max_workers = min(threads, len(bam_files))
 
-    with yaspin(text=f"Processing {len(bam_files)} bam files with {threads_per_file} threads each...\t", color="yellow") as spinner:
+    sorted_bam_files = prepare_bam_files(bam_files, threads, sorted_dir=sorted_dir)
+    performanceReport.count('bam_files', len(bam_files))
+
+    def depth_job(bam_file, num_threads):
+        try:
+            return make_depth_file(bam_file, depth_directory, num_threads=num_threads)
+        except Exception as exc:
+            loggingC.message(f"{bam_file} generated an exception: {exc}", threshold=-1)
+            return None
 
-        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-                future_to_depth_file = {
-                    executor.submit(make_depth_file, bam_file, depth_directory, num_threads=threads_per_file): bam_file
-                    for bam_file in bam_files
-                }
-                depth_files = []
+    jobs = [(depth_job, (bam_file,), os.path.getsize(bam_file)) for bam_file in sorted_bam_files]
 
-                for future in concurrent.futures.as_completed(future_to_depth_file):
-                    bam_file = future_to_depth_file[future]
-                    try:
-                        depth_file = future.result()
-                        depth_files.append(depth_file)
-                    except Exception as exc:
-                        loggingC.message(f"{bam_file} generated an exception: {exc}", threshold=-1)
+    from yaspin import yaspin
+    with yaspin(text=f"Processing {len(bam_files)} bam files with {threads} threads...\t", color="yellow") as spinner:
+        depth_files, timings = __run_with_thread_budget(jobs, threads)
+    __log_timings(bam_files, timings, 'processed')
 
-    return depth_files
+    return [depth_file for depth_file in depth_files if depth_file is not None]
 
 
 def build_sample_submission_xml(outpath: str,
@@ -164,7 +191,7 @@ def build_sample_submission_xml(outpath: str,
     loggingC.message(f"\t...written to {os.path.abspath(outpath)}", threshold=0)
 
 
-def api_response_check(response: requests.Response):
+def api_response_check(response):
     if response.status_code == 403:
         err = """\nERROR: Submission failed. ENA API returned status code 403.
                     This indicates incorrect ENA login credentials. Please test your credentials
@@ -197,7 +224,7 @@ def api_response_check(response: requests.Response):
 def calculate_md5(fname):
     hash_md5 = hashlib.md5()
     with open(fname, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
             hash_md5.update(chunk)
     return hash_md5.hexdigest()
 
@@ -308,7 +335,7 @@ def prepdir(parent_path, name):
         loggingC.message(err, threshold=-1)
         sys.exit(1)
     newdir = os.path.join(parent_path, name)
-    os.makedirs(newdir, exist_ok=False)
+    os.makedirs(newdir, exist_ok=runJournal.resuming)
     return newdir
 
 
@@ -567,166 +594,283 @@ def quality_filter_bins(quality_data, config):
     return filtered_bins
 
 
-def check_bam(bam_file,
-              num_threads=4) -> str:
+def __index_is_current(bam_file: str) -> bool:
     """
-    Checks if the BAM file exists, has a valid extension and whether it is
-    sorted or not. If not, it will be sorted and indexed.
+    Check if a BAM file has an index that is at least as new as the file.
 
     Args:
         bam_file (str): The path to the BAM file.
-        num_threads (int): The number of threads to use for sorting and indexing. 
 
     Returns:
-        str: The path to the sorted and indexed BAM file.
+        bool: True if the index can be used as it is.
+    """
+    bam_mtime = os.path.getmtime(bam_file)
+    stem = os.path.splitext(bam_file)[0]
+    for index_file in (bam_file + '.bai', stem + '.bai', bam_file + '.csi'):
+        if os.path.isfile(index_file) and os.path.getmtime(index_file) >= bam_mtime:
+            return True
+    return False
+
+
+def __bam_sort_order(bam_file: str) -> str:
+    """
+    Read the sort order (the SO tag of the @HD line) from the header of a BAM
+    file.
+
+    Args:
+        bam_file (str): The path to the BAM file.
+
+    Returns:
+        str: The sort order, e.g. 'coordinate', or None if it is not stated.
+    """
+    with pysam.AlignmentFile(bam_file, 'rb', check_sq=False) as bam:
+        return bam.header.to_dict().get('HD', {}).get('SO')
+
+
+def __sorted_copy_path(bam_file: str,
+                       sorted_dir: str) -> str:
+    """
+    Returns where the sorted copy of an unsorted BAM file is kept.
+
+    Args:
+        bam_file (str): The path to the BAM file.
+        sorted_dir (str): Directory for sorted copies. If None, the copy is
+            placed next to the BAM file.
+
+    Returns:
+        str: The path of the sorted copy.
     """
-    if not HAS_PYSAM:
+    stem, file_ending = os.path.splitext(os.path.basename(bam_file))
+    if sorted_dir is None:
+        return os.path.join(os.path.dirname(bam_file), stem + '.tmp.sorted' + file_ending)
+    # Different BAM files can have the same name
+    path_hash = hashlib.md5(os.path.abspath(bam_file).encode()).hexdigest()[:8]
+    return os.path.join(sorted_dir, f"{stem}.{path_hash}.sorted{file_ending}")
+
+
+def __validate_bam(bam_file: str):
+    """
+    Exit if pysam is missing or if the file does not have a .bam or .BAM
+    extension.
+
+    Args:
+        bam_file (str): The path to the BAM file.
+    """
+    if not __import_pysam():
         err = "\nERROR: pysam is not installed, but needed for coverage calculations. You CANNOT use pysam on a windows system."
         loggingC.message(err, threshold=-1)
         sys.exit(1)
 
     # Check if the ending of the file is .bam or .BAM
-    if bam_file.endswith('.BAM'):
-        file_ending = '.BAM'
-    elif bam_file.endswith('.bam'):
-        file_ending = '.bam'
-    else:
+    if not (bam_file.endswith('.BAM') or bam_file.endswith('.bam')):
         ext = bam_file.split('.')[-1]
         err = f"\nERROR: The file {bam_file} has the unexpected extension {ext} (expected .bam or .BAM)."
         loggingC.message(err, threshold=-1)
         sys.exit(1)
 
-    # Check if BAM file is sorted, sort it if not. This will also index the file.
-    sorted_bam_file = bam_file
-    try:
-        pysam.index(sorted_bam_file)
-    except:  # This might mean the bam file is not sorted, so we try that
-        time.sleep(1)
-        warn = f"WARNING: Cannot read {bam_file}. The file might be unsorted, trying to sort..."
-        loggingC.message(warn, threshold=0)
-        sorted_bam_file = bam_file[:len(bam_file) - len(file_ending)] + '.tmp.sorted' + file_ending
-        pysam.sort("-o", sorted_bam_file, bam_file, "-@", str(num_threads))      
-        time.sleep(1)
-        pysam.index(sorted_bam_file)
-        time.sleep(1)
 
-    return sorted_bam_file  
+def __bam_preparation(bam_file: str,
+                      sorted_dir: str = None) -> tuple:
+    """
+    Find out what check_bam has to do before a BAM file can be used.
 
+    Args:
+        bam_file (str): The path to the BAM file.
+        sorted_dir (str): Directory for sorted copies of unsorted BAM files.
 
-def make_depth_file(bam_file, outdir, num_threads=4):
+    Returns:
+        str: 'ready' if nothing needs to be done, 'index' if an index has to
+            be created or 'sort' if the file has to be sorted.
+        str: The path of the BAM file that is or will be ready for use.
+    """
+    sort_order = __bam_sort_order(bam_file)
+    if sort_order == 'coordinate' or sort_order is None:
+        if __index_is_current(bam_file):
+            return 'ready', bam_file
+    sorted_bam_file = __sorted_copy_path(bam_file, sorted_dir)
+    if os.path.isfile(sorted_bam_file) \
+            and os.path.getmtime(sorted_bam_file) >= os.path.getmtime(bam_file) \
+            and __index_is_current(sorted_bam_file):
+        return 'ready', sorted_bam_file
+    # Files without a sort order in the header might still be sorted, so
+    # indexing is tried first.
+    if sort_order == 'coordinate' or sort_order is None:
+        return 'index', bam_file
+    return 'sort', sorted_bam_file
+
+
+def check_bam(bam_file,
+              num_threads=4,
+              sorted_dir=None) -> str:
     """
-    Uses pysam.depth to call samtools depth and create a depth file with
-    the coverage per base per contig.
+    Checks if the BAM file exists, has a valid extension and whether it is
+    sorted or not. Sorted BAM files are indexed unless their index is up to
+    date. Unsorted BAM files are sorted into sorted_dir and indexed, a sorted
+    copy from an earlier run is reused.
 
     Args:
-        outdir (str): Path to the output directory.
-        bam_file (str): Path to the BAM file.
+        bam_file (str): The path to the BAM file.
+        num_threads (int): The number of threads to use for sorting and indexing. 
+        sorted_dir (str): Directory for sorted copies of unsorted BAM files.
+            If None, they are placed next to the BAM file.
 
     Returns:
-        str: Path to the depth file.
+        str: The path to the sorted and indexed BAM file.
     """
-    if not HAS_PYSAM:
-        err = "\nERROR: pysam is not installed, but needed for coverage calculations. You CANNOT use pysam on a windows system."
-        loggingC.message(err, threshold=-1)
-        sys.exit(1)
-    sorted_bam_file = check_bam(bam_file, num_threads=num_threads)
-    filename = os.path.basename(sorted_bam_file) + '.depth'
-    outfile = os.path.join(outdir, filename)
-    pysam.depth("-@", str(num_threads), "-a", sorted_bam_file, "-o", outfile)
-    return outfile
+    __validate_bam(bam_file)
+
+    work, ready_bam_file = __bam_preparation(bam_file, sorted_dir)
+    if work == 'ready':
+        return ready_bam_file
+
+    if work == 'index':
+        try:
+            pysam.index("-@", str(num_threads), bam_file)
+            return bam_file
+        except pysam.SamtoolsError:
+            # Not sorted after all, or the directory is not writable
+            warn = f"WARNING: Cannot index {bam_file}. The file might be unsorted, trying to sort..."
+            loggingC.message(warn, threshold=0)
+    else:
+        warn = f"WARNING: {bam_file} is not sorted by coordinate, sorting..."
+        loggingC.message(warn, threshold=0)
+
+    # Sort into a temporary file first, so an interrupted run never leaves a
+    # truncated copy that looks reusable.
+    sorted_bam_file = __sorted_copy_path(bam_file, sorted_dir)
+    os.makedirs(os.path.dirname(os.path.abspath(sorted_bam_file)), exist_ok=True)
+    stem, file_ending = os.path.splitext(sorted_bam_file)
+    tmp_bam_file = stem + '.partial' + file_ending
+    pysam.sort("-@", str(num_threads), "-o", tmp_bam_file, bam_file)
+    os.replace(tmp_bam_file, sorted_bam_file)
+    pysam.index("-@", str(num_threads), sorted_bam_file)
+
+    return sorted_bam_file
 
 
-def contigs_coverage(depth_file):
+def __run_with_thread_budget(jobs: list,
+                             threads: int) -> tuple:
     """
-    Calculates the coverage per contig from a depth file.
+    Run jobs in parallel without using more than a total of threads threads.
+    Each job is a tuple of (function, arguments, size). The largest jobs are
+    started first. Whenever threads are free, the next job is started with a
+    share of the free threads that matches its size relative to the jobs
+    that are still waiting. So threads of finished jobs go to the jobs
+    started after them instead of staying idle. The function is called with
+    the arguments and num_threads.
 
     Args:
-    depth_file (str): File path to the depth file.
+        jobs (list): The jobs to run.
+        threads (int): The total number of threads.
 
     Returns:
-    dict: Contig name as key, coverage as value.
-    dict: Contig name as key, length as value.
-    """
-    contig_coverage = {}
-    contig_length = {}
-    reader = csv.reader(depth_file, delimiter='\t')
-    for row in reader:
-        contig = row[0].strip().split(' ')[0]
-        position = int(row[1].strip())
-        coverage = int(row[2].strip())
-        if not contig in contig_coverage:
-            contig_coverage[contig] = 0
-            contig_length[contig] = 0
-        contig_coverage[contig] += coverage
-        if position > contig_length[contig]: # Contig positions should be ordered, so we just need the last one. But we do this just to be safe
-            contig_length[contig] = position
-    return contig_coverage, contig_length
-
-
-def calculate_coverage(depth_files: list,
-                       target_contigs: set = None,
-                       threads=4,
-                       outfile=None,
-                       silent=False):
-    """
-    Calculate the average coverage of an assembly based on multiple depth files using parallel processing.
+        list: The results of the jobs, in the order of the jobs.
+        list: Tuples of (seconds, threads) for each job, in the order of the
+            jobs.
+    """
+    def timed(function, args, num_threads):
+        start = time.perf_counter()
+        result = function(*args, num_threads=num_threads)
+        return result, time.perf_counter() - start
+
+    threads = max(1, threads)
+    results = [None] * len(jobs)
+    timings = [None] * len(jobs)
+    waiting = sorted(range(len(jobs)), key=lambda i: jobs[i][2], reverse=True)
+    free = threads
+    running = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
+        while waiting or running:
+            while waiting and free > 0:
+                waiting_size = sum(max(1, jobs[i][2]) for i in waiting)
+                i = waiting.pop(0)
+                function, args, size = jobs[i]
+                granted = max(1, min(free, round(free * max(1, size) / waiting_size)))
+                free -= granted
+                running[executor.submit(timed, function, args, granted)] = (i, granted)
+            done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                i, granted = running.pop(future)
+                free += granted
+                results[i], seconds = future.result()
+                timings[i] = (seconds, granted)
+    return results, timings
+
+
+def __log_timings(bam_files: list,
+                  timings: list,
+                  task: str):
+    """
+    Log how long a task took for each BAM file.
 
     Args:
-    depth_files (list of str): List of file paths to depth files.
-    target_contigs (set of str): Set of contigs to calculate coverage for.
-
-    Returns:
-    float: Average depth of coverage of the assembly.
+        bam_files (list): The BAM files.
+        timings (list): Tuples of (seconds, threads) for each BAM file.
+        task (str): What was done, e.g. 'prepared'.
     """
-    total_coverage = 0.0
-    total_length = 0.0
+    for bam_file, (seconds, granted) in zip(bam_files, timings):
+        msg = f"\t...{task} {os.path.basename(bam_file)} in {seconds:.1f}s with {granted} threads"
+        loggingC.message(msg, threshold=1)
 
-    def process_file(depth_file):
-        """
-        Process a single depth file and calculate coverage and length.
-        """
-        with open(depth_file, 'r') as depth:
-            local_coverage = 0
-            local_length = 0
-            contig_coverage, contig_length = contigs_coverage(depth)
-            for contig in contig_coverage:
-                if target_contigs is not None:
-                    if not contig in target_contigs:
-                        continue
-                local_coverage += contig_coverage[contig]
-                local_length += contig_length[contig]
-            return local_coverage, local_length
-
-    if silent:
-        threshold = 3
-    else:
-        threshold = 0
-    loggingC.message(">Calculating coverage from depth files. This might take a while.", threshold)
-    msg = f">The coverage value will be written to {outfile} in case you " \
-            " want to provide a KNOWN_COVERAGE in the ASSEMBLY section " \
-            " in the config for subsequent submission attempts."
-    if outfile:
-        loggingC.message(msg, threshold=0)
 
-    inuse = min(threads, len(depth_files))
-    with yaspin(text=f"Processing with {inuse} threads...\t", color="yellow") as spinner:
-        with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
-            results = executor.map(process_file, depth_files)
+@performanceReport.timed('BAM sorting and indexing')
+def prepare_bam_files(bam_files: list,
+                      threads: int,
+                      sorted_dir: str = None) -> list:
+    """
+    Make sure all BAM files are sorted and indexed. BAM files that are ready
+    are used as they are. Sorting and indexing of the other files share one
+    budget of threads.
+
+    Args:
+        bam_files (list): The list of bam files.
+        threads (int): The total number of threads to use.
+        sorted_dir (str): Directory for sorted copies of unsorted BAM files.
 
-        for coverage, length in results:
-            total_coverage += coverage
-            total_length += length
+    Returns:
+        list: The paths of the sorted and indexed BAM files.
+    """
+    for bam_file in bam_files:
+        __validate_bam(bam_file)
+    work = [__bam_preparation(bam_file, sorted_dir)[0] for bam_file in bam_files]
+    jobs = []
+    for bam_file, todo in zip(bam_files, work):
+        # Indexing hardly profits from more threads, sorting does
+        size = os.path.getsize(bam_file) if todo == 'sort' else 0
+        jobs.append((lambda bam_file, num_threads: check_bam(bam_file, num_threads=num_threads, sorted_dir=sorted_dir),
+                     (bam_file,),
+                     size))
+
+    n_busy = len(bam_files) - work.count('ready')
+    performanceReport.count('prepared_bam_files', n_busy)
+    from yaspin import yaspin
+    with yaspin(text=f"Preparing {n_busy} of {len(bam_files)} bam files with {threads} threads...\t", color="yellow"):
+        sorted_bam_files, timings = __run_with_thread_budget(jobs, threads)
+    if n_busy > 0:
+        __log_timings(bam_files, timings, 'prepared')
+    return sorted_bam_files
 
-        average_coverage = total_coverage / total_length if total_length > 0 else 0
 
-    if not silent:
-        loggingC.message(f"\t...coverage is {str(average_coverage)}", threshold=0)
+def make_depth_file(bam_file, outdir, num_threads=4):
+    """
+    Uses pysam.depth to call samtools depth and create a depth file with
+    the coverage per base per contig.
 
-    if outfile:
-        with open(outfile, 'w') as f:
-            f.write(str(average_coverage))
+    Args:
+        bam_file (str): Path to the sorted and indexed BAM file.
+        outdir (str): Path to the output directory.
 
-    return average_coverage
+    Returns:
+        str: Path to the depth file.
+    """
+    if not __import_pysam():
+        err = "\nERROR: pysam is not installed, but needed for coverage calculations. You CANNOT use pysam on a windows system."
+        loggingC.message(err, threshold=-1)
+        sys.exit(1)
+    filename = os.path.basename(bam_file) + '.depth'
+    outfile = os.path.join(outdir, filename)
+    pysam.depth("-@", str(num_threads), "-a", bam_file, "-o", outfile)
+    return outfile
 
 
 def read_receipt(receipt_path: str) -> str:
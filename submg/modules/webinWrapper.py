@@ -4,8 +4,11 @@ import glob
 import signal
 import sys
 import re
+import hashlib
+import threading
+import concurrent.futures
 
-from submg.modules import loggingC
+from submg.modules import loggingC, runJournal, performanceReport
 from submg.modules.statConf import staticConfig
 
 import platform
@@ -82,6 +85,98 @@ def find_webin_cli_jar():
         sys.exit(1)
 
 
+# Each webin-cli call starts a new JVM which has to load and verify all
+# classes of the jar again. The first call of a run records the classes it
+# loads into a class data sharing archive, later calls map that archive
+# instead. The archive depends on the jar and on the Java runtime.
+__cds_lock = threading.Lock()
+__cds_state = {'archives': {}, 'creating': False}
+
+
+def __cds_archive_path(jar: str) -> str:
+    """
+    Get the path of the class data sharing archive for a webin-cli jar and
+    the installed Java runtime.
+
+    Args:
+        jar (str): The path to the webin-cli jar.
+
+    Returns:
+        str: The path of the archive. It might not exist yet.
+    """
+    with __cds_lock:
+        if jar in __cds_state['archives']:
+            return __cds_state['archives'][jar]
+    try:
+        java_version = subprocess.run(['java', '-version'],
+                                      stdout=subprocess.PIPE,
+                                      stderr=subprocess.STDOUT,
+                                      text=True).stdout
+    except OSError:
+        java_version = ''
+    key = hashlib.md5(f"{os.path.abspath(jar)}\n{java_version}".encode()).hexdigest()[:12]
+    archive = os.path.join(get_persistent_storage_path(),
+                           'jvm_cache',
+                           f"{os.path.basename(jar)}.{key}.jsa")
+    with __cds_lock:
+        __cds_state['archives'][jar] = archive
+    return archive
+
+
+def __java_command(jar: str) -> tuple:
+    """
+    Build the command that starts webin-cli. If there is a class data
+    sharing archive, the JVM uses it. Otherwise the first caller asks the JVM
+    to write one when it exits.
+
+    Args:
+        jar (str): The path to the webin-cli jar.
+
+    Returns:
+        tuple: The command as a list and the path of the archive that is
+            being written (None if no archive is written by this call).
+    """
+    if not staticConfig.webin_cli_class_sharing:
+        return ['java', '-jar', jar], None
+    archive = __cds_archive_path(jar)
+    if os.path.isfile(archive):
+        return ['java', f'-XX:SharedArchiveFile={archive}', '-jar', jar], None
+    with __cds_lock:
+        if __cds_state['creating']:
+            return ['java', '-jar', jar], None
+        __cds_state['creating'] = True
+    os.makedirs(os.path.dirname(archive), exist_ok=True)
+    tmp_archive = f"{archive}.{os.getpid()}.tmp"
+    return ['java', f'-XX:ArchiveClassesAtExit={tmp_archive}', '-jar', jar], tmp_archive
+
+
+def __finish_cds_archive(jar: str,
+                         tmp_archive: str,
+                         success: bool):
+    """
+    Move an archive written by the JVM into place, so that the following
+    webin-cli calls use it. Archives of failed calls are discarded.
+
+    Args:
+        jar (str): The path to the webin-cli jar.
+        tmp_archive (str): The archive as returned by __java_command.
+        success (bool): Whether webin-cli finished successfully.
+    """
+    if tmp_archive is None:
+        return
+    try:
+        if success and os.path.isfile(tmp_archive):
+            os.replace(tmp_archive, __cds_archive_path(jar))
+            loggingC.message(f"\t...wrote Webin-CLI class data sharing archive {__cds_archive_path(jar)}", threshold=2)
+        elif os.path.isfile(tmp_archive):
+            os.remove(tmp_archive)
+    except OSError:
+        pass
+    with __cds_lock:
+        __cds_state['creating'] = False
+
+
+@performanceReport.timed('webin-cli validate')
 def __webin_cli_validate(manifest,
                          inputdir,
                          outputdir,
@@ -89,11 +184,11 @@ def __webin_cli_validate(manifest,
                          password,
                          test,
                          context,
-                         jar):
-    cmd = [
-        'java',
-        '-jar',
-        jar,
+                         jar,
+                         log_prefix=''):
+    performanceReport.label(os.path.basename(os.path.normpath(inputdir)))
+    java_cmd, tmp_archive = __java_command(jar)
+    cmd = java_cmd + [
         '-validate',
         f'-username={username}',
         f'-password={password}',
@@ -112,23 +207,27 @@ def __webin_cli_validate(manifest,
 
         # Log the stdout if any
         if result.stdout:
-            loggingC.message(result.stdout.strip().replace('\n','; '), threshold=0)
+            loggingC.message(log_prefix + result.stdout.strip().replace('\n','; '), threshold=0)
 
         # Log the stderr if any
         if result.stderr:
-            loggingC.message(result.stderr.strip().replace('\n','; '), threshold=0)
+            loggingC.message(log_prefix + result.stderr.strip().replace('\n','; '), threshold=0)
 
     except subprocess.CalledProcessError as e:
         # Even if the subprocess fails, it may produce output or errors, so capture and log them
         if e.stdout:
-            loggingC.message(e.stdout.strip().replace('\n','; '), threshold=-1)
+            loggingC.message(log_prefix + e.stdout.strip().replace('\n','; '), threshold=-1)
         if e.stderr:
-            loggingC.message(e.stderr.strip().replace('\n','; '), threshold=-1)
+            loggingC.message(log_prefix + e.stderr.strip().replace('\n','; '), threshold=-1)
 
         # Finally, log the exception itself
-        loggingC.message(f"\nERROR: Validation failed with error: {e}", threshold=-1)
+        loggingC.message(f"\n{log_prefix}ERROR: Validation failed with error: {e}", threshold=-1)
+        __finish_cds_archive(jar, tmp_archive, False)
+    else:
+        __finish_cds_archive(jar, tmp_archive, True)
 
         
+@performanceReport.timed('webin-cli submit')
 def __webin_cli_submit(manifest,
                        inputdir,
                        outputdir,
@@ -136,11 +235,11 @@ def __webin_cli_submit(manifest,
                        password,
                        test,
                        context,
-                       jar):
-    cmd = [
-        'java',
-        '-jar',
-        jar,
+                       jar,
+                       log_prefix=''):
+    performanceReport.label(os.path.basename(os.path.normpath(inputdir)))
+    java_cmd, tmp_archive = __java_command(jar)
+    cmd = java_cmd + [
         '-submit',
         f'-username={username}',
         f'-password={password}',
@@ -152,10 +251,10 @@ def __webin_cli_submit(manifest,
 
     
     if test:
-        loggingC.message("\n           Submitting to development service through Webin-CLI", threshold=0)
+        loggingC.message(f"\n           {log_prefix}Submitting to development service through Webin-CLI", threshold=0)
         cmd.append('-test')
     else:
-        loggingC.message("\n           Submitting to PRODUCTION service through Webin-CLI", threshold=0)
+        loggingC.message(f"\n           {log_prefix}Submitting to PRODUCTION service through Webin-CLI", threshold=0)
     try:
         process = subprocess.Popen(cmd,
                                 stdout=subprocess.PIPE,
@@ -178,9 +277,10 @@ def __webin_cli_submit(manifest,
         if line.startswith('INFO : '):
             line = line[7:].strip()
         line = line.replace('\n',' ')
-        loggingC.message(f"Webin-CLI: {line}", threshold=0)
+        loggingC.message(f"{log_prefix}Webin-CLI: {line}", threshold=0)
 
     process.wait()
+    __finish_cds_archive(jar, tmp_archive, process.returncode == 0)
 
     return accession
 
@@ -193,7 +293,9 @@ def webin_cli(manifest,
               subdir_name,
               submit=False,
               test=True,
-              context='genome'):
+              context='genome',
+              log_prefix='',
+              journal_key=None):
     """
     Submit or validate data to/from the Webin submission system.
 
@@ -206,7 +308,13 @@ def webin_cli(manifest,
         submit (bool, optional): If True, the method will submit the data; if False, it will only validate (default is False).
         test (bool, optional): If True, use the Webin test submission service (default is True).
         context (str, optional): The context for the submission (e.g., 'genome', 'transcriptome', etc.) (default is 'genome').
+        log_prefix (str, optional): Put in front of every logged line, to tell concurrent submissions apart (default is '').
+        journal_key (str, optional): Name of the submission in the run journal. If it was submitted by an earlier run, it is not submitted again (default is None).
     """
+    if submit and journal_key is not None and runJournal.completed(journal_key):
+        receipt, accession = runJournal.result(journal_key)
+        loggingC.message(f">{log_prefix}Skipping {subdir_name}, it was submitted earlier as {accession}", threshold=0)
+        return receipt, accession
     jar = find_webin_cli_jar()
     if submit:
         loggingC.message(f">Using ENA Webin-CLI to submit {subdir_name}", threshold=2)
@@ -217,14 +325,17 @@ def webin_cli(manifest,
                                         password,
                                         test,
                                         context,
-                                        jar)
+                                        jar,
+                                        log_prefix=log_prefix)
         receipt = os.path.join(outputdir, context, subdir_name.replace(' ','_'), 'submit', 'receipt.xml')
         if accession is None:
-            err =  f"ERROR: The submission failed for {inputdir}."
+            err =  f"{log_prefix}ERROR: The submission failed for {inputdir}."
             err += f" If the submission failed during validation, please consult the output of Webin-CLI."
             err += f" Otherwise please check the receipt at {receipt}"
             loggingC.message(err, threshold=-1)
             sys.exit(1)
+        if journal_key is not None:
+            runJournal.record(journal_key, [os.path.abspath(receipt), accession])
     else:
         loggingC.message(f">Validating {subdir_name} for ENA submission using webin-cli", threshold=1)
         __webin_cli_validate(manifest,
@@ -234,7 +345,51 @@ def webin_cli(manifest,
                              password,
                              test,
                              context,
-                             jar)
+                             jar,
+                             log_prefix=log_prefix)
         receipt = None
 
     return receipt, accession
+
+
+def webin_cli_pool(submissions: dict,
+                   workers: int = 1) -> dict:
+    """
+    Run several webin-cli submissions or validations concurrently. Each one
+    needs its own outputdir. The log lines of each submission are prefixed
+    with its name. If one submission fails, submissions that did not start
+    yet are cancelled.
+
+    Args:
+        submissions (dict): Name of each submission as key, the keyword
+            arguments for webin_cli as value.
+        workers (int, optional): The maximum number of webin-cli processes
+            running at the same time (default is 1).
+
+    Returns:
+        dict: Name of each submission as key, (receipt, accession) as value,
+            in the order of submissions.
+    """
+    results = {}
+    if workers <= 1 or len(submissions) <= 1:
+        for name, kwargs in submissions.items():
+            results[name] = webin_cli(**kwargs)
+        return results
+
+    loggingC.message(f">Running up to {workers} Webin-CLI submissions at the same time.", threshold=1)
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = {
+            name: executor.submit(webin_cli, log_prefix=f"[{name}] ", **kwargs)
+            for name, kwargs in submissions.items()
+        }
+        for future in concurrent.futures.as_completed(futures.values()):
+            # Raises the SystemExit of a failed submission
+            future.result()
+    except BaseException:
+        executor.shutdown(wait=True, cancel_futures=True)
+        raise
+    executor.shutdown(wait=True)
+    for name, future in futures.items():
+        results[name] = future.result()
+    return results